@@ -0,0 +1,210 @@
+#
+# Benchmark of the kernels and of the full optimisations in the Turns_Optimisation_Python and
+# Current_Optimisation_Python folders. It runs headless on the CPU (no plots, dialogs or files of the optimisations).
+# The peak memory of the Python and NumPy allocations of every case is measured by tracemalloc in a first run, which
+# also warms up the imports and caches, then the case is timed (best of the repeats; cases longer than LONG seconds
+# are timed once) and both values are compared with the stored baselines.
+#
+# Cases (M is the number of the spiral coils, Q the number of the sampling points):
+#   turns/<kernel>/M=...            Bz, fun, jac, hess, hessp of FieldEngine for a new x, the generated dBz kernel
+#                                   (bz_dbz) and Bz_test of the full turns
+#   turns/solve/<method>/M=...      TurnsProfile without the integer refinement for the Methods 1-5
+#   current/<kernel>/M=...          CouplingKernel (Imcoeff and the Toeplitz matrix), fun, GJ and the Hessian product HP
+#   current/solve/<method>/M=...    CurrentProfile for the Methods 4-8
+#
+# Examples:
+#   python Benchmark.py                                  all cases, compared with baselines.json
+#   python Benchmark.py --sizes 11 51 --cases "*/fun/*"  selected sizes and cases (shell-style patterns)
+#   python Benchmark.py --update                         stores the measured values as the new baselines
+# The exit status is 1 if a case is slower than its baseline by more than the threshold.
+#
+
+import os
+os.environ.setdefault("MPLBACKEND", "Agg")  # headless
+
+import sys
+import json
+import time
+import fnmatch
+import platform
+import argparse
+import tracemalloc
+import numpy as np
+
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(FOLDER, os.pardir, 'Turns_Optimisation_Python'))
+sys.path.append(os.path.join(FOLDER, os.pardir, 'Current_Optimisation_Python'))
+sys.path.append(os.path.join(FOLDER, os.pardir, 'Shimming_Core_Python'))
+from Optimisation import FieldEngine, InductionSampling, TurnsProfile, kernels, pi, mu0
+from NewtonCG import CouplingKernel, CurrentProfile
+from SpiralCoil import spiral_geometry, adjusted_radius
+
+BASELINES_FILE = os.path.join(FOLDER, "baselines.json")
+LONG = 1.0  # s
+SIZES = (11, 51, 201, 501, 1001, 2001)
+TURNS_METHODS = {1: 'trust-exact', 2: 'trust-krylov', 3: 'trust-ncg', 4: 'Newton-CG', 5: 'trf'}
+CURRENT_METHODS = {4: 'Newton-CG', 5: 'trf', 6: 'QR', 7: 'Tikhonov', 8: 'BVLS'}
+
+# Design parameters of the benchmark (the parameters.txt files of the optimisation folders); the substrate width w
+# is chosen for the number of the spirals M over the length L
+TURNS = dict(tolerance=1.0e-8, L0=0.06, L=0.1, d0=0.0005, delta=1.0e-5, h=3.5e-5, R=0.016, a=1.0, rho=1.68e-8, I=0.2,
+             N=10)
+CURRENT = dict(tolerance=1.0e-8, L0=0.06, L=0.1, d0=0.0008, delta=0.0, h=3.5e-5, R=0.016, Rs=0.023, rho=1.68e-8,
+               Inoise=0.0, Imax=1.0, lam=1.0e-6, seed=0)
+
+
+def width(L, M):
+    return L / (M - 1)
+
+# Peak memory of the first run and the best time of the repeats
+def measure(function, repeat):
+    start = time.perf_counter()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if time.perf_counter() - start > LONG:
+        repeat = 1
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times), peak
+
+
+# Kernel and solver cases of the turns optimisation for M spirals: name -> function
+def turns_cases(M):
+    p = TURNS
+    w = width(p['L'], M)
+    M = int(p['L'] / w)
+    M = M + 1 if M % 2 == 0 else M + 2
+    zm = -((M - 1)/2) * w + w * np.arange(M)
+    zq, b0 = InductionSampling(p['L0'], w)
+    g = spiral_geometry(p['d0'], p['delta'], p['R'])
+    d, gamma, theta1 = g.d, g.gamma, g.theta1
+    engine = FieldEngine(zm, zq, b0, d, gamma, theta1, p['a'], p['I'])
+    x = np.full(M, p['N'] * 2.0 * pi)
+
+    # The engine caches the kernel matrices for the last x: it is reset to time a callback at a new point
+    def fresh(method):
+        def call():
+            engine.x = None
+            return method(x)
+        return call
+
+    cases = {f'turns/{name}/M={M}': fresh(method) for name, method in
+             (('Bz', engine.Bz), ('fun', engine.fun), ('jac', engine.jac), ('hess', engine.hess))}
+    cases[f'turns/hessp/M={M}'] = fresh(lambda x: engine.hessp(x, x))
+    cases[f'turns/dBz/M={M}'] = lambda: kernels.bz_dbz(x[:, np.newaxis], engine.zm, engine.zq, d, gamma, theta1,
+                                                       engine.gtd1, p['a'], pi, mu0, p['I'])
+    cases[f'turns/Bz_test/M={M}'] = lambda: engine.Bz_test(x)
+    for Method, name in TURNS_METHODS.items():
+        cases[f'turns/solve/{name}/M={M}'] = lambda Method=Method: TurnsProfile(
+            p['tolerance'], p['L0'], p['L'], p['d0'], p['delta'], p['h'], p['R'], p['a'], w, p['rho'], p['I'],
+            p['N'], Method, sampling=(zq, b0), refine=False)
+    return cases
+
+# Kernel and solver cases of the current optimisation for M spirals
+def current_cases(M):
+    p = CURRENT
+    w = width(p['L'], M)
+    M = int(p['L'] / w)
+    M = M + 1 if M % 2 == 0 else M + 2
+    zm = -((M - 1)/2) * w + w * np.arange(M)
+    zq, b0 = InductionSampling(p['L0'], w)
+    g = spiral_geometry(p['d0'], p['delta'], p['R'])
+    gamma, gtd1 = g.gamma, g.gtd1
+    gtd2 = g.gtd(g.angle(adjusted_radius(p['Rs'], g.d)))
+    _, kernel = CouplingKernel(zm, zq, w, gamma, gtd1, gtd2)
+    x = np.full(M, 0.1)
+
+    # Same operations as the closures fun, GJ and HP in CurrentProfile
+    def fun():
+        r = kernel.matvec(x) + b0
+        return r @ r
+
+    cases = {f'current/CouplingKernel/M={M}': lambda: CouplingKernel(zm, zq, w, gamma, gtd1, gtd2),
+             f'current/fun/M={M}': fun,
+             f'current/GJ/M={M}': lambda: 2.0 * kernel.rmatvec(kernel.matvec(x) + b0),
+             f'current/HP/M={M}': lambda: 2.0 * kernel.rmatvec(kernel.matvec(x))}
+    for Method, name in CURRENT_METHODS.items():
+        cases[f'current/solve/{name}/M={M}'] = lambda Method=Method: CurrentProfile(
+            p['tolerance'], p['L0'], p['L'], p['d0'], p['delta'], p['h'], p['R'], p['Rs'], w, p['rho'],
+            p['Inoise'], Method, p['Imax'], p['lam'], seed=p['seed'])
+    return cases
+
+
+# Runs the selected cases and returns name -> {time (s), memory (bytes)}
+def RunBenchmark(sizes=SIZES, patterns=('*',), repeat=5, progress=print):
+    results = {}
+    for M in sizes:
+        for cases in (turns_cases(M), current_cases(M)):
+            for name, function in cases.items():
+                if not any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+                    continue
+                seconds, memory = measure(function, repeat)
+                results[name] = dict(time=seconds, memory=memory)
+                progress(f'{name:40s} {seconds:12.6f} s {memory / 2**20:10.2f} MiB')
+    return results
+
+def machine():
+    return dict(platform=platform.platform(), processor=platform.processor(), cpus=os.cpu_count(),
+                python=platform.python_version(), numpy=np.__version__)
+
+def load_baselines(filename=BASELINES_FILE):
+    if not os.path.exists(filename):
+        return {}
+    with open(filename, "r") as file:
+        return json.load(file).get("cases", {})
+
+def save_baselines(results, filename=BASELINES_FILE):
+    cases = load_baselines(filename)
+    cases.update(results)
+    with open(filename, "w") as file:
+        json.dump(dict(machine=machine(), cases=dict(sorted(cases.items()))), file, indent=1)
+
+# Ratios of the measured values to the baselines; a case is slower or faster if its time ratio is beyond the
+# threshold (0.25 means 25 %). Returns the table lines and the names of the slower cases.
+def compare(results, baselines, threshold=0.25):
+    lines, slower = [], []
+    for name, value in results.items():
+        base = baselines.get(name)
+        if base is None:
+            lines.append(f'{name:40s} {"new":>8s}')
+            continue
+        ratio = value['time'] / base['time']
+        memory = value['memory'] / base['memory'] if base['memory'] else float('nan')
+        status = ''
+        if ratio > 1.0 + threshold:
+            status = 'SLOWER'
+            slower.append(name)
+        elif ratio < 1.0 / (1.0 + threshold):
+            status = 'faster'
+        lines.append(f'{name:40s} time x{ratio:7.3f} memory x{memory:7.3f} {status}')
+    return lines, slower
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the shimming coil optimisations")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="numbers of the spiral coils M")
+    parser.add_argument("--cases", nargs="+", default=["*"], help="patterns of the case names, e.g. 'turns/*'")
+    parser.add_argument("--repeat", type=int, default=5, help="repeats of the timings shorter than LONG")
+    parser.add_argument("--baselines", default=BASELINES_FILE, help="JSON file with the baselines")
+    parser.add_argument("--threshold", type=float, default=0.25, help="relative time change reported")
+    parser.add_argument("--output", help="JSON file for the measured values")
+    parser.add_argument("--update", action="store_true", help="store the measured values as the baselines")
+    args = parser.parse_args()
+
+    results = RunBenchmark(args.sizes, args.cases, args.repeat)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(dict(machine=machine(), cases=results), file, indent=1)
+    if args.update:
+        save_baselines(results, args.baselines)
+        print(f'{len(results)} baselines stored in {args.baselines}')
+        sys.exit(0)
+
+    lines, slower = compare(results, load_baselines(args.baselines), args.threshold)
+    print('\n'.join(lines))
+    sys.exit(1 if slower else 0)
@@ -0,0 +1,141 @@
+#
+# Monte Carlo estimate of the field error caused by the driver current uncertainty.
+# The field is linear in the currents, so the error profile of the currents I + dI is error + A dI, where A is the
+# coupling matrix of Eq. (21). K realisations of dI are drawn at once and their error profiles are calculated by one
+# matrix product (or one batched FFT product, see Toeplitz.py) for each chunk of realisations.
+#
+# Distributions of dI:
+#   'uniform'    - uniform in [-Inoise, Inoise]
+#   'gaussian'   - normal with the standard deviation Inoise
+#   'calibrated' - normal with a measured offset and standard deviation of each channel: Inoise is an M x 2 array
+#                  or the name of a CSV file with the columns offset (A) and standard deviation (A)
+# Inoise can be a number or an array with a value for each of the M channels.
+#
+
+import os
+from dataclasses import dataclass
+import numpy as np
+from Toeplitz import ToeplitzKernel
+
+CHUNK_ELEMENTS = 2**22  # the realisations are processed in chunks of about this many array elements
+LEVELS = (0.5, 2.5, 50.0, 97.5, 99.5)  # percentiles (%) of the reported bands
+
+# Results of the Monte Carlo estimate returned by CurrentUncertainty
+@dataclass
+class UncertaintyResult:
+    zm: np.ndarray  # coordinates of the spirals (m)
+    zq: np.ndarray  # induction sampling points (m)
+    error: np.ndarray  # residuals Bz + B0 of the optimised currents (T)
+    samples: int  # number of realisations K
+    distribution: str  # distribution of the current uncertainty
+    levels: tuple  # percentiles (%) of the bands
+    bands: np.ndarray  # percentiles of Bz + B0 at each sampling point, shape (len(levels), Q) (T)
+    max_error: np.ndarray  # maximum |Bz + B0| of each realisation (T)
+    max_error_percentiles: np.ndarray  # percentiles of max_error for the levels (T)
+    worst_case: float  # largest |Bz + B0| of all realisations (T)
+    worst_error: np.ndarray  # residuals Bz + B0 of the worst realisation (T)
+    worst_current: np.ndarray  # currents of the worst realisation (A)
+    bound: np.ndarray = None  # guaranteed bound |error| + |A| Inoise of the uniform uncertainty (T)
+
+
+# Offset and scale of the current uncertainty of each channel
+def noise_parameters(Inoise, distribution, M):
+    if distribution == 'calibrated':
+        calibration = np.loadtxt(Inoise, delimiter=",", ndmin=2) if isinstance(Inoise, str) else Inoise
+        calibration = np.asarray(calibration, dtype=float)
+        if calibration.shape != (M, 2):
+            raise ValueError(f"the calibration needs an offset and a standard deviation for each of the {M} channels")
+        return calibration[:, 0], calibration[:, 1]
+    if distribution not in ('uniform', 'gaussian'):
+        raise ValueError(f"unknown distribution '{distribution}', use 'uniform', 'gaussian' or 'calibrated'")
+    return np.zeros(M), np.broadcast_to(np.asarray(Inoise, dtype=float), (M,))
+
+
+# Error profiles of K realisations of the current uncertainty added to the optimised currents of result
+# (a CurrentResult). The K x Q error profiles are kept for the percentiles: 8 K Q bytes of memory.
+def CurrentUncertainty(result, Inoise, K=10000, distribution='uniform', seed=None, levels=LEVELS):
+    if K < 1:
+        raise ValueError(f"the number of realisations K = {K} must be at least 1")
+    kernel = result.kernel
+    M, Q = len(result.zm), len(result.zq)
+    offset, scale = noise_parameters(Inoise, distribution, M)
+    rng = np.random.default_rng(seed)
+
+    errors = np.empty((K, Q))
+    max_error = np.empty(K)
+    worst_case, worst_current = -1.0, None
+    chunk = max(1, CHUNK_ELEMENTS // max(M, Q))
+    for start in range(0, K, chunk):
+        n = min(chunk, K - start)
+        if distribution == 'uniform':
+            dI = scale * rng.uniform(-1.0, 1.0, size=(n, M))
+        else:
+            dI = offset + scale * rng.standard_normal(size=(n, M))
+        errors[start:start + n] = result.error + kernel.matvec(dI)
+        max_error[start:start + n] = np.max(np.abs(errors[start:start + n]), axis=1)
+        k = start + np.argmax(max_error[start:start + n])
+        if max_error[k] > worst_case:
+            worst, worst_case, worst_current = k, max_error[k], result.current + dI[k - start]
+
+    # Largest possible error of the bounded uncertainty |dI| <= Inoise at each point: |A| is also Toeplitz
+    bound = None
+    if distribution == 'uniform':
+        bound = np.abs(result.error) + ToeplitzKernel(np.abs(kernel.values), M, Q).matvec(scale)
+
+    return UncertaintyResult(zm=result.zm, zq=result.zq, error=result.error, samples=K, distribution=distribution,
+                             levels=tuple(levels), bands=np.percentile(errors, levels, axis=0), max_error=max_error,
+                             max_error_percentiles=np.percentile(max_error, levels), worst_case=float(worst_case),
+                             worst_error=errors[worst].copy(), worst_current=worst_current, bound=bound)
+
+
+# Optional sink: percentile bands of the error profile and the distribution of the maximum error
+def plot_uncertainty_result(uncertainty):
+    import matplotlib.pyplot as plt
+    u = uncertainty
+    outer, inner = (0, len(u.levels) - 1), (1, len(u.levels) - 2)
+    plt.fill_between(u.zq, u.bands[outer[0]], u.bands[outer[1]], color='lightgreen',
+                     label=f'{u.levels[outer[0]]}-{u.levels[outer[1]]} %')
+    if inner[0] < inner[1]:
+        plt.fill_between(u.zq, u.bands[inner[0]], u.bands[inner[1]], color='green', alpha=0.5,
+                         label=f'{u.levels[inner[0]]}-{u.levels[inner[1]]} %')
+    plt.plot(u.zq, u.error, color='blue', label='B0 + Bz')
+    plt.plot(u.zq, u.worst_error, color='red', linewidth=0.8, label='worst realisation')
+    plt.xlabel("z0, m")
+    plt.ylabel("Induction, T")
+    plt.title(f"Induction profile with the current uncertainty:\n {u.samples} {u.distribution} realisations")
+    plt.legend()
+    plt.tight_layout()
+    plt.grid(True)
+    plt.show()
+
+    plt.hist(u.max_error, bins=100, color='green')
+    plt.xlabel("max |B0 + Bz|, T")
+    plt.ylabel("Realisations")
+    plt.title("Maximum error with the current uncertainty")
+    plt.grid(True)
+    plt.tight_layout()
+    plt.show()
+
+# Optional sink: CSV bands and the text summary written to the folder
+def save_uncertainty_result(uncertainty, folder="."):
+    u = uncertainty
+    path = lambda filename: os.path.join(folder, filename)
+    os.makedirs(folder, exist_ok=True)
+
+    with open(path('current_uncertainty.txt'), 'w') as file:
+        file.write(f'realisations = {u.samples}\n')
+        file.write(f'distribution = {u.distribution}\n')
+        for level, value in zip(u.levels, u.max_error_percentiles):
+            file.write(f'{level} % percentile of the maximum error = {value} T\n')
+        file.write(f'worst-case maximum error = {u.worst_case} T\n')
+        if u.bound is not None:
+            file.write(f'guaranteed bound of the maximum error = {np.max(u.bound)} T\n')
+
+    columns = [u.zq, u.error] + list(u.bands)
+    names = ['z0', 'error'] + [f'p{level}' for level in u.levels]
+    if u.bound is not None:
+        columns.append(u.bound)
+        names.append('bound')
+    header = ','.join(names)
+    np.savetxt(path("uncertainty_bands.csv"), np.column_stack(columns), delimiter=",", header=header)
+    np.savetxt(path("worst_current_profile.csv"), np.column_stack((u.zm, u.worst_current)), delimiter=",")
@@ -1,35 +1,108 @@
 #
 # The Newton-CG optimization method is used to calculate the current profile when spiral coils are stacked together.
 #
-from tkinter import simpledialog
-import tkinter as tk
+import os
+import sys
+from dataclasses import dataclass, field
 import numpy as np
-from scipy.optimize import minimize
-import matplotlib.pyplot as plt
-from ResidualB import B0
+from scipy.linalg import cho_factor, cho_solve, lstsq
+from scipy.optimize import minimize, least_squares, lsq_linear, OptimizeResult
+from ResidualB import B0, sample
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Shimming_Core_Python'))
+from ResultCache import ResultCache, cache_key
+from Bundle import save_result, load_result, unique_name
+from SpiralCoil import (spiral_geometry, adjusted_radius, field_factor, SpiralField, SpiralLength, WireResistance,
+                        StripResistance, pi, mu0)
+from Toeplitz import ToeplitzKernel
+from MonteCarlo import CurrentUncertainty, plot_uncertainty_result, save_uncertainty_result
 
-pi = 3.1415926535897932384626433832795
-mu0 = 4.0 * pi * 1.0e-7  # vacuum magnetic permeability
+# Results of the current optimisation returned by CurrentProfile
+@dataclass
+class CurrentResult:
+    zm: np.ndarray  # coordinates of the spirals (m)
+    zq: np.ndarray  # induction sampling points (m)
+    b0: np.ndarray  # sampled residual induction (T)
+    current: np.ndarray  # optimised current of each spiral (A)
+    noise_current: np.ndarray  # currents with a random driver uncertainty (A)
+    error: np.ndarray  # residuals Bz + B0 (T)
+    noise_error: np.ndarray  # residuals Bz + B0 with the current uncertainty (T)
+    initial_current: float  # initial current used for the optimisation (A)
+    turns: int  # number of full turns in each spiral
+    sp_length: float  # each spiral length (m)
+    wire_resistance: float  # wire spiral resistance (Ohms)
+    strip_resistance: float  # strip spiral resistance (Ohms)
+    wire_current_power: float  # power dissipated in the whole wire stack (W)
+    strip_current_power: float  # power dissipated in the whole strip stack (W)
+    optimisation: str  # name of the optimisation method
+    nfev: int  # function evaluations
+    njev: int  # Jacobian evaluations
+    nit: int  # iterations (Jacobian evaluations for the least-squares method)
+    success: bool
+    message: str
+    start: str = 'initial'  # starting point: initial (I0), warm (closest cached solution) or cached (no solve)
+    parameters: dict = field(default_factory=dict)  # input and adjusted design parameters
+    kernel: ToeplitzKernel = field(default=None, repr=False)  # coupling matrix dBz^T used by CurrentUncertainty
+
+
+# Direct solvers of the linear least-squares problem |A I + B0|^2 -> min, where A = dBz^T is the Q x M matrix of the
+# coefficients in Eq. (21). They return the same result object as the iterative methods.
+
+# Minimum-norm solution by the complete orthogonal (QR) factorisation of A
+def SolveQR(A, b0):
+    x, _, rank, _ = lstsq(A, -b0, lapack_driver='gelsy')
+    return OptimizeResult(x=x, nfev=1, njev=1, nit=1, success=True, message=f'QR solution, rank {rank}')
+
+# Tikhonov regularisation |A I + B0|^2 + lam * |A|^2 / M * |I|^2 -> min solved by the Cholesky factorisation of the
+# normal equations; lam is relative to the mean squared column norm of A, so it does not depend on the units.
+def SolveTikhonov(A, b0, lam):
+    M = A.shape[1]
+    regularisation = lam * np.sum(A**2) / M
+    factor = cho_factor(A.T @ A + regularisation * np.eye(M))
+    x = cho_solve(factor, -A.T @ b0)
+    return OptimizeResult(x=x, nfev=1, njev=1, nit=1, success=True,
+                          message=f'Tikhonov solution, regularisation {regularisation}')
+
+# Currents bounded by the maximum driver current: |I| <= Imax (bounded-variable least squares)
+def SolveBounded(A, b0, Imax, tolerance):
+    scale = np.linalg.norm(b0) or 1.0  # the residuals in Tesla are normalised to make the tolerance relative
+    result = lsq_linear(A / scale, -b0 / scale, bounds=(-Imax, Imax), method='bvls', tol=tolerance)
+    return OptimizeResult(x=result.x, nfev=result.nit, njev=1, nit=result.nit, success=result.success,
+                          message=result.message)
+
+
+# The coefficients in Eq. (21) (SpiralField of the spirals, see SpiralCoil.py) depend only on zq[q] - zm[m], so only
+# the M + Q - 1 distinct values of the Toeplitz coupling matrix are calculated (see Toeplitz.py). Returns the values
+# without the constant factor and the Q x M matrix dBz^T.
+def CouplingKernel(zm, zq, w, gamma, gtd1, gtd2):
+    M, Q = len(zm), len(zq)
+    Imcoeff = SpiralField(zq[0] - zm[-1] + w * np.arange(M + Q - 1), gtd1, gtd2)
+    return Imcoeff, ToeplitzKernel(field_factor(gamma) * Imcoeff, M, Q)
+
+
+# Pure computation of the current profile: no plots, dialogs or files.
+# I0 is the initial current in A or a function returning it from the value suggested by Eq. (23);
+# the suggested value is used if I0 is None. seed initialises the random current uncertainty.
+# Imax is the maximum driver current for the bounded methods and lam the relative Tikhonov regularisation.
+# source is the residual field (a callable of z0 or a measured profile file, see ResidualField.py); B0 by default.
+# cache is a ResultCache or the name of its folder: a stored solution of the same problem is returned without solving
+# and the iterative methods start from the closest stored solution with the same number of spirals otherwise;
+# I0 is then not used.
+def CurrentProfile(tolerance, L0, L, d0, delta, h, R, Rs, w, rho, Inoise, Method=4, Imax=None, lam=1.0e-6, I0=None,
+                   seed=None, source=None, cache=None):
+    parameters = dict(tolerance=tolerance, L0=L0, L=L, d0=d0, delta=delta, h=h, R=R, Rs=Rs, w=w, rho=rho,
+                      Inoise=Inoise, Method=Method, Imax=Imax, lam=lam)
 
-def CurrentOptimisation(tolerance, L0, L, d0, delta, h, R, Rs, w, rho, Inoise):
     #Derived parameters and arrays:
-    d = d0 + 2.0 * delta
-    R = d * int(R / d) + d / 2.0  # adjusted internal radius
-    Rs = d * int(Rs / d) + d / 2.0  # adjusted external radius for the current optimization
-    gamma = d / (2.0 * pi)
-    theta1 = (2.0 * pi * R) / d - pi
-    theta2 = (2.0 * pi * Rs) / d - pi
-    gtd1 = 2.0 * gamma * theta1 + d
-    gtd2 = 2.0 * gamma * theta2 + d
+    geometry = spiral_geometry(d0, delta, R)  # adjusted internal radius and the spiral constants (SpiralCoil.py)
+    d, R, gamma, gtd1 = geometry.d, geometry.R, geometry.gamma, geometry.gtd1
+    Rs = adjusted_radius(Rs, d)  # adjusted external radius for the current optimization
+    gtd2 = geometry.gtd(geometry.angle(Rs))
     turns = int(Rs / d) - int(R / d)  # number of full turns in each spiral for the current optimization
 
     # Spiral length and resistance
-    val1 = (4.0 * gamma**2 + gtd1**2)**0.5
-    val2 = (4.0 * gamma**2 + gtd2**2)**0.5
-    sp_length = (gtd2/(8.0 * gamma)) * val2 - (gtd1/(8.0 * gamma)) * val1 + \
-            (gamma / 2) * np.log((gtd2 + val2) / (gtd1 + val1))
-    wire_resistance = rho * sp_length / ((pi / 4.0) * d0**2)
-    strip_resistance = rho * sp_length / (d0 * h)
+    sp_length = SpiralLength(gamma, gtd1, gtd2)
+    wire_resistance = WireResistance(sp_length, rho, d0)
+    strip_resistance = StripResistance(sp_length, rho, d0, h)
 
     M = int(L/w)  # number of the spiral coils; must be odd
     M = M + 1 if M % 2 == 0 else M + 2
@@ -38,171 +111,246 @@ def CurrentOptimisation(tolerance, L0, L, d0, delta, h, R, Rs, w, rho, Inoise):
 
     Q = int(L0/w)  # number of the induction sampling points; must be odd
     Q = Q + 1 if Q % 2 == 0 else Q + 2
-    zq = np.array(list(map(lambda q: -((Q - 1)/2) * w + w * q, range(Q))))  # induction sampling points for [-L0/2,L0/2]
-    b0 = np.array(list(map(lambda q: B0(zq[q]), range(Q))))  # sampling of the residual induction in Tesla
-    averb0 = sum(b0[q] for q in range(Q)) / Q
-
-    plt.plot(zq, b0)
-    plt.xlabel("z0, m")
-    plt.ylabel("B0, T")
-    plt.title("Residual induction")
-    plt.grid(True)
-    plt.tight_layout()
-    plt.show()
+    zq = -((Q - 1)/2) * w + w * np.arange(Q)  # induction sampling points for [-L0/2,L0/2]
+    b0 = sample(B0 if source is None else source, zq)  # sampling of the residual induction in Tesla (cached)
+    averb0 = np.mean(b0)
+    parameters.update(d=d, R_adjusted=R, Rs_adjusted=Rs, M=M, Q=Q)
+
+    Imcoeff, kernel = CouplingKernel(zm, zq, w, gamma, gtd1, gtd2)  # Q x M matrix dBz^T in Eq. (21)
 
-    # 2D array of coefficients in Eq. (21) in the report
-    Imcoeff = []
-    for m in range(M):
-        row = []
-        for q in range(Q):
-            sqrt_term = lambda gtd: (gtd ** 2 + 4.0 * (zq[q] - zm[m]) ** 2) ** 0.5
-            value1 = gtd1 + sqrt_term(gtd1)
-            value2 = gtd2 + sqrt_term(gtd2)
-            value = np.log(value2 / value1) + gtd1 / sqrt_term(gtd1) - gtd2 / sqrt_term(gtd2)
-            row.append(value)
-        Imcoeff.append(row)
-    Imcoeff = np.array(Imcoeff)
+    # Stored solution (rho, h and Inoise do not change it) or the closest one as the starting point (see ResultCache.py)
+    start = 'initial'
+    stored = nearest = None
+    if cache is not None:
+        cache = ResultCache(cache) if isinstance(cache, str) else cache
+        settings = {name: parameters[name] for name in ('tolerance', 'L0', 'L', 'd0', 'delta', 'R', 'Rs', 'w', 'Method',
+                                                        'Imax', 'lam')}
+        settings['I0'] = None if callable(I0) else I0
+        key = cache_key('current', settings, b0)
+        features = {name: float(parameters[name]) for name in ('L0', 'L', 'd0', 'delta', 'R', 'Rs', 'w')}
+        stored = cache.get(key)
+        if stored is None and Method in (4, 5):
+            nearest = cache.nearest('current', M, features)
 
     # Initial values for the current in Eq. (23) in the report
     q0 = int((Q - 1) / 2)  # middle point where z0 = 0
-    field = sum(Imcoeff[m][q0] for m in range(M))
+    field = np.sum(Imcoeff[q0:q0 + M])
     initial_value = -4.0 * pi * gamma * averb0 / (mu0 * field)
-    x0 = [initial_value] * M
-
-    def get_initial_current_value(window, initial_value):
-        #root = tk.Tk()
-        root.withdraw()
-        response = simpledialog.askstring("Input",
-                                          f"Suggested initial current for the optimization = {initial_value} A\n"
-                                          "If the optimization does not work, propose a new value,"
-                                          " choosing it as small as possible.\n"
-                                          "You may try zero and then other values in small increments.\n"
-                                          "Would you like to change? (y/n)",
-                                          parent=window)
-        if response.lower() == 'y':
-            new_value = simpledialog.askfloat("Input", "Enter your initial current value in A:",
-                                              parent=window)
-            if new_value is not None:
-                return new_value
-        return initial_value
+    if stored is not None:
+        initial_value = stored[1]['initial_current']
+    elif nearest is not None:
+        start = 'warm'
+    elif callable(I0):
+        initial_value = I0(initial_value)
+    elif I0 is not None:
+        initial_value = I0
+    x0 = [initial_value] * M if nearest is None else nearest[0]['current']
 
-    root = tk.Tk()
-    def run_main():
-        value = get_initial_current_value(root, initial_value)
-        I0 = [value] * M
-        return I0
-    x0 = run_main()
-
-    def on_run_button_click():
-        x0 = run_main()
-
-    # 2D array of coefficients in Eq. (21) in the report
-    dBz = []
-    for m in range(M):
-        row = []
-        for q in range(Q):
-            value = (mu0 / (4.0 * pi * gamma)) * Imcoeff[m][q]
-            row.append(value)
-        dBz.append(row)
-    dBz = np.array(dBz)
-
-    # Hessian matrix in Eq. (22) in the report
-    HM = []
-    for m in range(M):
-        row = []
-        for n in range(M):
-            value = 2.0 * sum(dBz[m][q] * dBz[n][q] for q in range(Q))
-            row.append(value)
-        HM.append(row)
-    HM = np.array(HM)
-
-    # Hessian as a function but the variable is not used since it is a constant matrix
-    def HJ(x):
-        return HM
-
-    # Function in Eq. (21) in the report
+    # Product of the constant Hessian matrix in Eq. (22) in the report with the vector p; the M x M matrix itself is
+    # never formed
+    def HP(x, p):
+        return 2.0 * kernel.rmatvec(kernel.matvec(p))
+
+    # Function in Eq. (21) in the report at all sampling points
     # x is the current array used in the external iterations in Eq. (18)
-    def Bz(x, q):
-        return (mu0 / (4.0 * pi * gamma)) * sum(x[m] * Imcoeff[m][q] for m in range(M))
+    def Bz(x):
+        return kernel.matvec(x)
 
     # Gradient function in Eq. (21) in the report
     def GJ(x):
-        output = []
-        for m in range(M):
-            value = sum(2.0 * (Bz(x, q) + b0[q]) * dBz[m][q] for q in range(Q))
-            output.append(value)
-        return np.array(output)
+        return 2.0 * kernel.rmatvec(Bz(x) + b0)
 
     # Least square function (15) used for the optimisation
     def fun(x):
-        return sum((Bz(x, q) + b0[q])**2 for q in range(Q))
+        r = Bz(x) + b0
+        return r @ r
+
+    # Residual vector Bz + B0 used by the least-squares method; its Jacobian is the constant coupling matrix
+    def residual(x):
+        return Bz(x) + b0
 
     # Minimisation algorithm:
     # https://docs.scipy.org/doc/scipy/reference/generated/scipy.optimize.minimize.html#id1
-    result = minimize(fun, x0, method = 'Newton-CG', jac = GJ, hess = HJ, tol = tolerance)
+    # Newton-CG (4) or the least-squares trust region reflective method (5) working directly with the residual vector:
+    # https://docs.scipy.org/doc/scipy/reference/generated/scipy.optimize.least_squares.html
+    # The currents can be bounded with Imax: |I| <= Imax
+    # Direct solvers: QR minimum-norm solution (6), Tikhonov regularisation (7), bounded currents |I| <= Imax (8)
+    if stored is not None:
+        start = 'cached'
+        arrays, info = stored
+        optimisation = info['optimisation']
+        result = OptimizeResult(x=arrays['current'], **info)  # solver statistics of the stored solution
+    elif Method == 6:
+        optimisation = 'QR'
+        result = SolveQR(kernel.dense(), b0)
+    elif Method == 7:
+        optimisation = 'Tikhonov'
+        result = SolveTikhonov(kernel.dense(), b0, lam)
+    elif Method == 8:
+        if Imax is None:
+            raise ValueError("the bounded method (8) needs the maximum current Imax")
+        optimisation = 'BVLS'
+        result = SolveBounded(kernel.dense(), b0, Imax, tolerance)
+    elif Method == 5:
+        optimisation = 'trf'
+        bounds = (-np.inf, np.inf) if Imax is None else (-Imax, Imax)
+        x0 = np.clip(x0, bounds[0], bounds[1])
+        scale = np.linalg.norm(b0) or 1.0  # the residuals in Tesla are normalised to make the tolerance relative
+        # Large stacks use the FFT products through a matrix-free operator
+        if kernel.matrix is not None:
+            jacobian, solver = kernel.matrix / scale, 'exact'
+        else:
+            jacobian, solver = kernel.operator() * (1.0 / scale), 'lsmr'
+        result = least_squares(lambda x: residual(x) / scale, x0, jac = lambda x: jacobian, bounds = bounds,
+                               method = optimisation, ftol = tolerance, xtol = tolerance, gtol = tolerance,
+                               tr_solver = solver)
+    else:
+        optimisation = 'Newton-CG'
+        result = minimize(fun, x0, method = optimisation, jac = GJ, hessp = HP, tol = tolerance)
     current = np.array(result.x)
-    noise_current = (lambda x: x + np.random.uniform(-Inoise, Inoise, size=x.shape))(current)
+    if cache is not None and stored is None:
+        cache.put(key, 'current', M, features, dict(current=current),
+                  dict(optimisation=optimisation, initial_current=float(initial_value), nfev=int(result.nfev),
+                       njev=int(result.njev), nit=int(getattr(result, 'nit', result.njev)),
+                       success=bool(result.success), message=str(result.message)))
+    rng = np.random.default_rng(seed)
+    noise_current = current + rng.uniform(-Inoise, Inoise, size=current.shape)
     wire_current_power = sum(map(lambda I: wire_resistance * I**2, current))
     strip_current_power = sum(map(lambda I: strip_resistance * I ** 2, current))
 
-    with open('design_parameters_for_currents.txt', 'w') as file:
-        file.write(f'strip thickness = {h} m\n')
-        file.write(f'conductor diameter/width without isolation/gap = {d0} m\n')
-        file.write(f'total conductor diameter/width = {d} m\n')
-        file.write(f'total substrate width, including the wire diameter = {w} m\n')
-        file.write(f'residual induction length = {L0} m\n')
-        file.write(f'total optimisation length = {L} m\n')
-        file.write(f'adjusted internal radius = {R} m\n')
-        file.write(f'adjusted external radius = {Rs} m\n')
-        file.write(f'number of spiral turns = {turns}\n')
-        file.write(f'each spiral length = {sp_length} m\n')
-        file.write(f'wire spiral resistance = {wire_resistance} Ohms\n')
-        file.write(f'strip spiral resistance = {strip_resistance} Ohms\n')
-        file.write(f'power dissipated in the whole wire stack = {wire_current_power} W\n')
-        file.write(f'power dissipated in the whole strip stack = {strip_current_power} W\n')
-
-    error = [lambda q: (Bz(current, q) + b0[q]) for q in range(Q)]
-    noise_error = [lambda q: (Bz(noise_current, q) + b0[q]) for q in range(Q)]
-    error = np.array([func(q) for q, func in enumerate(error)])
-    noise_error = np.array([func(q) for q, func in enumerate(noise_error)])
-
-    def plot_and_save_data(x, y, title, xlabel, ylabel, filename):
-        plt.plot(x, y)
-        plt.xlabel(xlabel)
-        plt.ylabel(ylabel)
-        plt.title(title)
-        plt.grid(True)
-        plt.tight_layout()
-        plt.show()
-
-        data = np.column_stack((x, y))
-        np.savetxt(filename, data, delimiter=",")
-
-    def plot_and_save_data_with_legend(x1, y1, x2, y2, title, xlabel, ylabel, filename):
-        plt.plot(x1, y1, color='blue', label='B0')
-        plt.plot(x2, y2, color='green', label='B0 + Bz')
-        plt.xlabel(xlabel)
-        plt.ylabel(ylabel)
-        plt.title(title)
-        plt.legend()
-        plt.tight_layout()
-        plt.grid(True)
-        plt.show()
-
-        data = np.column_stack((x1, y1, y2))
-        np.savetxt(filename, data, delimiter=",")
+    return CurrentResult(zm=zm, zq=zq, b0=b0, current=current, noise_current=noise_current,
+                         error=residual(current), noise_error=residual(noise_current), initial_current=initial_value,
+                         turns=turns, sp_length=sp_length, wire_resistance=wire_resistance,
+                         strip_resistance=strip_resistance, wire_current_power=wire_current_power,
+                         strip_current_power=strip_current_power, optimisation=optimisation, nfev=result.nfev,
+                         njev=result.njev, nit=getattr(result, 'nit', result.njev), success=bool(result.success),
+                         message=str(result.message), start=start, parameters=parameters, kernel=kernel)
+
+
+def plot_data(x, y, title, xlabel, ylabel):
+    import matplotlib.pyplot as plt
+    plt.plot(x, y)
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    plt.title(title)
+    plt.grid(True)
+    plt.tight_layout()
+    plt.show()
+
+def plot_data_with_legend(x1, y1, x2, y2, title, xlabel, ylabel):
+    import matplotlib.pyplot as plt
+    plt.plot(x1, y1, color='blue', label='B0')
+    plt.plot(x2, y2, color='green', label='B0 + Bz')
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    plt.title(title)
+    plt.legend()
+    plt.tight_layout()
+    plt.grid(True)
+    plt.show()
+
+# Optional sink: plots of the residual induction and of the optimised profiles
+def plot_current_result(result):
+    plot_data(result.zq, result.b0, "Residual induction", "z0, m", "B0, T")
 
     # Plot 1: Current profile
-    plot_and_save_data(zm, current, "Current profile", "z0, m", "I, A", "current_profile.csv")
+    plot_data(result.zm, result.current, "Current profile", "z0, m", "I, A")
 
     # Plot 2: Error profile
-    plot_and_save_data(zq, error, "Error profile", "z0, m", "Error, T", "error_profile.csv")
+    plot_data(result.zq, result.error, "Error profile", "z0, m", "Error, T")
 
     # Plot 3: Induction profile before and after optimization
-    plot_and_save_data_with_legend(zq, b0, zq, error, "Induction profile before and after optimization", "z0, m",
-                                       "Induction, T", "induction_profile.csv")
+    plot_data_with_legend(result.zq, result.b0, result.zq, result.error,
+                          "Induction profile before and after optimization", "z0, m", "Induction, T")
 
     # Plot 4: Induction profile with current uncertainty
-    plot_and_save_data_with_legend(zq, b0, zq, noise_error,
-                                    "Induction profile before and after optimization:\n with the current uncertainty",
-                                    "z0, m", "Induction, T", "induction_profile_with_uncertainty.csv")
+    plot_data_with_legend(result.zq, result.b0, result.zq, result.noise_error,
+                          "Induction profile before and after optimization:\n with the current uncertainty",
+                          "z0, m", "Induction, T")
+
+# Optional sink: CSV profiles and the text file with the design parameters written to the folder
+def save_current_result(result, folder="."):
+    p = result.parameters
+    path = lambda filename: os.path.join(folder, filename)
+    os.makedirs(folder, exist_ok=True)
+
+    with open(path('design_parameters_for_currents.txt'), 'w') as file:
+        file.write(f'strip thickness = {p["h"]} m\n')
+        file.write(f'conductor diameter/width without isolation/gap = {p["d0"]} m\n')
+        file.write(f'total conductor diameter/width = {p["d"]} m\n')
+        file.write(f'total substrate width, including the wire diameter = {p["w"]} m\n')
+        file.write(f'residual induction length = {p["L0"]} m\n')
+        file.write(f'total optimisation length = {p["L"]} m\n')
+        file.write(f'adjusted internal radius = {p["R_adjusted"]} m\n')
+        file.write(f'adjusted external radius = {p["Rs_adjusted"]} m\n')
+        file.write(f'number of spiral turns = {result.turns}\n')
+        file.write(f'each spiral length = {result.sp_length} m\n')
+        file.write(f'wire spiral resistance = {result.wire_resistance} Ohms\n')
+        file.write(f'strip spiral resistance = {result.strip_resistance} Ohms\n')
+        file.write(f'power dissipated in the whole wire stack = {result.wire_current_power} W\n')
+        file.write(f'power dissipated in the whole strip stack = {result.strip_current_power} W\n')
+        file.write(f'optimisation method = {result.optimisation}\n')
+        file.write(f'function evaluations = {result.nfev}\n')
+        file.write(f'Jacobian evaluations = {result.njev}\n')
+        file.write(f'starting point = {result.start}\n')
+        file.write(f'least square value = {result.error @ result.error} T^2\n')
+
+    np.savetxt(path("current_profile.csv"), np.column_stack((result.zm, result.current)), delimiter=",")
+    np.savetxt(path("error_profile.csv"), np.column_stack((result.zq, result.error)), delimiter=",")
+    np.savetxt(path("induction_profile.csv"), np.column_stack((result.zq, result.b0, result.error)), delimiter=",")
+    np.savetxt(path("induction_profile_with_uncertainty.csv"),
+               np.column_stack((result.zq, result.b0, result.noise_error)), delimiter=",")
+
+
+# Optional sink: the whole result in one binary bundle (see Bundle.py), by default a new currents_<date>-<time>.shim
+# file in the folder. The CSV files can be written later: save_current_result(load_current_bundle(filename))
+def save_current_bundle(result, filename=None, folder="."):
+    return save_result(filename or unique_name("currents", folder), 'currents', result)
+
+def load_current_bundle(filename):
+    return load_result(filename, CurrentResult)
+
+
+# Dialog asking the user to confirm or change the suggested initial current
+def ask_initial_current(initial_value):
+    from tkinter import simpledialog
+    import tkinter as tk
+
+    root = tk.Tk()
+    root.withdraw()
+    response = simpledialog.askstring("Input",
+                                      f"Suggested initial current for the optimization = {initial_value} A\n"
+                                      "If the optimization does not work, propose a new value,"
+                                      " choosing it as small as possible.\n"
+                                      "You may try zero and then other values in small increments.\n"
+                                      "Would you like to change? (y/n)",
+                                      parent=root)
+    if response.lower() == 'y':
+        new_value = simpledialog.askfloat("Input", "Enter your initial current value in A:",
+                                          parent=root)
+        if new_value is not None:
+            return new_value
+    return initial_value
+
+
+# Optimisation called from the GUI: computation followed by the plots and the bundle in the working folder;
+# csv adds the CSV profiles and the text file of the design parameters.
+# samples > 0 adds the Monte Carlo estimate of the uniform current uncertainty Inoise with this number of realisations.
+def CurrentOptimisation(tolerance, L0, L, d0, delta, h, R, Rs, w, rho, Inoise, Method=4, Imax=None, lam=1.0e-6,
+                        samples=0, plot=True, save=True, cache=None, csv=False):
+    # The direct solvers do not need an initial current
+    I0 = ask_initial_current if Method in (4, 5) else None
+    result = CurrentProfile(tolerance, L0, L, d0, delta, h, R, Rs, w, rho, Inoise, Method, Imax, lam, I0=I0,
+                            cache=cache)
+    uncertainty = CurrentUncertainty(result, Inoise, samples) if samples > 0 else None
+    if plot:
+        plot_current_result(result)
+        if uncertainty is not None:
+            plot_uncertainty_result(uncertainty)
+    if save:
+        save_current_bundle(result)
+        if csv:
+            save_current_result(result)
+        if uncertainty is not None:
+            save_uncertainty_result(uncertainty)
+    return result
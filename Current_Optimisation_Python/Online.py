@@ -0,0 +1,124 @@
+#
+# Online re-shimming: new optimal currents for every new measurement of the drifting residual induction.
+# The currents minimise the Tikhonov functional of the method 7, |A I + B0|^2 + lam |I|^2, where the rows of the
+# coupling matrix A (Eq. (21)) belong to the sensor points. The Cholesky factor R of the normal matrix
+# A^T A + lam E = R^T R is kept in memory, so that
+#   - a new or partial measurement of B0 at the sensor points only changes the right-hand side A^T B0:
+#     O(M Q) (or O(M k) for k changed points) plus two triangular solves, O(M^2)
+#   - adding or removing k sensor points changes the normal matrix by +/- the k rows a a^T: rank-k update or
+#     downdate of R in O(k M^2) instead of the O(Q M^2 + M^3) factorisation
+# lam is fixed when the factor is first calculated (relative to the coupling matrix, as in SolveTikhonov), so the
+# normal matrix stays positive definite when points are removed.
+#
+# Example:
+#   shim = OnlineShim.from_result(CurrentProfile(...))   # factorisation for the sensor points of the result
+#   currents = shim.update(b0_measured)                  # all sensor points measured again
+#   currents = shim.update(values, points=[3, 4, 5])     # some of them
+#   currents = shim.add_points(z_new, b0_new)            # new sensors at the coordinates z_new
+#   currents = shim.remove_points([0, 1])                # sensors out of order
+#
+
+import os
+import sys
+import numpy as np
+from scipy.linalg import cholesky, cho_solve
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Shimming_Core_Python'))
+from SpiralCoil import field_factor, SpiralField, pi
+
+REFACTOR_FRACTION = 0.25  # more changed points than this fraction of M are factorised again
+
+# Rank-1 update (sign = 1) or downdate (sign = -1) of the upper Cholesky factor: R^T R + sign * x x^T = R'^T R'
+def cholesky_update(R, x, sign=1.0):
+    x = np.array(x, dtype=float)
+    for k in range(len(x)):
+        r2 = R[k, k]**2 + sign * x[k]**2
+        if r2 <= 0.0:
+            raise np.linalg.LinAlgError("the downdated matrix is not positive definite")
+        r = np.sqrt(r2)
+        c, s = r / R[k, k], x[k] / R[k, k]
+        R[k, k] = r
+        R[k, k + 1:] = (R[k, k + 1:] + sign * s * x[k + 1:]) / c
+        x[k + 1:] = c * x[k + 1:] - s * R[k, k + 1:]
+    return R
+
+
+class OnlineShim:
+    # zm: coordinates of the spirals, zs and b0: coordinates of the sensor points and the measured induction,
+    # gtd1 = 2 R and gtd2 = 2 Rs (adjusted radii) and gamma as in CurrentProfile
+    def __init__(self, zm, zs, b0, gamma, gtd1, gtd2, lam=1.0e-6):
+        self.zm = np.asarray(zm, dtype=float)
+        self.gamma, self.gtd1, self.gtd2 = gamma, gtd1, gtd2
+        self.zs = np.asarray(zs, dtype=float)
+        self.b0 = np.array(b0, dtype=float)
+        self.A = self.rows(self.zs)
+        self.regularisation = lam * np.sum(self.A**2) / len(self.zm)
+        self.factorise()
+
+    # Online shimming for the spirals and sampling points of a CurrentResult
+    @classmethod
+    def from_result(cls, result, lam=1.0e-6):
+        p = result.parameters
+        return cls(result.zm, result.zq, result.b0, p['d'] / (2.0 * pi), 2.0 * p['R_adjusted'],
+                   2.0 * p['Rs_adjusted'], lam)
+
+    # Rows of the coupling matrix for the sensor points z
+    def rows(self, z):
+        dz = np.asarray(z, dtype=float)[:, np.newaxis] - self.zm[np.newaxis, :]
+        return field_factor(self.gamma) * SpiralField(dz, self.gtd1, self.gtd2)
+
+    def factorise(self):
+        self.R = cholesky(self.A.T @ self.A + self.regularisation * np.eye(len(self.zm)))
+        self.rhs = self.A.T @ self.b0
+        self.current = -cho_solve((self.R, False), self.rhs)
+
+    def solve(self):
+        self.current = -cho_solve((self.R, False), self.rhs)
+        return self.current
+
+    # Residuals Bz + B0 at the sensor points
+    def error(self):
+        return self.A @ self.current + self.b0
+
+    # New measurement at all sensor points, or the values at the given sensor points (indices)
+    def update(self, values, points=None):
+        values = np.asarray(values, dtype=float)
+        if points is None:
+            self.b0 = values.copy()
+            self.rhs = self.A.T @ self.b0
+        else:
+            points = np.asarray(points, dtype=int)
+            self.rhs += self.A[points].T @ (values - self.b0[points])
+            self.b0[points] = values
+        return self.solve()
+
+    # Rank-k change of the normal matrix by the rows a: + a a^T (sign = 1) or - a a^T (sign = -1)
+    def modify(self, rows, sign):
+        if len(rows) > REFACTOR_FRACTION * len(self.zm):
+            self.factorise()
+            return
+        try:
+            for row in rows:
+                cholesky_update(self.R, row, sign)
+        except np.linalg.LinAlgError:
+            self.factorise()  # rounding errors made the downdate fail
+            return
+        self.rhs = self.A.T @ self.b0
+
+    # New sensor points at the coordinates z with the measured induction b0
+    def add_points(self, z, b0):
+        rows = self.rows(np.atleast_1d(z))
+        self.zs = np.append(self.zs, z)
+        self.b0 = np.append(self.b0, b0)
+        self.A = np.vstack((self.A, rows))
+        self.modify(rows, 1.0)
+        return self.solve()
+
+    # Removes the sensor points (indices)
+    def remove_points(self, points):
+        points = np.atleast_1d(np.asarray(points, dtype=int))
+        rows = self.A[points]
+        keep = np.ones(len(self.zs), dtype=bool)
+        keep[points] = False
+        self.zs, self.b0, self.A = self.zs[keep], self.b0[keep], self.A[keep]
+        self.modify(rows, -1.0)
+        return self.solve()
@@ -0,0 +1,57 @@
+#
+# Toeplitz structure of the coupling between the spiral coils and the induction sampling points.
+# zm and zq are uniform grids with the same step w, so the coefficient in Eq. (21) depends only on zq[q] - zm[m]:
+# the Q x M matrix A[q, m] = v[q - m + M - 1] is defined by its M + Q - 1 distinct values v, sampled at
+# zq[0] - zm[M-1] + k * w for k = 0 ... M + Q - 2.
+# The products A x and A^T r are convolutions with v evaluated by FFT in O((M + Q) log(M + Q)) operations.
+#
+
+import numpy as np
+from scipy.fft import rfft, irfft, next_fast_len
+from scipy.sparse.linalg import LinearOperator
+
+DENSE_LIMIT = 2**20  # smaller matrices are kept dense: a plain matrix product is faster than the FFT there
+
+class ToeplitzKernel:
+    def __init__(self, values, M, Q):
+        self.values = np.asarray(values, dtype=float)
+        if len(self.values) != M + Q - 1:
+            raise ValueError(f"a Q x M Toeplitz kernel needs M + Q - 1 = {M + Q - 1} values, got {len(self.values)}")
+        self.M = M
+        self.Q = Q
+        self.shape = (Q, M)
+        self.nfft = next_fast_len(M + Q - 2 + max(M, Q), real=True)  # linear convolution without wrap-around
+        self.spectrum = rfft(self.values, self.nfft)
+        self.matrix = self.dense() if M * Q <= DENSE_LIMIT else None
+
+    # Full Q x M matrix (needed only by the direct solvers)
+    def dense(self):
+        index = np.arange(self.Q)[:, np.newaxis] - np.arange(self.M)[np.newaxis, :] + self.M - 1
+        return self.values[index]
+
+    # A x for x of shape (..., M): the field of the currents x at all sampling points
+    def matvec(self, x):
+        x = np.asarray(x, dtype=float)
+        if self.matrix is not None:
+            return x @ self.matrix.T
+        y = irfft(self.spectrum * rfft(x, self.nfft, axis=-1), self.nfft, axis=-1)
+        return y[..., self.M - 1:self.M - 1 + self.Q]
+
+    # A^T r for r of shape (..., Q)
+    def rmatvec(self, r):
+        r = np.asarray(r, dtype=float)
+        if self.matrix is not None:
+            return r @ self.matrix
+        y = irfft(self.spectrum * rfft(r[..., ::-1], self.nfft, axis=-1), self.nfft, axis=-1)
+        return y[..., self.Q - 1:self.Q - 1 + self.M][..., ::-1]
+
+    # Sum of the coefficients of all spirals at the sampling point q (one row of A)
+    def row_sum(self, q):
+        return np.sum(self.values[q:q + self.M])
+
+    # Matrix-free operator for the iterative least-squares solvers; LinearOperator passes vectors as (n,) or (n, 1)
+    # and matrices column by column as (n, k), while matvec and rmatvec work on the last axis
+    def operator(self):
+        return LinearOperator(self.shape, matvec=lambda x: self.matvec(np.ravel(x)),
+                              rmatvec=lambda r: self.rmatvec(np.ravel(r)), matmat=lambda X: self.matvec(X.T).T,
+                              rmatmat=lambda R: self.rmatvec(R.T).T, dtype=float)
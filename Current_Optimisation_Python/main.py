@@ -4,10 +4,12 @@
 #
 
 import os
+import tkinter as tk
 from NewtonCG import *
 
 PARAMETERS_FILE = "parameters.txt"
-NUM_PARAMETERS = 11
+CACHE_FOLDER = "result_cache"  # stored solutions: an unchanged problem is not solved again
+NUM_PARAMETERS = 15
 
 def stop_main():
     quit()
@@ -17,7 +19,10 @@ def run_main():
     # You can access the parameter values here and call your own function using the parameters
 
     # Retrieve the parameter values from the input fields
-    params = [float(entries[i].get()) for i in range(1, NUM_PARAMETERS+1)]
+    params = [float(entries[i].get()) for i in range(1, NUM_PARAMETERS - 3)]  # first part of the list
+    params.append(int(entries[NUM_PARAMETERS - 3].get()))  # second part
+    params.extend([float(entries[i].get()) for i in range(NUM_PARAMETERS - 2, NUM_PARAMETERS)])  # third part
+    params.append(int(float(entries[NUM_PARAMETERS].get())))  # number of the Monte Carlo realisations
 
     # Save the parameter values to a file
     save_parameters(params)
@@ -34,9 +39,16 @@ def run_main():
     # params[8] w: substrate width (m); w = d0 + 2*delta if no substrates
     # params[9] rho: conductor resistivity (Ohm*m)
     # params[10] Inoise: current uncertainty (+/-) in A caused by the driver performance
+    # params[11] Method: Newton-CG (4), least-squares trust region reflective (5),
+    #            direct solvers: QR (6), Tikhonov (7), bounded currents (8)
+    # params[12] Imax: maximum driver current (A) for the methods 5 and 8; 0 means no limit
+    # params[13] lam: Tikhonov regularisation relative to the mean squared column of the coefficient matrix
+    # params[14] K: number of the Monte Carlo realisations of the current uncertainty; 0 for a single realisation
 
+    Imax = params[12] if params[12] > 0.0 else None
     CurrentOptimisation(params[0], params[1], params[2], params[3], params[4], params[5], params[6], params[7],
-                        params[8], params[9], params[10])
+                        params[8], params[9], params[10], params[11], Imax, params[13], params[14],
+                        cache=CACHE_FOLDER)
 
 def save_parameters(params):
     # Save the parameter values to a file
@@ -83,7 +95,11 @@ param_labels = [
     'Rs - external radius (m) of the shimming coil',
     'w - substrate width (m) including turns; w = d0 + 2*delta if no substrates (only for wires)',
     'rho - conductor resistivity (Ohm*m): 1.68e-8 Cu, 2.65e-8 Al, 1.59e-8 Ag',
-    'Current +/- uncertainty (A) caused by the driver performance (estimated)'
+    'Current +/- uncertainty (A) caused by the driver performance (estimated)',
+    'Method - Newton-CG (4), least-squares TRF (5), direct: QR (6), Tikhonov (7), bounded currents (8)',
+    'Imax - maximum driver current (A) for the methods 5 and 8; 0 for no limit',
+    'lambda - relative Tikhonov regularisation for the method 7 (10^-6 is recommended)',
+    'K - number of Monte Carlo realisations of the current uncertainty (10^4 - 10^5); 0 for a single one'
 ]
 
 entries = {}
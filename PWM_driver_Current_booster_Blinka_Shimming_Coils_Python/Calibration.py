@@ -0,0 +1,204 @@
+#
+# Calibration of the driver channels: the current of a channel as a function of its duty cycle ratio, and the
+# inverse, so that a current profile of the optimisation (amperes) becomes the duty cycles of the PCA9685 channels.
+# The sweep of Testing_PWM_driver_Arduino_Python (pwm_sweep.csv: duty ratio and the output voltage of every
+# channel) gives the currents with the amperes per volt of each channel (1 / load resistance of the booster output).
+# Measurement noise makes a sweep slightly non-monotone, so every channel is fitted by the isotonic regression
+# (pool adjacent violators): the knots are the means of the pooled blocks, strictly monotone in the duty ratio and
+# in the current. Between the knots the table is linear in both directions, so the inverse is exact.
+# All tables are kept in one pair of arrays: the knots of the table c are mapped to [2c, 2c + 1], so one np.interp
+# call converts the values of all coils, each with its own table.
+# The table of every coil is given by tables= (one table for all, or one per coil); only a profile with one value per
+# table may leave it out (table k for coil k). The current booster drives the current in one direction only, so the
+# negative currents of a profile are outside a calibration of positive currents: split_sign gives the magnitudes to
+# convert and the direction of every coil (coils connected the other way round, or a polarity relay).
+#
+# Example:
+#   calibration = Calibration.from_sweep("pwm_sweep.csv", amperes_per_volt=[0.5, 0.5, 0.5, 0.5])
+#   magnitude, direction = split_sign(result.current)              signed currents of a CurrentResult
+#   codes = calibration.duty_codes(magnitude, tables=channel_of_coil)   16-bit duty cycles, table of every coil
+#   stack.update(codes)                                                  see PWMStack.py
+#   python Calibration.py build pwm_sweep.csv --amperes-per-volt 0.5 -o calibration.json
+#   python Calibration.py convert calibration.json current_profile.csv --table 0 --split-sign -o duty_profile.csv
+#
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Shimming_Core_Python'))
+from Bundle import Bundle
+
+CALIBRATION = "calibration.json"
+SWEEP = "pwm_sweep.csv"
+
+
+# Non-decreasing least-squares fit of y with the weights w (pool adjacent violators); returns the blocks as the
+# weighted means of x and y
+def isotonic_blocks(x, y, w=None):
+    blocks = []  # [weighted sum of x, weighted sum of y, sum of the weights]
+    for xi, yi, wi in zip(x, y, np.ones(len(x)) if w is None else w):
+        blocks.append([wi * xi, wi * yi, wi])
+        while len(blocks) > 1 and blocks[-2][1] * blocks[-1][2] >= blocks[-1][1] * blocks[-2][2]:
+            last = blocks.pop()
+            blocks[-1] = [blocks[-1][0] + last[0], blocks[-1][1] + last[1], blocks[-1][2] + last[2]]
+    blocks = np.array(blocks, dtype=float)
+    return blocks[:, 0] / blocks[:, 2], blocks[:, 1] / blocks[:, 2]
+
+# Knots of the monotone table of one channel: duty ratios and currents, both strictly monotone; the current
+# decreases with the duty ratio if the sweep does. Repeated duty ratios are merged first (mean of their currents,
+# weighted by the number of measurements), so no two knots have the same duty ratio.
+def monotone_table(duty, current):
+    duty, index, count = np.unique(np.asarray(duty, dtype=float), return_inverse=True, return_counts=True)
+    current = np.bincount(index.ravel(), weights=np.asarray(current, dtype=float).ravel()) / count
+    if len(duty) < 2:
+        raise ValueError("the sweep of a channel has fewer than two duty ratios")
+    sign = -1.0 if np.polyfit(duty, current, 1, w=np.sqrt(count))[0] < 0.0 else 1.0
+    duty, current = isotonic_blocks(duty, sign * current, count)
+    if len(duty) < 2:
+        raise ValueError("the sweep of a channel has no range of currents")
+    return duty, sign * current
+
+# Sweep file: header line "duty,V1,V2,..." and one line per duty ratio
+def load_sweep(filename=SWEEP):
+    data = np.atleast_2d(np.loadtxt(filename, delimiter=",", skiprows=1))
+    return data[:, 0], data[:, 1:].T
+
+# Currents of a profile: a CurrentResult, a current bundle (.shim), current_profile.csv (zm, current) or an array
+def profile_currents(source):
+    if hasattr(source, 'current'):
+        return np.asarray(source.current, dtype=float)
+    if isinstance(source, str):
+        if source.endswith(".shim"):
+            return np.asarray(Bundle(source)['current'], dtype=float)
+        return np.atleast_2d(np.loadtxt(source, delimiter=","))[:, -1]
+    return np.asarray(source, dtype=float)
+
+# Magnitudes and directions (1 or -1) of signed currents, for the boosters which drive one direction only
+def split_sign(currents):
+    currents = np.asarray(currents, dtype=float)
+    return np.abs(currents), np.where(currents < 0.0, -1, 1)
+
+
+class Calibration:
+    # tables: list of (duty ratios, currents) of the knots of every channel
+    def __init__(self, tables):
+        self.tables = [monotone_table(duty, current) for duty, current in tables]
+        self.duty_min = np.array([duty[0] for duty, _ in self.tables])
+        self.duty_max = np.array([duty[-1] for duty, _ in self.tables])
+        self.current_min = np.array([min(current[0], current[-1]) for _, current in self.tables])
+        self.current_max = np.array([max(current[0], current[-1]) for _, current in self.tables])
+        # Knots of all tables in one array each: table c on [2c, 2c + 1] of the normalised duty ratio and current
+        offsets = 2.0 * np.arange(len(self.tables))
+        ordered = [current if current[0] < current[-1] else current[::-1] for _, current in self.tables]
+        self.duty_keys = np.concatenate([o + (duty - duty[0]) / (duty[-1] - duty[0])
+                                         for o, (duty, _) in zip(offsets, self.tables)])
+        self.duty_currents = np.concatenate([current for _, current in self.tables])
+        self.current_keys = np.concatenate([o + (current - current[0]) / (current[-1] - current[0])
+                                            for o, current in zip(offsets, ordered)])
+        self.current_duties = np.concatenate([duty if current[0] < current[-1] else duty[::-1]
+                                              for duty, current in self.tables])
+
+    @classmethod
+    def from_sweep(cls, filename=SWEEP, amperes_per_volt=1.0):
+        duty, voltages = load_sweep(filename)
+        scale = np.broadcast_to(np.asarray(amperes_per_volt, dtype=float), (len(voltages),))
+        return cls([(duty, a * v) for a, v in zip(scale, voltages)])
+
+    @property
+    def channels(self):
+        return len(self.tables)
+
+    # Table of every value: tables broadcast to the shape of the values. Without tables there must be one value per
+    # table (table k for the value k)
+    def table_indices(self, shape, tables=None):
+        if tables is None:
+            count = int(np.prod(shape))
+            if count != self.channels:
+                raise ValueError(f"{count} values for {self.channels} calibration tables: give the table of every "
+                                 f"value with tables= (one index for all values, or one per value)")
+            tables = np.arange(count).reshape(shape)
+        tables = np.broadcast_to(np.asarray(tables, dtype=int), shape)
+        if tables.size and (tables.min() < 0 or tables.max() >= self.channels):
+            raise IndexError(f"tables= refers to the table {tables.max() if tables.max() >= 0 else tables.min()}, "
+                             f"there are the tables 0...{self.channels - 1}")
+        return tables
+
+    # Currents of the duty ratios (value k with the table tables[k], or one table for all)
+    def current(self, duty, tables=None):
+        duty = np.asarray(duty, dtype=float)
+        c = self.table_indices(duty.shape, tables)
+        duty = np.clip(duty, self.duty_min[c], self.duty_max[c])
+        keys = 2.0 * c + (duty - self.duty_min[c]) / (self.duty_max[c] - self.duty_min[c])
+        return np.interp(keys, self.duty_keys, self.duty_currents)
+
+    # Duty ratios of the currents (inverse of current). Currents outside the range of their table raise ValueError
+    # unless clip saturates them; signed currents are converted as their magnitudes (split_sign).
+    def duty(self, current, tables=None, clip=False):
+        current = np.asarray(current, dtype=float)
+        c = self.table_indices(current.shape, tables)
+        low, high = self.current_min[c], self.current_max[c]
+        outside = (current < low) | (current > high)
+        if np.any(outside) and not clip:
+            k = np.flatnonzero(outside)
+            hint = ""
+            if np.any((current < 0.0) & (low >= 0.0)):
+                hint = "; the booster drives positive currents only, convert the magnitudes (split_sign)"
+            raise ValueError(f"{len(k)} current(s) outside the calibrated range, e.g. {current.flat[k[0]]:.4g} A "
+                             f"(table {c.flat[k[0]]}: {low.flat[k[0]]:.4g}...{high.flat[k[0]]:.4g} A){hint}")
+        keys = 2.0 * c + (np.clip(current, low, high) - low) / (high - low)
+        return np.interp(keys, self.current_keys, self.current_duties)
+
+    # 16-bit duty cycles of the PCA9685 channels (as PCA9685.duty_code) of a current profile
+    def duty_codes(self, currents, tables=None, clip=False):
+        ratio = np.clip(self.duty(profile_currents(currents), tables, clip), 0.0, 1.0)
+        return (ratio * 0xFFFF).astype(int)
+
+    def save(self, filename=CALIBRATION):
+        with open(filename, "w") as file:
+            tables = [dict(duty=duty.tolist(), current=current.tolist()) for duty, current in self.tables]
+            json.dump(dict(tables=tables), file, indent=1)
+
+    @classmethod
+    def load(cls, filename=CALIBRATION):
+        with open(filename, "r") as file:
+            return cls([(table['duty'], table['current']) for table in json.load(file)['tables']])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Current-to-duty calibration of the driver channels")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="calibration tables from a sweep file")
+    build.add_argument("sweep", nargs="?", default=SWEEP)
+    build.add_argument("--amperes-per-volt", type=float, nargs="+", default=[1.0],
+                       help="output current per volt of every channel (one value for all)")
+    build.add_argument("-o", "--output", default=CALIBRATION)
+    convert = commands.add_parser("convert", help="duty cycles of a current profile (.csv or .shim)")
+    convert.add_argument("calibration")
+    convert.add_argument("profile")
+    convert.add_argument("--table", type=int, default=None,
+                         help="one table for all coils (default: table k for coil k, one coil per table)")
+    convert.add_argument("--split-sign", action="store_true",
+                         help="convert the magnitudes of the currents and write the direction of every coil")
+    convert.add_argument("--clip", action="store_true", help="saturate the currents outside the calibrated range")
+    convert.add_argument("-o", "--output", default="duty_profile.csv")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        calibration = Calibration.from_sweep(args.sweep, args.amperes_per_volt)
+        calibration.save(args.output)
+        for c, (low, high) in enumerate(zip(calibration.current_min, calibration.current_max)):
+            print(f"table {c}: {len(calibration.tables[c][0])} knots, {low:.4g}...{high:.4g} A")
+    else:
+        calibration = Calibration.load(args.calibration)
+        currents = profile_currents(args.profile)
+        magnitude, direction = split_sign(currents) if args.split_sign else (currents, np.ones(len(currents), int))
+        try:
+            ratios = calibration.duty(magnitude, args.table, args.clip)
+        except (ValueError, IndexError) as error:
+            parser.error(str(error).replace("tables=", "--table").replace("split_sign", "--split-sign"))
+        codes = calibration.duty_codes(magnitude, args.table, args.clip)
+        np.savetxt(args.output, np.column_stack((currents, ratios, codes, direction)), delimiter=",",
+                   fmt=("%.9e", "%.9e", "%d", "%d"), header="current,duty,code,direction", comments="")
+        print(f"{len(codes)} duty cycles written to {args.output}")
@@ -0,0 +1,176 @@
+#
+# Append-only journal of the driver state, one JSON record per line (JSON Lines):
+#   {"type":"duty","time":...,"channel":3,"duty":0.5,"source":"gui"}              duty cycle ratio of a channel
+#   {"type":"frequency","time":...,"frequency":1500.0,"source":"gui"}             PWM frequency (Hz)
+#   {"type":"snapshot","time":...,"frequency":1500.0,"duty":{"1":0.5,...},"source":"apply"}   the whole state
+# The file is opened once and written through a large buffer (flushed with every snapshot, by flush and close),
+# so automated runs can journal thousands of updates per second. A snapshot is appended after every
+# snapshot_every records; recover reads the file backwards from its end to the last complete snapshot and replays only
+# the records after it, so the recovery does not depend on the length of the journal. A line cut by a crash does not
+# parse and is skipped: a cut snapshot is replaced by the snapshot before it and the records in between.
+# A missing journal is recovered from the legacy duty_cycle.log ("Channel 3 duty cycle set to 0.50" lines).
+#
+# Example:
+#   with Journal("duty_cycle.jsonl") as journal:
+#       journal.duty(3, 0.5, source="sweep"); journal.frequency(1500.0)
+#   state = recover("duty_cycle.jsonl")          {'frequency': 1500.0, 'duty': {3: 0.5}}
+#
+
+import os
+import json
+import time
+
+JOURNAL = "duty_cycle.jsonl"
+LEGACY_LOG = "duty_cycle.log"
+BUFFER_SIZE = 2**16
+SNAPSHOT_EVERY = 1000  # records between two automatic snapshots
+BLOCK = 2**16  # bytes read at once when searching the last snapshot
+SNAPSHOT = b'{"type":"snapshot"'  # start of a snapshot line
+
+def encode(record):
+    return json.dumps(record, separators=(",", ":")) + "\n"
+
+def empty_state():
+    return dict(frequency=None, duty={})
+
+# Applies a record to the state (frequency and channel -> duty ratio)
+def apply_record(state, record):
+    kind = record.get('type')
+    if kind == 'duty':
+        state['duty'][int(record['channel'])] = record['duty']
+    elif kind == 'frequency':
+        state['frequency'] = record['frequency']
+    elif kind == 'snapshot':
+        state['frequency'] = record['frequency']
+        state['duty'] = {int(channel): duty for channel, duty in record['duty'].items()}
+    return state
+
+
+class Journal:
+    def __init__(self, filename=JOURNAL, buffering=BUFFER_SIZE, snapshot_every=SNAPSHOT_EVERY, legacy=LEGACY_LOG):
+        self.filename = filename
+        self.snapshot_every = snapshot_every
+        new = not os.path.exists(filename) or os.path.getsize(filename) == 0
+        self.state = recover(filename, legacy)
+        cut = not new and last_byte(filename) != b"\n"
+        self.file = open(filename, "a", buffering=buffering, encoding="utf-8")
+        self.count = 0  # records since the last snapshot
+        if cut:
+            self.file.write("\n")  # end the line cut by a crash
+        if new and (self.state['duty'] or self.state['frequency'] is not None):
+            self.snapshot(source="legacy")
+
+    def append(self, record):
+        self.file.write(encode(record))
+        apply_record(self.state, record)
+        self.count += 1
+        if self.snapshot_every and self.count >= self.snapshot_every:
+            self.snapshot(source="auto")
+
+    def duty(self, channel, duty, source="gui"):
+        self.append(dict(type="duty", time=time.time(), channel=int(channel), duty=float(duty), source=source))
+
+    def frequency(self, frequency, source="gui"):
+        self.append(dict(type="frequency", time=time.time(), frequency=float(frequency), source=source))
+
+    # Record of the whole current state; the journal is flushed
+    def snapshot(self, source="gui"):
+        self.file.write(encode(dict(type="snapshot", time=time.time(), frequency=self.state['frequency'],
+                                    duty={str(channel): duty for channel, duty in sorted(self.state['duty'].items())},
+                                    source=source)))
+        self.count = 0
+        self.flush()
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+def last_byte(filename):
+    with open(filename, "rb") as file:
+        file.seek(-1, os.SEEK_END)
+        return file.read(1)
+
+# Records of the lines which parse; the others (cut by a crash) are skipped
+def parse_records(data):
+    records = []
+    for line in data.splitlines():
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            pass
+    return records
+
+# Records of the file from its last complete snapshot (inclusive), read backwards in blocks from the end
+def tail_records(filename):
+    with open(filename, "rb") as file:
+        position = file.seek(0, os.SEEK_END)
+        data = b""
+        end = None  # snapshots before this offset of data have not been tried yet
+        while position > 0:
+            size = min(BLOCK, position)
+            position -= size
+            file.seek(position)
+            data = file.read(size) + data
+            end = len(data) if end is None else end + size
+            start = data.rfind(SNAPSHOT, 0, end)
+            while start >= 0:
+                line_end = data.find(b"\n", start)
+                try:
+                    json.loads(data[start:line_end if line_end >= 0 else len(data)])
+                    return parse_records(data[start:])
+                except ValueError:
+                    end = start  # cut snapshot: try the one before it
+                    start = data.rfind(SNAPSHOT, 0, end)
+        return parse_records(data)
+
+# Legacy log of the old program: the frequency and the duty cycles in their text lines
+def recover_legacy(filename=LEGACY_LOG):
+    state = empty_state()
+    if os.path.exists(filename):
+        with open(filename, "r") as log_file:
+            for line in log_file:
+                if "duty cycle" in line:
+                    state['duty'][int(line.split()[1])] = float(line.split()[-1])
+                elif "PWM frequency" in line:
+                    state['frequency'] = float(line.split()[-2])
+    return state
+
+# Last state of the journal (frequency and channel -> duty ratio); the legacy log if there is no journal.
+# Lines cut by a crash are ignored.
+def recover(filename=JOURNAL, legacy=LEGACY_LOG):
+    if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+        return recover_legacy(legacy) if legacy else empty_state()
+    state = empty_state()
+    for record in tail_records(filename):
+        try:
+            apply_record(state, record)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            pass
+    return state
+
+
+if __name__ == "__main__":
+    # Journal rate and recovery time of an automated run
+    import tempfile
+    filename = os.path.join(tempfile.mkdtemp(), JOURNAL)
+    count = 100000
+    start = time.perf_counter()
+    with Journal(filename, legacy=None) as journal:
+        journal.frequency(1500.0, source="test")
+        for i in range(count):
+            journal.duty(i % 16 + 1, (i % 100) / 100.0, source="test")
+    rate = count / (time.perf_counter() - start)
+    start = time.perf_counter()
+    state = recover(filename)
+    print(f"{rate:.0f} records/s; recovered {len(state['duty'])} channels of a "
+          f"{os.path.getsize(filename) / 2**20:.1f} MiB journal in {1000.0 * (time.perf_counter() - start):.2f} ms")
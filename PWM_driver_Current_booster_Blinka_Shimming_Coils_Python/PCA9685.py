@@ -0,0 +1,270 @@
+#
+# Register-level driver of the PCA9685 PWM controller for slow I2C bridges such as the MCP2221 USB-I2C adapter.
+# adafruit_pca9685 writes every register of every channel in its own I2C transaction, i.e. its own USB round trip.
+# Here the auto-increment mode (AI bit of MODE1) is switched on, so the ON_L, ON_H, OFF_L and OFF_H registers of any
+# run of consecutive channels are written by one transaction: [LED0_ON_L + 4 * first, 4 bytes per channel...].
+# All 16 channels are 65 bytes in one transaction instead of 16 x 4 single-register writes.
+# The driver keeps a shadow copy of the PWM registers and of the prescaler (read once from the chip, see sync), so
+# update sends only the registers that change and the frequency is only reprogrammed (sleep, prescaler, restart:
+# a glitch of all outputs) when the prescaler changes. The outputs change at the STOP condition of a transaction
+# (MODE2 OCH = 0), so an atomic update of several channels is written by one transaction.
+# The prescaler is calculated as by adafruit_pca9685, round(clock / 4096 / f) without the - 1 of the datasheet, so the
+# hardware runs as it did with that library: the "1500 Hz" of the GUI is the prescaler 4 and frequency reports
+# 1525.88 Hz (clock / 4096 / prescaler), while the chip outputs clock / 4096 / (prescaler + 1) = 1220.70 Hz
+# (output_frequency), the frequency at which the current booster and its calibration were measured.
+# The bus object only needs the busio.I2C methods try_lock, unlock, writeto and writeto_then_readfrom; MockI2C
+# emulates the registers of the chips without hardware and counts the transactions.
+#
+# Example:
+#   pca = PCA9685(busio.I2C(board.SCL, board.SDA), address=0x40)
+#   pca.frequency = 1500
+#   pca.write_duty_cycles([duty_code(0.5)] * 16)      all channels in one transaction
+#   pca.update({3: duty_code(0.52), 7: duty_code(0.48)})    only the changed registers of the channels 3...7
+#   pca = PCA9685(MockI2C()); pca.write_duty_cycles(...); pca.i2c.transactions
+#
+
+import time
+
+CHANNELS = 16
+REFERENCE_CLOCK = 25000000  # Hz, internal oscillator
+
+# Registers
+MODE1 = 0x00
+MODE2 = 0x01
+LED0_ON_L = 0x06  # 4 registers per channel: ON_L, ON_H, OFF_L, OFF_H
+ALL_LED_ON_L = 0xFA
+PRESCALE = 0xFE
+MODE1_RESET = 0x11  # power-on values: sleep and All Call
+PRESCALE_RESET = 0x1E
+
+# Bits of MODE1
+RESTART = 0x80
+AI = 0x20  # register auto-increment
+SLEEP = 0x10
+
+FULL_ON = 0x1000  # bit 4 of ON_H: the output is always on
+OSCILLATOR_DELAY = 0.005  # s, the oscillator needs 500 us to start after the sleep
+MERGE_GAP = 8  # unchanged registers rewritten rather than starting a new transaction (non-atomic updates)
+
+
+# 16-bit duty cycle (as pca.channels[i].duty_cycle of adafruit_pca9685) of a duty cycle ratio 0...1
+def duty_code(ratio):
+    if not 0.0 <= ratio <= 1.0:
+        raise ValueError(f"duty cycle ratio {ratio} is out of the range 0...1")
+    return int(ratio * 0xFFFF)
+
+# ON and OFF counts (12 bits) of a 16-bit duty cycle, as in adafruit_pca9685
+def pwm_counts(value):
+    if value == 0xFFFF:
+        return FULL_ON, 0
+    return 0, (value + 1) >> 4
+
+# 16-bit duty cycle of the ON and OFF counts
+def duty_value(on, off):
+    return 0xFFFF if on & FULL_ON else off << 4
+
+# Register bytes of one channel: ON_L, ON_H, OFF_L, OFF_H
+def channel_bytes(value):
+    on, off = pwm_counts(value)
+    return bytes((on & 0xFF, on >> 8, off & 0xFF, off >> 8))
+
+# 16-bit duty cycles of the register bytes of consecutive channels
+def duty_values(data):
+    return [duty_value(data[i] | data[i + 1] << 8, data[i + 2] | data[i + 3] << 8) for i in range(0, len(data), 4)]
+
+
+class PCA9685:
+    def __init__(self, i2c, address=0x40, reference_clock_speed=REFERENCE_CLOCK):
+        self.i2c = i2c
+        self.address = address
+        self.reference_clock_speed = reference_clock_speed
+        self.write(MODE1, bytes((AI,)))  # reset to the normal mode with auto-increment
+        self.sync()
+
+    # Shadow copy of the PWM registers of all channels and of the prescaler, read from the chip
+    def sync(self):
+        self.shadow = bytearray(self.read(LED0_ON_L, 4 * CHANNELS))
+        self.prescale = self.read(PRESCALE)[0]
+
+    # One write transaction: the register address and the data bytes (consecutive registers with AI)
+    def write(self, register, data):
+        while not self.i2c.try_lock():
+            pass
+        try:
+            self.i2c.writeto(self.address, bytes((register,)) + bytes(data))
+        finally:
+            self.i2c.unlock()
+
+    # One read transaction of count consecutive registers
+    def read(self, register, count=1):
+        buffer = bytearray(count)
+        while not self.i2c.try_lock():
+            pass
+        try:
+            self.i2c.writeto_then_readfrom(self.address, bytes((register,)), buffer)
+        finally:
+            self.i2c.unlock()
+        return bytes(buffer)
+
+    # Frequency of the prescaler as reported by adafruit_pca9685 (see the header)
+    @property
+    def frequency(self):
+        return self.reference_clock_speed / 4096.0 / self.prescale
+
+    # PWM frequency of the outputs (datasheet)
+    @property
+    def output_frequency(self):
+        return self.reference_clock_speed / 4096.0 / (self.prescale + 1)
+
+    # The prescaler can only be written in the sleep mode, so all outputs stop for a moment; nothing is sent when
+    # the frequency gives the current prescaler
+    @frequency.setter
+    def frequency(self, frequency):
+        prescale = int(self.reference_clock_speed / 4096.0 / frequency + 0.5)
+        if not 3 <= prescale <= 0xFF:
+            raise ValueError(f"PWM frequency {frequency} Hz is out of range")
+        if prescale == self.prescale:
+            return
+        mode = self.read(MODE1)[0] & ~RESTART & 0xFF
+        self.write(MODE1, bytes((mode | SLEEP,)))
+        self.write(PRESCALE, bytes((prescale,)))
+        self.write(MODE1, bytes((mode & ~SLEEP,)))
+        time.sleep(OSCILLATOR_DELAY)
+        self.write(MODE1, bytes((mode & ~SLEEP | RESTART | AI,)))
+        self.prescale = prescale
+
+    # 16-bit duty cycles of all channels in the shadow copy (no transaction)
+    @property
+    def duty_cycles(self):
+        return duty_values(self.shadow)
+
+    # 16-bit duty cycles of the consecutive channels first, first + 1, ... in one transaction, changed or not
+    def write_duty_cycles(self, values, first=0):
+        values = list(values)
+        if first < 0 or first + len(values) > CHANNELS:
+            raise IndexError(f"channels {first}...{first + len(values) - 1} do not exist")
+        if values:
+            data = b"".join(channel_bytes(int(value)) for value in values)
+            self.write(LED0_ON_L + 4 * first, data)
+            self.shadow[4 * first:4 * first + len(data)] = data
+
+    # New 16-bit duty cycles (channel -> value, or a sequence from the channel 0); only the registers that differ
+    # from the shadow copy are sent. atomic: one transaction from the first to the last changed register, so all
+    # outputs change together; otherwise the changed runs separated by more than MERGE_GAP unchanged registers are
+    # separate transactions. Returns the number of transactions.
+    def update(self, values, atomic=True):
+        values = values if isinstance(values, dict) else dict(enumerate(values))
+        image = bytearray(self.shadow)
+        for channel, value in values.items():
+            if not 0 <= channel < CHANNELS:
+                raise IndexError(f"channel {channel} does not exist")
+            image[4 * channel:4 * channel + 4] = channel_bytes(int(value))
+        changed = [i for i in range(len(image)) if image[i] != self.shadow[i]]
+        runs = []
+        for i in changed:
+            if runs and (atomic or i - runs[-1][1] <= MERGE_GAP + 1):
+                runs[-1][1] = i
+            else:
+                runs.append([i, i])
+        for first, last in runs:
+            self.write(LED0_ON_L + first, image[first:last + 1])
+        self.shadow = image
+        return len(runs)
+
+    def set_duty_cycle(self, channel, value):
+        self.update({channel: value})
+
+    # Same 16-bit duty cycle of all channels (ALL_LED registers, one transaction)
+    def set_all(self, value):
+        data = channel_bytes(int(value))
+        self.write(ALL_LED_ON_L, data)
+        self.shadow = bytearray(data * CHANNELS)
+
+    # 16-bit duty cycles of count channels from first, read from the chip in one transaction
+    def read_duty_cycles(self, first=0, count=CHANNELS):
+        return duty_values(self.read(LED0_ON_L + 4 * first, 4 * count))
+
+
+# I2C bus without hardware: the 256 registers of every PCA9685 address, with the auto-increment of MODE1 and the
+# ALL_LED registers. transactions counts the writeto and writeto_then_readfrom calls and written the bytes sent;
+# log keeps (address, bytes) of every write transaction.
+class MockI2C:
+    def __init__(self, addresses=(0x40,), latency=0.0):
+        self.registers = {address: bytearray(256) for address in addresses}
+        for registers in self.registers.values():
+            registers[MODE1], registers[PRESCALE] = MODE1_RESET, PRESCALE_RESET
+        self.latency = latency  # s per transaction, e.g. about 0.001 for a USB round trip
+        self.locked = False
+        self.transactions = 0
+        self.written = 0
+        self.log = []
+
+    def try_lock(self):
+        if self.locked:
+            return False
+        self.locked = True
+        return True
+
+    def unlock(self):
+        self.locked = False
+
+    def scan(self):
+        return sorted(self.registers)
+
+    def chip(self, address):
+        if address not in self.registers:
+            raise OSError(f"no I2C device at the address {address:#04x}")
+        return self.registers[address]
+
+    def transaction(self, data):
+        self.transactions += 1
+        self.written += len(data)
+        if self.latency:
+            time.sleep(self.latency)
+
+    def writeto(self, address, buffer, *, start=0, end=None):
+        data = bytes(buffer[start:end])
+        registers = self.chip(address)
+        self.transaction(data)
+        self.log.append((address, data))
+        register = data[0]
+        for value in data[1:]:
+            registers[register] = value
+            if ALL_LED_ON_L <= register < ALL_LED_ON_L + 4:
+                registers[LED0_ON_L + register - ALL_LED_ON_L:LED0_ON_L + 4 * CHANNELS:4] = bytes((value,)) * CHANNELS
+            if not registers[MODE1] & AI:
+                break  # without auto-increment only the first register is written
+            register = (register + 1) & 0xFF
+
+    def writeto_then_readfrom(self, address, buffer_out, buffer_in, *, out_start=0, out_end=None, in_start=0,
+                              in_end=None):
+        registers = self.chip(address)
+        self.transaction(bytes(buffer_out[out_start:out_end]))
+        register = buffer_out[out_start]
+        in_end = len(buffer_in) if in_end is None else in_end
+        for i in range(in_start, in_end):
+            buffer_in[i] = registers[register]
+            if registers[MODE1] & AI:
+                register = (register + 1) & 0xFF
+
+
+if __name__ == "__main__":
+    # Transactions of a full shim pattern (frequency and 16 duty cycles) on the emulated bus
+    pattern = [duty_code(ratio) for ratio in (0.1 * (i % 10) for i in range(CHANNELS))]
+    bus = MockI2C()
+    pca = PCA9685(bus)
+    pca.frequency = 1500
+    transactions, written = bus.transactions, bus.written
+    pca.write_duty_cycles(pattern)
+    transactions, written = bus.transactions - transactions, bus.written - written
+    print(f"frequency {pca.frequency:.2f} Hz; {CHANNELS} channels: {written} bytes in {transactions} transaction(s) "
+          f"instead of {4 * CHANNELS} register writes")
+    assert pca.read_duty_cycles() == [duty_value(*pwm_counts(value)) for value in pattern]
+
+    # A small shim correction of two channels and the same frequency again
+    transactions, written = bus.transactions, bus.written
+    pca.frequency = 1500
+    pca.update({3: pattern[3] + 0x100, 9: pattern[9] - 0x100})
+    transactions, written = bus.transactions - transactions, bus.written - written
+    print(f"correction of 2 channels: {written} bytes in {transactions} transaction(s)")
+    assert pca.read_duty_cycles() == pca.duty_cycles
@@ -0,0 +1,152 @@
+#
+# Fan-out of a coil profile to many PCA9685 boards on one or several I2C adapters (e.g. MCP2221), so that the
+# M = L/w coils of an optimisation can be driven by one program.
+# The channel map gives the adapter, the board address (0x40...0x7F without the All Call address 0x70) and the
+# channel 0...15 of every coil. linear_map puts 16 consecutive coils on a board and deals the boards to the adapters
+# in turn, so all buses carry the same load. The transactions of one bus follow each other, the buses are driven at
+# the same time by a thread pool with one thread per adapter, so updating the whole stack takes about as long as
+# updating the boards of one adapter. Every board is updated by PCA9685.update: only the changed registers, in one
+# transaction per board (the boards of different buses do not change at exactly the same moment).
+#
+# Example:
+#   buses = [busio.I2C(...), ...]                     one bus object per adapter
+#   with PWMStack(buses, linear_map(200, adapters=len(buses))) as stack:
+#       stack.frequency = 1500
+#       stack.update_ratios(duty_ratios)              200 duty cycle ratios 0...1, one per coil
+#   python PWMStack.py --coils 200 --adapters 4 --latency 0.001      timing on emulated buses (MockI2C)
+#
+
+import csv
+import time
+import argparse
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from PCA9685 import PCA9685, MockI2C, CHANNELS, REFERENCE_CLOCK, duty_code, duty_value, pwm_counts
+
+ALL_CALL = 0x70  # LED All Call address: all boards answer it after the power-on
+ADDRESSES = tuple(address for address in range(0x40, 0x80) if address != ALL_CALL)
+
+
+# Place of a coil: adapter (index of the bus), board address and channel
+@dataclass(frozen=True)
+class Channel:
+    adapter: int
+    address: int
+    channel: int
+
+# Coil k on the board k // 16, channel k % 16; the boards are dealt to the adapters in turn
+def linear_map(coils, adapters=1, addresses=ADDRESSES):
+    boards = -(-coils // CHANNELS)
+    if boards > adapters * len(addresses):
+        raise ValueError(f"{coils} coils need {boards} boards, {adapters} adapter(s) have {adapters * len(addresses)}")
+    return [Channel(adapter=(k // CHANNELS) % adapters, address=addresses[(k // CHANNELS) // adapters],
+                    channel=k % CHANNELS) for k in range(coils)]
+
+# Channel map from a CSV file with the columns coil, adapter, address (e.g. 0x41) and channel
+def load_map(filename):
+    with open(filename, "r", newline="") as file:
+        rows = sorted((int(row['coil']), Channel(int(row['adapter']), int(row['address'], 0), int(row['channel'])))
+                      for row in csv.DictReader(file))
+    if [coil for coil, _ in rows] != list(range(len(rows))):
+        raise ValueError(f"the coils of {filename} are not numbered 0...{len(rows) - 1}")
+    return [channel for _, channel in rows]
+
+def save_map(filename, channel_map):
+    with open(filename, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(("coil", "adapter", "address", "channel"))
+        writer.writerows((coil, c.adapter, f"{c.address:#04x}", c.channel) for coil, c in enumerate(channel_map))
+
+
+class PWMStack:
+    def __init__(self, buses, channel_map, reference_clock_speed=REFERENCE_CLOCK):
+        self.buses = list(buses)
+        self.map = list(channel_map)
+        places = set()
+        self.groups = {}  # adapter -> address -> list of (coil, channel)
+        for coil, c in enumerate(self.map):
+            if (c.adapter, c.address, c.channel) in places:
+                raise ValueError(f"coil {coil}: channel {c.channel} of the board {c.address:#04x} on the adapter "
+                                 f"{c.adapter} is used twice")
+            if not 0 <= c.adapter < len(self.buses) or c.address not in ADDRESSES or not 0 <= c.channel < CHANNELS:
+                raise ValueError(f"coil {coil}: invalid place {c}")
+            places.add((c.adapter, c.address, c.channel))
+            self.groups.setdefault(c.adapter, {}).setdefault(c.address, []).append((coil, c.channel))
+        self.pool = ThreadPoolExecutor(max_workers=max(1, len(self.groups)))
+        self.boards = {}  # (adapter, address) -> PCA9685
+        for boards in self.run(lambda adapter, addresses: {(adapter, address): PCA9685(
+                self.buses[adapter], address, reference_clock_speed) for address in addresses}):
+            self.boards.update(boards)
+
+    # function(adapter, {address: [(coil, channel), ...]}) for every adapter in its thread; the list of the results
+    def run(self, function):
+        futures = [self.pool.submit(function, adapter, addresses) for adapter, addresses in self.groups.items()]
+        return [future.result() for future in futures]
+
+    @property
+    def coils(self):
+        return len(self.map)
+
+    @property
+    def frequency(self):
+        return next(iter(self.boards.values())).frequency if self.boards else None
+
+    # Same PWM frequency of all boards (only the boards with another prescaler are reprogrammed)
+    @frequency.setter
+    def frequency(self, frequency):
+        def adapter_frequency(adapter, addresses):
+            for address in addresses:
+                self.boards[adapter, address].frequency = frequency
+        self.run(adapter_frequency)
+
+    # 16-bit duty cycles of all coils (sequence of length coils); returns the number of the transactions
+    def update(self, values, atomic=True):
+        if len(values) != self.coils:
+            raise ValueError(f"{len(values)} duty cycles for {self.coils} coils")
+        def adapter_update(adapter, addresses):
+            return sum(self.boards[adapter, address].update({channel: values[coil] for coil, channel in entries},
+                                                            atomic) for address, entries in addresses.items())
+        return sum(self.run(adapter_update))
+
+    def update_ratios(self, ratios, atomic=True):
+        return self.update([duty_code(ratio) for ratio in ratios], atomic)
+
+    # 16-bit duty cycles of all coils in the shadow copies of the boards
+    @property
+    def duty_cycles(self):
+        values = [0] * self.coils
+        for (adapter, address), board in self.boards.items():
+            duty_cycles = board.duty_cycles
+            for coil, channel in self.groups[adapter][address]:
+                values[coil] = duty_cycles[channel]
+        return values
+
+    def close(self):
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time of a full update of a coil stack on emulated I2C buses")
+    parser.add_argument("--coils", type=int, default=200)
+    parser.add_argument("--adapters", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.001, help="seconds per I2C transaction (USB round trip)")
+    args = parser.parse_args()
+
+    buses = [MockI2C(ADDRESSES, latency=args.latency) for _ in range(args.adapters)]
+    channel_map = linear_map(args.coils, args.adapters)
+    with PWMStack(buses, channel_map) as stack:
+        stack.frequency = 1500
+        for ratio in (0.25, 0.5):
+            start = time.perf_counter()
+            transactions = stack.update_ratios([ratio] * stack.coils)
+            elapsed = time.perf_counter() - start
+            print(f"{stack.coils} coils on {len(stack.boards)} boards, {args.adapters} adapter(s): {transactions} "
+                  f"transactions in {1000.0 * elapsed:.1f} ms ({1000.0 * args.latency * transactions:.1f} ms "
+                  f"one after another)")
+        assert stack.duty_cycles == [duty_value(*pwm_counts(duty_code(0.5)))] * stack.coils
@@ -2,60 +2,54 @@
 # The program with GUI to control the electronic driver for the shimming coils (four channels).
 # PWM driver with the current booster.
 # Connect Blinka USB-I2C adapter to PC.
+# The changed duty cycles of all channels are written in one I2C transaction and the PWM frequency is only
+# reprogrammed when it changes (PCA9685.py keeps a copy of the registers). Set the environment variable
+# SHIM_MOCK_I2C=1 to run the program without the adapter (emulated PCA9685, see MockI2C).
+# The settings are appended to the journal duty_cycle.jsonl (Journal.py) and the last ones are shown at the start;
+# the old duty_cycle.log is read if there is no journal yet.
 #
 # Yujie Zhao, University of St. Andrews, Scotland, 30.07.2023
 #
 
 import os
-import busio
-import board
-import adafruit_pca9685
 import tkinter as tk
 from tkinter import ttk
 import logging
-
-# Set BLINKA_MCP2221 environment variable to enable MCP2221 support
-os.environ['BLINKA_MCP2221'] = '1'
+from PCA9685 import PCA9685, MockI2C, duty_code
+from Journal import Journal
 
 # Create the I2C bus interface.
-i2c_bus = busio.I2C(board.SCL, board.SDA)
+if os.environ.get('SHIM_MOCK_I2C'):
+    i2c_bus = MockI2C()
+else:
+    # Set BLINKA_MCP2221 environment variable to enable MCP2221 support (before board is imported)
+    os.environ['BLINKA_MCP2221'] = '1'
+    import busio
+    import board
+    i2c_bus = busio.I2C(board.SCL, board.SDA)
 
 # Specify the PCA9685 address (0x40) when creating the instance.
-pca = adafruit_pca9685.PCA9685(i2c_bus, address=0x40)
+pca = PCA9685(i2c_bus, address=0x40)
 
 # Set the default frequency to 1500 Hz
 pca.frequency = 1500
 
-# Function to update the duty cycle for a channel based on the user input
-def update_duty_cycle(channel):
-    try:
-        duty_cycle = float(duty_entries[channel - 1].get())
-        pca.channels[channel - 1].duty_cycle = int(duty_cycle * 0xFFFF)  # Convert to 16-bit value
-
-        # Log the duty cycle change
-        logging.info(f"Channel {channel} duty cycle set to {duty_cycle}")
-
-        # Write the new value to the log file
-        with open('duty_cycle.log', 'a') as log_file:
-            log_file.write(f"Channel {channel} duty cycle set to {duty_cycle}\n")
-
-    except ValueError:
-        pass  # If the user enters an invalid value, ignore it
+# Open the journal of the settings (recovers the last state)
+journal = Journal('duty_cycle.jsonl', legacy='duty_cycle.log')
 
 # Function to update the PWM frequency based on the user input
 def update_pwm_frequency():
     try:
         frequency = float(freq_entry.get())
 
-        # Write the PWM frequency change to the log file
-        logging.info(f"PWM frequency set to {frequency:.2f} Hz")
-
         # Set the new PWM frequency directly to the PCA9685 instance
+        previous = pca.frequency
         pca.frequency = frequency
 
-        # Write the new value to the log file with up to two decimal places
-        with open('duty_cycle.log', 'a') as log_file:
-            log_file.write(f"PWM frequency set to {frequency:.2f} Hz\n")
+        # Write a changed frequency to the log file and the frequency of the prescaler to the journal
+        if pca.frequency != previous or journal.state['frequency'] is None:
+            logging.info(f"PWM frequency set to {frequency:.2f} Hz")
+            journal.frequency(pca.frequency)
 
     except ValueError:
         pass  # If the user enters an invalid value, ignore it
@@ -63,38 +57,49 @@ def update_pwm_frequency():
 # Function to apply the updated duty cycles and PWM frequency to PCA9685
 def apply_settings():
     update_pwm_frequency()
-    for channel in range(1, 17):
-        update_duty_cycle(channel)
 
-    # Fully rewrite the log file with the new values
-    with open('duty_cycle.log', 'w') as log_file:
-        log_file.write(f"PWM frequency set to {pca.frequency:.2f} Hz\n")
-        for channel in range(1, 17):
-            duty_cycle = pca.channels[channel - 1].duty_cycle / 0xFFFF
-            log_file.write(f"Channel {channel} duty cycle set to {duty_cycle:.2f}\n")
-
-    # Read default values from the log file (if it exists)
+    # Channels with an invalid entry keep their current duty cycle
+    previous = pca.duty_cycles
+    values = list(previous)
+    entered = {}
+    for channel in range(1, 17):
+        try:
+            duty_cycle = float(duty_entries[channel - 1].get())
+            values[channel - 1] = duty_code(duty_cycle)
+            entered[channel] = duty_cycle
+        except ValueError:
+            pass  # If the user enters an invalid value, ignore it
+
+    # The changed channels in one I2C transaction
+    pca.update(values)
+
+    # Only the channels whose registers changed (or which are not in the journal yet) are logged and journaled
+    current = pca.duty_cycles
+    for channel, duty_cycle in entered.items():
+        if current[channel - 1] != previous[channel - 1] or channel not in journal.state['duty']:
+            logging.info(f"Channel {channel} duty cycle set to {duty_cycle}")
+            journal.duty(channel, duty_cycle)
+
+    # Snapshot of the whole state in the journal (written to the disk)
+    journal.snapshot(source="apply")
+
+    # Show the recorded values
     read_default_values()
 
 # Function to stop the program
 def stop_program():
     root.quit()
 
-# Function to read default values from the log file
+# Function to read default values from the state of the journal
 def read_default_values():
-    if os.path.exists('duty_cycle.log'):
-        with open('duty_cycle.log', 'r') as log_file:
-            lines = log_file.readlines()
-            for line in lines:
-                if "duty cycle" in line:
-                    channel = int(line.split()[1])
-                    duty_cycle = float(line.split()[-1])
-                    duty_entries[channel - 1].delete(0, tk.END)
-                    duty_entries[channel - 1].insert(0, str(duty_cycle))
-                elif "PWM frequency" in line and not freq_entry.get():
-                    frequency = float(line.split()[-2])
-                    freq_entry.delete(0, tk.END)
-                    freq_entry.insert(0, f"{frequency:.2f}")
+    for channel, duty_cycle in journal.state['duty'].items():
+        if 1 <= channel <= len(duty_entries):
+            duty_entries[channel - 1].delete(0, tk.END)
+            duty_entries[channel - 1].insert(0, str(duty_cycle))
+    frequency = journal.state['frequency']
+    if frequency is not None and not freq_entry.get():
+        freq_entry.delete(0, tk.END)
+        freq_entry.insert(0, f"{frequency:.2f}")
 
 # GUI setup
 root = tk.Tk()
@@ -137,4 +142,5 @@ stop_button.grid(row=19, column=0, columnspan=2)
 read_default_values()
 
 # Run the GUI main loop
-root.mainloop()
\ No newline at end of file
+root.mainloop()
+journal.close()
\ No newline at end of file
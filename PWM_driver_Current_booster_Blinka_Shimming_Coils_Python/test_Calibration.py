@@ -0,0 +1,54 @@
+#
+# Tests of the calibration tables: the knots of a sweep, the table of every coil and the signed currents of a profile.
+# Run with: python -m pytest test_Calibration.py
+#
+
+import numpy as np
+import pytest
+from Calibration import Calibration, monotone_table, split_sign
+
+
+# Linear tables of 4 channels: 0...(c + 1) A over the duty ratios 0...1
+def calibration():
+    duty = np.linspace(0.0, 1.0, 11)
+    return Calibration([(duty, (c + 1) * duty) for c in range(4)])
+
+
+def test_table_k_for_value_k():
+    np.testing.assert_allclose(calibration().duty([0.5, 1.0, 1.5, 2.0]), 0.5)
+
+def test_more_coils_than_tables():
+    with pytest.raises(ValueError, match="tables="):
+        calibration().duty(np.full(10, 0.5))
+
+def test_explicit_tables():
+    tables = np.arange(10) % 4
+    currents = 0.25 * (tables + 1)
+    np.testing.assert_allclose(calibration().duty(currents, tables=tables), 0.25)
+    np.testing.assert_allclose(calibration().duty(np.full(10, 0.5), tables=0), 0.5)
+    with pytest.raises(IndexError, match="tables="):
+        calibration().duty(currents, tables=4)
+
+def test_signed_currents():
+    currents = np.array([0.5, -0.5, 1.0, -1.0])
+    with pytest.raises(ValueError, match="split_sign"):
+        calibration().duty(currents)
+    magnitude, direction = split_sign(currents)
+    assert list(direction) == [1, -1, 1, -1]
+    np.testing.assert_allclose(direction * calibration().current(calibration().duty(magnitude)), currents)
+
+def test_repeated_duty_ratios():
+    duty = [0.0, 0.25, 0.25, 0.5, 0.5, 0.5, 0.75, 1.0]
+    current = [0.0, 0.2, 0.3, 0.5, 0.4, 0.6, 0.75, 1.0]
+    knots, currents = monotone_table(duty, current)
+    assert np.all(np.diff(knots) > 0.0) and np.all(np.diff(currents) > 0.0)
+    np.testing.assert_allclose(knots, [0.0, 0.25, 0.5, 0.75, 1.0])
+    np.testing.assert_allclose(currents, [0.0, 0.25, 0.5, 0.75, 1.0])
+
+def test_repeated_duty_ratios_pooled():
+    # the mean 0.6 of the three measurements at 0.5 exceeds 0.55 at 0.75: the two ratios are pooled by their weights
+    knots, currents = monotone_table([0.0, 0.5, 0.5, 0.5, 0.75, 1.0], [0.0, 0.5, 0.6, 0.7, 0.55, 1.0])
+    np.testing.assert_allclose(knots, [0.0, 0.5625, 1.0])
+    np.testing.assert_allclose(currents, [0.0, 0.5875, 1.0])
+    calibration = Calibration([(knots, currents)])
+    np.testing.assert_allclose(calibration.current(calibration.duty([0.3], tables=0), tables=0), 0.3)
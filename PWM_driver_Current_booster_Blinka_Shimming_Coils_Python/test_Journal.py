@@ -0,0 +1,59 @@
+#
+# Tests of the journal: recovery of the last state, also after a crash cut the last line.
+# Run with: python -m pytest test_Journal.py
+#
+
+import os
+import Journal
+from Journal import Journal as JournalFile, recover
+
+
+def write_journal(filename):
+    with JournalFile(filename, legacy=None) as journal:
+        journal.frequency(1500.0)
+        journal.duty(1, 0.25)
+        journal.duty(2, 0.5)
+        journal.snapshot()
+        journal.duty(3, 0.75)
+        journal.snapshot(source="apply")
+    return dict(frequency=1500.0, duty={1: 0.25, 2: 0.5, 3: 0.75})
+
+# Removes the last count bytes of the file
+def cut(filename, count):
+    with open(filename, "r+b") as file:
+        file.truncate(os.path.getsize(filename) - count)
+
+
+def test_recover(tmp_path):
+    filename = str(tmp_path / "journal.jsonl")
+    state = write_journal(filename)
+    assert recover(filename) == state
+
+def test_recover_cut_snapshot(tmp_path):
+    filename = str(tmp_path / "journal.jsonl")
+    state = write_journal(filename)
+    cut(filename, 20)  # the last snapshot does not parse any more
+    assert recover(filename) == state  # previous snapshot and the duty record after it
+
+def test_recover_cut_record(tmp_path):
+    filename = str(tmp_path / "journal.jsonl")
+    write_journal(filename)
+    with JournalFile(filename, legacy=None) as journal:
+        journal.duty(4, 1.0)
+    cut(filename, 10)
+    assert recover(filename) == dict(frequency=1500.0, duty={1: 0.25, 2: 0.5, 3: 0.75})
+
+def test_cut_snapshot_across_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(Journal, "BLOCK", 16)  # snapshots and records spread over many blocks
+    filename = str(tmp_path / "journal.jsonl")
+    state = write_journal(filename)
+    cut(filename, 20)
+    assert recover(filename) == state
+
+def test_append_after_cut(tmp_path):
+    filename = str(tmp_path / "journal.jsonl")
+    write_journal(filename)
+    cut(filename, 20)
+    with JournalFile(filename, legacy=None) as journal:
+        journal.duty(5, 0.1)
+    assert recover(filename) == dict(frequency=1500.0, duty={1: 0.25, 2: 0.5, 3: 0.75, 5: 0.1})
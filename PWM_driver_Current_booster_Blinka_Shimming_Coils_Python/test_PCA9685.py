@@ -0,0 +1,78 @@
+#
+# Tests of the register-level driver on the emulated bus (MockI2C): burst writes, register addresses, encodings of
+# the duty cycles, diff updates and the frequency sequence.
+# Run with: python -m pytest test_PCA9685.py
+#
+
+import pytest
+from PCA9685 import (PCA9685, MockI2C, CHANNELS, MODE1, PRESCALE, LED0_ON_L, ALL_LED_ON_L, AI, SLEEP, RESTART,
+                     channel_bytes, duty_code)
+
+
+@pytest.fixture
+def pca(monkeypatch):
+    monkeypatch.setattr("PCA9685.OSCILLATOR_DELAY", 0.0)
+    chip = PCA9685(MockI2C())
+    chip.i2c.log.clear()
+    return chip
+
+def transactions(pca, action):
+    count = pca.i2c.transactions
+    action()
+    return pca.i2c.transactions - count
+
+
+def test_channel_registers():
+    assert [LED0_ON_L + 4 * channel for channel in (0, 1, 15)] == [0x06, 0x0A, 0x42]
+
+def test_encodings():
+    assert channel_bytes(0xFFFF) == bytes((0x00, 0x10, 0x00, 0x00))  # full on: bit 4 of ON_H
+    assert channel_bytes(0) == bytes((0x00, 0x00, 0x00, 0x00))  # full off: OFF = 0
+    assert channel_bytes(duty_code(0.5)) == bytes((0x00, 0x00, 0x00, 0x08))  # OFF = 2048 counts
+    with pytest.raises(ValueError):
+        duty_code(1.5)
+
+def test_burst_of_all_channels(pca):
+    values = [duty_code(k / CHANNELS) for k in range(CHANNELS)]
+    assert transactions(pca, lambda: pca.write_duty_cycles(values)) == 1
+    address, data = pca.i2c.log[-1]
+    assert address == 0x40 and data[0] == LED0_ON_L and len(data) == 1 + 4 * CHANNELS
+    registers = pca.i2c.registers[0x40]
+    for channel, value in enumerate(values):
+        assert registers[LED0_ON_L + 4 * channel:LED0_ON_L + 4 * channel + 4] == channel_bytes(value)
+    assert pca.read_duty_cycles() == pca.duty_cycles
+
+def test_full_on_and_off(pca):
+    pca.update({0: 0xFFFF, 1: 0})
+    assert pca.read_duty_cycles(0, 2) == [0xFFFF, 0]
+    assert pca.i2c.registers[0x40][LED0_ON_L + 1] == 0x10
+
+def test_update_sends_changed_registers(pca):
+    pca.write_duty_cycles([duty_code(0.5)] * CHANNELS)
+    assert transactions(pca, lambda: pca.update([duty_code(0.5)] * CHANNELS)) == 0
+    assert pca.update({3: duty_code(0.25), 9: duty_code(0.75)}) == 1  # atomic: one burst from channel 3 to 9
+    _, data = pca.i2c.log[-1]
+    assert data[0] == LED0_ON_L + 4 * 3 + 3 and len(data) == 1 + 4 * 6 + 1  # OFF_H of 3 ... OFF_H of 9
+    assert pca.update({3: duty_code(0.5), 9: duty_code(0.5)}, atomic=False) == 2
+    assert pca.read_duty_cycles() == pca.duty_cycles
+
+def test_set_all(pca):
+    assert transactions(pca, lambda: pca.set_all(duty_code(0.25))) == 1
+    assert pca.i2c.log[-1][1][0] == ALL_LED_ON_L
+    assert pca.read_duty_cycles() == [((duty_code(0.25) + 1) >> 4) << 4] * CHANNELS == pca.duty_cycles
+
+def test_frequency_sequence(pca):
+    pca.frequency = 1500
+    writes = [data for _, data in pca.i2c.log]
+    assert [data[0] for data in writes] == [MODE1, PRESCALE, MODE1, MODE1]
+    assert writes[0][1] & SLEEP  # sleep before the prescaler
+    assert writes[1][1] == 4  # round(25 MHz / 4096 / 1500), as adafruit_pca9685
+    assert not writes[2][1] & SLEEP
+    assert writes[3][1] & RESTART and writes[3][1] & AI
+    assert pca.frequency == pytest.approx(1525.88, abs=0.01)
+    assert pca.output_frequency == pytest.approx(1220.70, abs=0.01)
+    assert transactions(pca, lambda: setattr(pca, 'frequency', 1500)) == 0  # same prescaler: nothing sent
+
+def test_frequency_range(pca):
+    with pytest.raises(ValueError):
+        pca.frequency = 5000
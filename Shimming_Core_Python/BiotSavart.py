@@ -0,0 +1,208 @@
+#
+# Off-axis check of the on-axis spiral model: the B vector of the optimised spiral stack at any 3D points.
+# Every spiral of a result of the turns or current optimisation is discretised along the Archimedean spiral
+# r = gamma * theta + d/2 (see SpiralCoil.py) into straight segments, segments_per_turn per turn, and the field of the
+# segments is added up by the Biot-Savart law of a straight segment. The leads of the spirals are not modelled.
+# All spirals start at the same inner angle and have full turns, so the spiral m is the first n_m turns of one
+# master spiral moved to the height zm. Its field at the point (x, y, z) is I_m C(x, y, z - zm, n_m), where
+# C(..., n) is the field of the first n turns of the master spiral for the unit current. C is calculated for all n
+# at once (cumulative sum of the field of each turn) and only once for every distinct relative point (x, y, |z - zm|):
+# the spiral is flat, so below its plane Bz is the same and Bx, By change their sign. A relative point is only
+# evaluated for the turns of the longest spiral seen from it.
+# As in the Toeplitz coupling matrix of the current optimisation, the relative heights of the grid points on the
+# lattice of the spiral pitch w (GridPoints with LatticeHeights) are shared by the spirals: the number of the
+# evaluated segments drops from M N to (M + N) per column of N points.
+# The points are processed in chunks limited by max_bytes of temporary memory, spread over a process pool.
+# On the axis the field reproduces Eq. (32) (see AxisCheck).
+#
+# Examples:
+#   stack = ResultStack(TurnsProfile(...))
+#   B = BiotSavart(GridPoints(x, y, LatticeHeights(L0, w, 4)), stack, workers=8)      P x 3 array in Tesla
+#   python BiotSavart.py turns_20240101-120000.shim --radius 0.005 --shape 21 21 --subdivide 4 --workers 8
+#
+
+import os
+import argparse
+from types import SimpleNamespace
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from SpiralCoil import spiral_geometry, adjusted_radius, pi, mu0
+from Bundle import Bundle, save_bundle
+
+SEGMENTS_PER_TURN = 64
+MAX_BYTES = 256 * 2**20  # temporary memory of one process
+PAIR_BYTES = 16 * 8  # temporary float64 values for one point and one segment
+RESOLUTION = 1.0e-12  # m; relative points closer than this are the same point
+
+
+# Stack of spirals sharing the inner angle theta1: spiral m at the height zm[m] has turns[m] full turns and the
+# current currents[m] (counterclockwise, i.e. positive Bz on the axis, for a positive current)
+@dataclass
+class SpiralStack:
+    zm: np.ndarray  # heights of the spirals (m)
+    turns: np.ndarray  # full turns of each spiral (non-negative integers)
+    currents: np.ndarray  # current of each spiral (A)
+    gamma: float
+    d: float
+    theta1: float
+    segments_per_turn: int = SEGMENTS_PER_TURN
+
+    # Vertices of the first n turns of the master spiral at the height 0: (n * segments_per_turn + 1) x 3
+    def master(self, n):
+        theta = self.theta1 + (2.0 * pi / self.segments_per_turn) * np.arange(n * self.segments_per_turn + 1)
+        r = self.gamma * theta + self.d / 2.0
+        return np.column_stack((r * np.cos(theta), r * np.sin(theta), np.zeros_like(theta)))
+
+    @property
+    def segments(self):
+        return int(np.sum(self.turns[self.currents != 0.0])) * self.segments_per_turn
+
+# Stack of a TurnsResult (full turns, the sign of the turns is the direction of the current I) or of a CurrentResult
+# (all spirals up to the external radius Rs, the currents of the optimisation)
+def ResultStack(result, segments_per_turn=SEGMENTS_PER_TURN):
+    p = result.parameters
+    geometry = spiral_geometry(p['d0'], p['delta'], p['R'])
+    zm = np.asarray(result.zm, dtype=float)
+    if hasattr(result, 'current'):
+        Rs = adjusted_radius(p['Rs'], geometry.d)
+        turns = np.full(len(zm), int(round((Rs - geometry.R) / geometry.d)))
+        currents = np.asarray(result.current, dtype=float)
+    else:
+        turns = np.abs(np.asarray(result.turns, dtype=int))
+        currents = p['I'] * np.sign(np.asarray(result.turns, dtype=float))
+    return SpiralStack(zm, turns, currents, geometry.gamma, geometry.d, geometry.theta1, segments_per_turn)
+
+
+# Field of every turn of the polyline (vertices, segments_per_turn segments per turn) at the points for the unit
+# current: P x turns x 3. For the segment from the point offsets a to b (|a| = na, |b| = nb):
+# B = mu0 / (4 pi) (a x b) (na + nb) / (na nb (na nb + a.b))
+def turn_fields(points, vertices, segments_per_turn):
+    rx, ry, rz = (vertices[np.newaxis, :, i] - points[:, i, np.newaxis] for i in range(3))
+    norm = (rx**2 + ry**2 + rz**2)**0.5
+    ax, ay, az, na = rx[:, :-1], ry[:, :-1], rz[:, :-1], norm[:, :-1]
+    bx, by, bz, nb = rx[:, 1:], ry[:, 1:], rz[:, 1:], norm[:, 1:]
+    product = na * nb
+    factor = (mu0 / (4.0 * pi)) * (na + nb) / (product * (product + ax * bx + ay * by + az * bz))
+    shape = (len(points), -1, segments_per_turn)
+    return np.stack([(factor * (ay * bz - az * by)).reshape(shape).sum(axis=2),
+                     (factor * (az * bx - ax * bz)).reshape(shape).sum(axis=2),
+                     (factor * (ax * by - ay * bx)).reshape(shape).sum(axis=2)], axis=2)
+
+# C for the relative points: P x (turns + 1) x 3, the field of the first n turns of the master spiral for n = 0...
+# need (in decreasing order) is the number of turns required at each point; C is zero beyond it.
+def prefix_fields(points, stack, need, max_bytes=MAX_BYTES):
+    turns = int(need[0]) if len(need) else 0
+    C = np.zeros((len(points), turns + 1, 3))
+    spt = stack.segments_per_turn
+    pairs = max(spt, max_bytes // PAIR_BYTES)
+    block_turns = max(1, min(turns, pairs // spt))
+    vertices = stack.master(turns)
+    for first in range(0, turns, block_turns):
+        last = min(first + block_turns, turns)
+        count = np.count_nonzero(need > first)  # points needing some of these turns
+        block_points = max(1, pairs // ((last - first) * spt))
+        for start in range(0, count, block_points):
+            rows = slice(start, min(start + block_points, count))
+            C[rows, first + 1:last + 1] = turn_fields(points[rows], vertices[first * spt:last * spt + 1], spt)
+    np.cumsum(C, axis=1, out=C)
+    return C
+
+# Field of the stack at a chunk of points: the distinct relative points are evaluated once. A chunk whose prefix
+# fields would exceed max_bytes is split in two.
+def chunk_field(points, stack, max_bytes=MAX_BYTES):
+    active = stack.currents != 0.0
+    zm, turns, currents = stack.zm[active], stack.turns[active], stack.currents[active]
+    if len(zm) == 0 or len(points) == 0:
+        return np.zeros((len(points), 3))
+    relative = np.repeat(points[:, np.newaxis, :], len(zm), axis=1)
+    relative[:, :, 2] -= zm
+    sign = np.where(relative[:, :, 2] < 0.0, -1.0, 1.0)
+    relative[:, :, 2] = np.abs(relative[:, :, 2])
+    keys = np.round(relative.reshape(-1, 3) / RESOLUTION).astype(np.int64)
+    keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+    if len(keys) * (np.max(turns) + 1) * 24 > max_bytes // 2 and len(points) > 1:
+        half = len(points) // 2
+        return np.concatenate((chunk_field(points[:half], stack, max_bytes),
+                               chunk_field(points[half:], stack, max_bytes)))
+    # Relative points in the decreasing order of the turns they need
+    need = np.zeros(len(keys), dtype=int)
+    np.maximum.at(need, inverse.ravel(), np.broadcast_to(turns, (len(points), len(zm))).ravel())
+    order = np.argsort(-need, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    C = prefix_fields(keys[order] * RESOLUTION, stack, need[order], max_bytes // 2)
+    G = C[rank[inverse.reshape(len(points), len(zm))], turns[np.newaxis, :]]
+    G[:, :, :2] *= sign[:, :, np.newaxis]
+    return np.einsum('pmk,m->pk', G, currents)
+
+
+_stack = None  # stack shared with the worker processes
+_max_bytes = MAX_BYTES
+
+def init_worker(stack, max_bytes):
+    global _stack, _max_bytes
+    _stack, _max_bytes = stack, max_bytes
+
+def worker_field(points):
+    return chunk_field(points, _stack, _max_bytes)
+
+# B vector (T) at the points (P x 3) in chunks of chunk_points consecutive points (whole columns of GridPoints share
+# their relative points); workers > 1 uses a process pool (None: all cores), max_bytes is the memory per process
+def BiotSavart(points, stack, max_bytes=MAX_BYTES, workers=1, chunk_points=4096):
+    points = np.ascontiguousarray(points, dtype=float).reshape(-1, 3)
+    workers = os.cpu_count() if workers is None else workers
+    chunks = [points[start:start + chunk_points] for start in range(0, len(points), chunk_points)]
+    if workers <= 1 or len(chunks) <= 1:
+        return np.concatenate([chunk_field(chunk, stack, max_bytes) for chunk in chunks] or [np.zeros((0, 3))])
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(stack, max_bytes)) as pool:
+        return np.concatenate(list(pool.map(worker_field, chunks)))
+
+
+# Points of the rectangular grid of the coordinate vectors x, y, z: (len(x) * len(y) * len(z)) x 3, z varying fastest
+def GridPoints(x, y, z):
+    X, Y, Z = np.meshgrid(x, y, z, indexing='ij')
+    return np.column_stack((X.ravel(), Y.ravel(), Z.ravel()))
+
+# Heights in [-L0/2, L0/2] on the lattice of the spiral pitch w divided by subdivide (the sampling points of the
+# optimisations for subdivide = 1)
+def LatticeHeights(L0, w, subdivide=1):
+    step = w / subdivide
+    count = int(L0 / (2.0 * step))
+    return step * np.arange(-count, count + 1)
+
+# On-axis Bz of the segments at the sampling points compared with the closed form of the result (error - b0):
+# returns the segment field and the largest difference relative to the largest closed-form induction
+def AxisCheck(result, stack, max_bytes=MAX_BYTES):
+    zq = np.asarray(result.zq, dtype=float)
+    Bz = chunk_field(np.column_stack((np.zeros_like(zq), np.zeros_like(zq), zq)), stack, max_bytes)[:, 2]
+    closed = np.asarray(result.error) - np.asarray(result.b0)
+    return Bz, np.max(np.abs(Bz - closed)) / (np.max(np.abs(closed)) or 1.0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Biot-Savart field of the spirals of a turns or currents bundle")
+    parser.add_argument("bundle", help="bundle of a turns or current optimisation (see Bundle.py)")
+    parser.add_argument("--radius", type=float, default=0.005, help="half width (m) of the grid across the axis")
+    parser.add_argument("--shape", type=int, nargs=2, default=(11, 11), help="grid points along x and y")
+    parser.add_argument("--subdivide", type=int, default=1, help="grid points along z per spiral pitch w")
+    parser.add_argument("--segments", type=int, default=SEGMENTS_PER_TURN, help="segments per turn")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (all cores by default)")
+    parser.add_argument("--memory", type=float, default=MAX_BYTES / 2**20, help="MiB of temporaries per process")
+    parser.add_argument("--output", default=None, help="bundle of the field (<bundle>_field.shim by default)")
+    args = parser.parse_args()
+
+    bundle = Bundle(args.bundle)
+    result = SimpleNamespace(parameters=bundle.parameters, **{name: np.asarray(bundle[name]) for name in bundle.keys()})
+    stack = ResultStack(result, args.segments)
+    max_bytes = int(args.memory * 2**20)
+    x = np.linspace(-args.radius, args.radius, args.shape[0])
+    y = np.linspace(-args.radius, args.radius, args.shape[1])
+    z = LatticeHeights(bundle.parameters['L0'], bundle.parameters['w'], args.subdivide)
+    B = BiotSavart(GridPoints(x, y, z), stack, max_bytes, args.workers)
+    _, axis_error = AxisCheck(result, stack, max_bytes)
+    output = args.output or os.path.splitext(args.bundle)[0] + "_field.shim"
+    save_bundle(output, 'field', dict(x=x, y=y, z=z, B=B.reshape(len(x), len(y), len(z), 3)),
+                parameters=bundle.parameters, results=dict(segments=stack.segments, axis_error=axis_error,
+                                                           source=args.bundle))
+    print(f"{len(B)} points, {stack.segments} segments, on-axis difference {axis_error:.2e}: {output}")
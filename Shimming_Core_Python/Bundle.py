@@ -0,0 +1,173 @@
+#
+# Self-describing binary bundle of the results of one run or of a whole sweep.
+# Layout of the file:
+#   8 bytes    magic b"SHIMBNDL"
+#   8 bytes    length of the header (little-endian unsigned)
+#   header     UTF-8 JSON: kind, parameters, results (scalars), provenance and the list of the arrays with their
+#              dtype, shape and offset from the start of the data
+#   data       the raw arrays, each starting at a multiple of ALIGNMENT bytes after the padded header
+# Only the header is read when a bundle is opened; every array is memory-mapped when it is first used, so tools
+# can open tens of thousands of bundles without loading their profiles.
+#
+# Example:
+#   save_bundle("run.shim", "turns", dict(zm=zm, turns=turns), parameters=parameters, results=dict(nfev=10))
+#   bundle = Bundle("run.shim"); bundle.parameters['w']; bundle['turns'][:10]
+#   python Bundle.py run.shim --csv run_csv     prints the header and writes every array to a CSV file
+# The result objects of the optimisations are stored by save_result and read back by load_result.
+#
+
+import os
+import sys
+import json
+import time
+import struct
+import platform
+import subprocess
+from dataclasses import fields
+import numpy as np
+
+MAGIC = b"SHIMBNDL"
+VERSION = 1
+ALIGNMENT = 64
+
+def aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+# New file name <prefix>_<date>-<time>.shim in the folder, so the runs do not overwrite each other
+def unique_name(prefix, folder="."):
+    stem = os.path.join(folder, time.strftime(f"{prefix}_%Y%m%d-%H%M%S"))
+    filename, count = stem + ".shim", 1
+    while os.path.exists(filename):
+        filename, count = f"{stem}_{count}.shim", count + 1
+    return filename
+
+# Where and with what the bundle was made; the commit is None outside a git checkout
+def provenance():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return dict(created=time.strftime("%Y-%m-%dT%H:%M:%S%z"), host=platform.node(), platform=platform.platform(),
+                python=platform.python_version(), numpy=np.__version__, commit=commit)
+
+# Plain JSON values of the numpy scalars in the parameters and results
+def json_value(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not a JSON value")
+
+
+# Writes the arrays (name -> array of a fixed-size dtype) and the JSON information to the file
+def save_bundle(filename, kind, arrays, parameters=None, results=None, **extra):
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    listing, offset = {}, 0
+    for name, array in arrays.items():
+        if array.dtype.hasobject:
+            raise TypeError(f"array '{name}' has the object dtype and cannot be stored")
+        listing[name] = dict(dtype=array.dtype.str, shape=list(array.shape), offset=offset)
+        offset = aligned(offset + array.nbytes)
+    header = dict(version=VERSION, kind=kind, parameters=parameters or {}, results=results or {},
+                  provenance=provenance(), arrays=listing, **extra)
+    text = json.dumps(header, default=json_value).encode()
+
+    folder = os.path.dirname(os.path.abspath(filename))
+    os.makedirs(folder, exist_ok=True)
+    temporary = filename + ".tmp"
+    with open(temporary, "wb") as file:
+        file.write(MAGIC + struct.pack("<Q", len(text)) + text)
+        start = aligned(file.tell())
+        for name, array in arrays.items():
+            file.seek(start + listing[name]['offset'])
+            file.write(array.tobytes())
+        file.truncate(start + offset)
+    os.replace(temporary, filename)
+    return filename
+
+
+class Bundle:
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{filename} is not a bundle")
+            length, = struct.unpack("<Q", file.read(8))
+            self.header = json.loads(file.read(length))
+        self.start = aligned(len(MAGIC) + 8 + length)
+        self.arrays = {}
+
+    kind = property(lambda self: self.header['kind'])
+    parameters = property(lambda self: self.header['parameters'])
+    results = property(lambda self: self.header['results'])
+    provenance = property(lambda self: self.header['provenance'])
+
+    def keys(self):
+        return self.header['arrays'].keys()
+
+    def __contains__(self, name):
+        return name in self.header['arrays']
+
+    # Read-only memory-mapped array
+    def __getitem__(self, name):
+        if name not in self.arrays:
+            entry = self.header['arrays'][name]
+            shape = tuple(entry['shape'])
+            if np.prod(shape) == 0:
+                self.arrays[name] = np.empty(shape, dtype=entry['dtype'])
+            else:
+                self.arrays[name] = np.memmap(self.filename, dtype=entry['dtype'], mode='r',
+                                              offset=self.start + entry['offset'], shape=shape)
+        return self.arrays[name]
+
+
+# Bundle of a result dataclass: its arrays, its scalar fields as the results and its parameters dictionary;
+# the other fields (e.g. the coupling kernel) are not stored
+def save_result(filename, kind, result, **extra):
+    arrays, results = {}, {}
+    for item in fields(result):
+        value = getattr(result, item.name)
+        if isinstance(value, np.ndarray):
+            arrays[item.name] = value
+        elif item.name != 'parameters' and (value is None or isinstance(value, (bool, int, float, str, np.generic))):
+            results[item.name] = value
+    return save_bundle(filename, kind, arrays, parameters=getattr(result, 'parameters', {}), results=results,
+                       **extra)
+
+# Result dataclass cls with the memory-mapped arrays of the bundle
+def load_result(filename, cls):
+    bundle = Bundle(filename)
+    names = {item.name for item in fields(cls)}
+    values = {name: bundle[name] for name in bundle.keys() if name in names}
+    values.update({name: value for name, value in bundle.results.items() if name in names})
+    if 'parameters' in names:
+        values['parameters'] = bundle.parameters
+    return cls(**values)
+
+
+# Optional converter: every array to <folder>/<name>.csv and the header to <folder>/header.json
+def export_csv(bundle, folder):
+    bundle = Bundle(bundle) if isinstance(bundle, str) else bundle
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, "header.json"), "w") as file:
+        json.dump(bundle.header, file, indent=1)
+    for name in bundle.keys():
+        array = bundle[name]
+        array = array.reshape(len(array), -1) if array.ndim > 1 else array
+        fmt = "%s" if array.dtype.kind in "US" else "%d" if array.dtype.kind in "iub" else "%.18e"
+        np.savetxt(os.path.join(folder, f"{name}.csv"), array, delimiter=",", fmt=fmt)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Header of a bundle and its export to CSV files")
+    parser.add_argument("bundle")
+    parser.add_argument("--csv", help="folder for the CSV files")
+    args = parser.parse_args()
+
+    bundle = Bundle(args.bundle)
+    json.dump({name: value for name, value in bundle.header.items() if name != 'arrays'}, sys.stdout, indent=1)
+    print()
+    for name, entry in bundle.header['arrays'].items():
+        print(f"{name:30s} {entry['dtype']:6s} {tuple(entry['shape'])}")
+    if args.csv:
+        export_csv(bundle, args.csv)
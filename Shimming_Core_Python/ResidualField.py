@@ -0,0 +1,92 @@
+#
+# Sources of the single-axis residual induction B0 (T, Tesla) as a function of the z0 coordinate (m).
+# A source is a callable evaluated on whole arrays of z0: a polynomial (Horner scheme) or a measured profile loaded
+# from a CSV or .npy file and fitted by a polynomial or interpolated by a cubic spline.
+# The sampled arrays b0 are cached by the source and the sampling grid zq, and the measured profiles are cached by
+# the file contents, so switching between lab field maps costs nothing at solve time.
+#
+
+import os
+import hashlib
+from collections import OrderedDict
+import numpy as np
+from scipy.interpolate import CubicSpline
+
+CACHE_SIZE = 64  # number of sampled b0 arrays kept in memory
+
+# Polynomial c[0] + c[1] * z0 + c[2] * z0^2 + ... evaluated by the Horner scheme
+class PolynomialField:
+    def __init__(self, coefficients):
+        self.coefficients = tuple(float(c) for c in coefficients)
+        self.key = ('polynomial',) + self.coefficients
+
+    def __call__(self, z0):
+        z0 = np.asarray(z0, dtype=float)
+        value = np.full(z0.shape, self.coefficients[-1])
+        for c in self.coefficients[-2::-1]:
+            value = value * z0 + c
+        return value
+
+
+# Measured profile: columns z0 (m) and B0 (T) of a CSV file (a header line is allowed) or an .npy array of shape
+# (N, 2) or (2, N). fit = 'spline' interpolates the points, fit = 'polynomial' fits a polynomial of the given degree.
+class MeasuredField:
+    def __init__(self, filename, fit='spline', degree=8):
+        with open(filename, "rb") as file:
+            digest = hashlib.sha256(file.read()).hexdigest()
+        if filename.endswith(".npy"):
+            data = np.load(filename)
+            data = data.T if data.shape[0] == 2 and data.shape[1] != 2 else data
+        else:
+            data = np.genfromtxt(filename, delimiter=",", invalid_raise=False)
+            data = data[~np.isnan(data).any(axis=1)]  # header and empty lines
+        order = np.argsort(data[:, 0])
+        self.z0 = data[order, 0]
+        self.b0 = data[order, 1]
+        self.key = ('measured', digest, fit, degree if fit == 'polynomial' else None)
+
+        if fit == 'spline':
+            self.function = CubicSpline(self.z0, self.b0)
+        elif fit == 'polynomial':
+            self.function = PolynomialField(np.polynomial.polynomial.polyfit(self.z0, self.b0, degree))
+        else:
+            raise ValueError(f"unknown fit '{fit}', use 'spline' or 'polynomial'")
+
+    def __call__(self, z0):
+        return self.function(np.asarray(z0, dtype=float))
+
+
+_fields = {}  # (path, modification time, fit, degree) -> MeasuredField
+
+# Measured profile loaded once for every version of the file
+def load_field(filename, fit='spline', degree=8):
+    path = os.path.abspath(filename)
+    key = (path, os.path.getmtime(path), fit, degree)
+    if key not in _fields:
+        _fields[key] = MeasuredField(path, fit, degree)
+    return _fields[key]
+
+
+_samples = OrderedDict()  # (source key, grid digest) -> b0, least recently used first
+
+# Residual induction of the source sampled at the points zq; the returned array is shared and read-only.
+# source is a callable of z0 or the name of a file with a measured profile (interpolated by a spline).
+def sample(source, zq):
+    if isinstance(source, str):
+        source = load_field(source)
+    zq = np.ascontiguousarray(zq, dtype=float)
+    key = (getattr(source, 'key', source), hashlib.sha1(zq.tobytes()).hexdigest())
+    if key in _samples:
+        _samples.move_to_end(key)
+        return _samples[key]
+    b0 = np.asarray(source(zq), dtype=float).reshape(zq.shape)
+    b0.setflags(write=False)
+    _samples[key] = b0
+    if len(_samples) > CACHE_SIZE:
+        _samples.popitem(last=False)
+    return b0
+
+
+# A residual field provided by the mmWave lab at the University of St. Andrews, Scotland.
+ST_ANDREWS = PolynomialField([-5.859e-6, 4.766114e-3, -0.486506371, -1.4609783504e1, 4.2600403748e2, 3.04437e4,
+                              -8.75637e5, -7.65903e6, 1.46997e8])
@@ -0,0 +1,103 @@
+#
+# On-disk cache of the optimised profiles shared by the optimisation folders.
+# An entry is stored under a hash of everything the solution depends on: the geometry, the sampled residual
+# induction b0 and the solver settings. The parameters which only change the post-processing (resistivity, strip
+# thickness, current uncertainty) are not part of the key, so changing them returns the stored solution at once.
+# A request which is not in the cache can start from the closest cached solution of the same size.
+# The entries are .npz files listed in index.json with their size and the time of their last use; the least
+# recently used entries are removed when the folder grows beyond max_bytes.
+#
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import numpy as np
+
+MAX_BYTES = 256 * 2**20
+
+# Hash of the problem: kind of optimisation, settings (JSON values) and the sampled residual induction
+def cache_key(kind, settings, b0):
+    text = json.dumps(dict(kind=kind, settings=settings), sort_keys=True)
+    digest = hashlib.sha256(text.encode())
+    digest.update(np.ascontiguousarray(b0, dtype=float).tobytes())
+    return digest.hexdigest()[:32]
+
+# Sum of the squared relative differences of the common features
+def distance(features, other):
+    return sum(((value - other[name]) / (abs(value) + abs(other[name]) or 1.0))**2
+               for name, value in features.items() if name in other)
+
+# Writes the file through a temporary file, so a crash never leaves a half-written file behind
+def replace_file(filename, write):
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(filename), suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as file:
+            write(file)
+        os.replace(temporary, filename)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+class ResultCache:
+    def __init__(self, folder, max_bytes=MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(folder, exist_ok=True)
+        self.index_file = os.path.join(folder, "index.json")
+        self.index = {}
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, "r") as file:
+                    self.index = json.load(file)
+            except ValueError:
+                self.index = {}  # damaged index: the cache starts again
+        self.index = {key: entry for key, entry in self.index.items()
+                      if os.path.exists(os.path.join(folder, entry['file']))}
+
+    def save_index(self):
+        replace_file(self.index_file, lambda file: file.write(json.dumps(self.index, indent=1).encode()))
+
+    def load(self, key):
+        entry = self.index[key]
+        with np.load(os.path.join(self.folder, entry['file'])) as data:
+            arrays = {name: data[name] for name in data.files}
+        entry['used'] = time.time()
+        self.save_index()
+        return arrays, entry['info']
+
+    # Stored arrays and information of the key or None
+    def get(self, key):
+        return self.load(key) if key in self.index else None
+
+    # Stored entry of the same kind and size closest to the features (relative differences) or None
+    def nearest(self, kind, size, features):
+        best, closest = None, np.inf
+        for key, entry in self.index.items():
+            if entry['kind'] != kind or entry['size'] != size:
+                continue
+            d = distance(features, entry['features'])
+            if d < closest:
+                best, closest = key, d
+        return None if best is None else self.load(best)
+
+    # Stores the arrays and the JSON information; size is the number of the variables of the solution
+    def put(self, key, kind, size, features, arrays, info):
+        filename = f"{kind}_{key}.npz"
+        replace_file(os.path.join(self.folder, filename), lambda file: np.savez(file, **arrays))
+        self.index[key] = dict(kind=kind, size=size, features=features, info=info, file=filename,
+                               bytes=os.path.getsize(os.path.join(self.folder, filename)), used=time.time())
+        self.evict()
+        self.save_index()
+
+    # Removes the least recently used entries above max_bytes
+    def evict(self):
+        total = sum(entry['bytes'] for entry in self.index.values())
+        for key in sorted(self.index, key=lambda key: self.index[key]['used']):
+            if total <= self.max_bytes or len(self.index) == 1:
+                break
+            entry = self.index.pop(key)
+            total -= entry['bytes']
+            os.remove(os.path.join(self.folder, entry['file']))
@@ -0,0 +1,97 @@
+#
+# Physics of the flat spiral coils shared by the turns, current and solenoid tools.
+# The conductor of the total diameter d (including the isolation) is wound as the Archimedean spiral r = gamma * theta
+# with gamma = d / (2 pi); a spiral starts at the inner angle theta1 (adjusted internal radius R) and ends at the
+# outer angle theta2. The expressions 2 gamma theta + d (= 2 r + d) appear in all formulas and are called gtd here.
+# All kernels are NumPy expressions broadcasting their arguments, e.g. dz as a Q x M matrix or a vector of the
+# distinct distances of a Toeplitz matrix, and gtd2 as a column of the outer diameters of the spirals.
+#
+# Example:
+#   g = spiral_geometry(d0, delta, R)
+#   Bz = field_factor(g.gamma, I) * SpiralField(zq - zm, g.gtd1, g.gtd(theta2))     Eq. (21) for the currents I
+#   length = SpiralLength(g.gamma, g.gtd1, g.gtd(theta2))
+#
+
+from dataclasses import dataclass
+import numpy as np
+
+pi = 3.1415926535897932384626433832795
+mu0 = 4.0 * pi * 1.0e-7  # vacuum magnetic permeability
+
+
+# Geometry of the spirals of a stack with the adjusted internal radius
+@dataclass(frozen=True)
+class SpiralGeometry:
+    d: float  # total conductor diameter including the isolation (m)
+    R: float  # adjusted internal radius (m)
+    gamma: float  # rotation-to-displacement coefficient (m/rad)
+    theta1: float  # inner angle (rad)
+    gtd1: float  # 2 gamma theta1 + d = 2 R
+
+    # Angle of the adjusted radius r
+    def angle(self, r):
+        return (2.0 * pi * r) / self.d - pi
+
+    def gtd(self, theta):
+        return 2.0 * self.gamma * theta + self.d
+
+# A radius is adjusted to the middle of a conductor: r = d * int(r/d) + d/2
+def adjusted_radius(r, d):
+    return d * int(r / d) + d / 2.0
+
+def spiral_geometry(d0, delta, R):
+    d = d0 + 2.0 * delta
+    R = adjusted_radius(R, d)
+    gamma = d / (2.0 * pi)
+    theta1 = (2.0 * pi * R) / d - pi
+    return SpiralGeometry(d=d, R=R, gamma=gamma, theta1=theta1, gtd1=2.0 * gamma * theta1 + d)
+
+
+# Constant factor mu0 I / (4 pi gamma) of the induction of a spiral with the current I (T)
+def field_factor(gamma, I=1.0):
+    return mu0 * I / (4.0 * pi * gamma)
+
+# Primitive of the induction of a spiral at the squared axial distance dz2 from its plane: the induction is the
+# difference of the values at the outer and inner ends, so a fixed inner end can be calculated once
+def field_term(gtd, dz2):
+    root = (gtd**2 + 4.0 * dz2)**0.5
+    return np.log(gtd + root) - gtd / root
+
+# Induction in Eqs. (21), (32) on the axis at the distance dz from the spiral without the factor mu0 I / (4 pi gamma).
+# The logarithm of the ratio keeps more digits than the difference of the two field_term values for distant spirals.
+def SpiralField(dz, gtd1, gtd2):
+    root1 = (gtd1**2 + 4.0 * dz**2)**0.5
+    root2 = (gtd2**2 + 4.0 * dz**2)**0.5
+    return np.log((gtd2 + root2) / (gtd1 + root1)) + gtd1 / root1 - gtd2 / root2
+
+
+# Length of the spiral between the inner and outer ends (m)
+def SpiralLength(gamma, gtd1, gtd2):
+    val1 = (4.0 * gamma**2 + gtd1**2)**0.5
+    val2 = (4.0 * gamma**2 + gtd2**2)**0.5
+    return ((gtd2 / (8.0 * gamma)) * val2 - (gtd1 / (8.0 * gamma)) * val1 +
+            (gamma / 2.0) * np.log((gtd2 + val2) / (gtd1 + val1)))
+
+# Resistance of a round wire of the diameter d0 (Ohms)
+def WireResistance(length, rho, d0):
+    return rho * length / ((pi / 4.0) * d0**2)
+
+# Resistance of a PCB strip of the width d0 and the thickness h (Ohms)
+def StripResistance(length, rho, d0, h):
+    return rho * length / (d0 * h)
+
+
+# Magnetic field strength H (A/m) on the axis of a solenoid with M winding layers of N turns each, wound from the
+# internal radius R with the conductor diameter d; z0 is measured from the middle of the solenoid.
+# The design parameters broadcast with z0, e.g. z0 as a D x K matrix of points and R, d, M, N, I as D x 1 columns
+# of D designs; the layers are the last axis of the calculation (the designs with less layers are masked).
+def SolenoidField(z0, R, d, M, N, I):
+    z0, R, d, M, N, I = np.broadcast_arrays(z0, R, d, M, N, I)
+    gamma = d / (2.0 * pi)
+    half = (gamma * pi * N)[..., np.newaxis]  # half length: gamma * psi, where 2 psi is the total rotation angle
+    layers = np.arange(1, np.max(M) + 1)
+    r2 = (R[..., np.newaxis] + d[..., np.newaxis] * (2.0 * layers - 1.0) / 2.0)**2  # squared radii of the layers
+    upper, lower = z0[..., np.newaxis] + half, z0[..., np.newaxis] - half
+    value = upper / (r2 + upper**2)**0.5 - lower / (r2 + lower**2)**0.5
+    value = np.where(layers <= M[..., np.newaxis], value, 0.0).sum(axis=-1)
+    return value * I / (4.0 * pi * gamma)
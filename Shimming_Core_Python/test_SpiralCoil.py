@@ -0,0 +1,80 @@
+#
+# Tests of the shared kernels against the scalar formulas they replaced in the turns, current and solenoid tools.
+# Run with: python -m pytest test_SpiralCoil.py
+#
+
+import numpy as np
+from SpiralCoil import (spiral_geometry, field_factor, field_term, SpiralField, SpiralLength, WireResistance,
+                        StripResistance, SolenoidField, pi, mu0)
+
+d0, delta, R, h, rho = 0.0005, 1e-05, 0.016, 3.5e-05, 1.68e-08
+
+
+def test_geometry():
+    g = spiral_geometry(d0, delta, R)
+    d = d0 + 2.0 * delta
+    assert g.d == d
+    assert g.R == d * int(R / d) + d / 2.0
+    assert g.gamma == d / (2.0 * pi)
+    assert g.theta1 == (2.0 * pi * g.R) / d - pi
+    assert np.isclose(g.gtd1, 2.0 * g.R)
+
+def test_spiral_field():
+    g = spiral_geometry(d0, delta, R)
+    dz = np.linspace(-0.05, 0.05, 41)[:, np.newaxis]
+    gtd2 = g.gtd(g.theta1 + 2.0 * pi * np.array([0.5, 3.0, 10.0, 40.0]))
+    field = SpiralField(dz, g.gtd1, gtd2)
+    np.testing.assert_allclose(field, field_term(gtd2, dz**2) - field_term(g.gtd1, dz**2), rtol=1e-9, atol=1e-12)
+    # Scalar expression of the former Bz(x, q) loop with the factor mu0 I / (4 pi gamma)
+    for q in (0, 7, 20, 40):
+        for m, value in enumerate(gtd2):
+            sqrt_term = lambda gtd: (gtd**2 + 4.0 * dz[q, 0]**2)**0.5
+            old = (np.log((value + sqrt_term(value)) / (g.gtd1 + sqrt_term(g.gtd1))) + g.gtd1 / sqrt_term(g.gtd1)
+                   - value / sqrt_term(value))
+            assert np.isclose(field_factor(g.gamma, 0.2) * field[q, m], mu0 * 0.2 * old / (4.0 * pi * g.gamma),
+                              rtol=1e-12)
+
+def test_length_and_resistance():
+    g = spiral_geometry(d0, delta, R)
+    theta2 = g.theta1 + 2.0 * pi * np.array([0.5, 3.0, 10.0, 40.0])
+    length = SpiralLength(g.gamma, g.gtd1, g.gtd(theta2))
+    for i, angle in enumerate(theta2):
+        gtd2 = 2.0 * g.gamma * angle + g.d
+        val1 = (4.0 * g.gamma**2 + g.gtd1**2)**0.5
+        val2 = (4.0 * g.gamma**2 + gtd2**2)**0.5
+        old = ((gtd2 / (8.0 * g.gamma)) * val2 - (g.gtd1 / (8.0 * g.gamma)) * val1 +
+               (g.gamma / 2) * np.log((gtd2 + val2) / (g.gtd1 + val1)))
+        assert np.isclose(length[i], old, rtol=1e-12)
+        assert np.isclose(WireResistance(length[i], rho, d0), rho * old / ((pi / 4.0) * d0**2), rtol=1e-12)
+        assert np.isclose(StripResistance(length[i], rho, d0, h), rho * old / (d0 * h), rtol=1e-12)
+    # a full turn of radius r has about the length 2 pi r
+    one_turn = SpiralLength(g.gamma, g.gtd1, g.gtd(g.theta1 + 2.0 * pi))
+    assert np.isclose(one_turn, 2.0 * pi * (g.R + g.d / 2.0), rtol=1e-3)
+
+# Former scalar Hz of Solenoid_Python/main.py
+def solenoid_loop(z0, R, d, M, N, I):
+    gamma = d / (2.0 * pi)
+    psi = pi * N
+    value = 0.0
+    for m in range(1, M + 1):
+        value = value + (z0 + gamma * psi) / ((R + d * (2 * m - 1) / 2)**2 + (z0 + gamma * psi)**2)**0.5
+        value = value - (z0 - gamma * psi) / ((R + d * (2 * m - 1) / 2)**2 + (z0 - gamma * psi)**2)**0.5
+    return value * I / (4.0 * pi * gamma)
+
+def test_solenoid_field():
+    R, d, L, I = 0.01, 0.001, 0.2, 1.0
+    N = int(L / d) + 1
+    z = np.linspace(-L / 2.0, L / 2.0, 51)
+    for M in (1, 6):
+        np.testing.assert_allclose(SolenoidField(z, R, d, M, N, I), [solenoid_loop(z0, R, d, M, N, I) for z0 in z],
+                                   rtol=1e-12)
+
+def test_solenoid_designs():
+    # two designs as columns with a different number of layers; the missing layers are masked
+    z = np.linspace(-0.1, 0.1, 21)
+    R, d, M, N, I = (np.array([[0.01], [0.02]]), np.array([[0.001], [0.0005]]), np.array([[2], [5]]),
+                     np.array([[201], [301]]), np.array([[1.0], [0.5]]))
+    field = SolenoidField(z[np.newaxis, :], R, d, M, N, I)
+    for k in range(2):
+        np.testing.assert_allclose(field[k], [solenoid_loop(z0, R[k, 0], d[k, 0], M[k, 0], N[k, 0], I[k, 0])
+                                              for z0 in z], rtol=1e-12)
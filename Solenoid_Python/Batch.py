@@ -0,0 +1,130 @@
+#
+# Batch solenoid calculator: the field along the axis of many solenoid designs in one pass (main.py asks for a single
+# design). A design has the parameters of main.py: L, R, d0, delta, M, maxz0 and I; the missing ones are taken from
+# DEFAULTS (maxz0 = L/2 by default). The field of all designs, points and layers is evaluated at once by broadcasting
+# (SolenoidField in SpiralCoil.py), in chunks of designs of at most CHUNK values to bound the memory.
+# Results: a CSV table with one line per design and its summary values, and a bundle (see Bundle.py) with the same
+# columns and the D x K matrices z (m) and H (A/m) of the field profiles.
+#
+# Examples:
+#   python Batch.py L=0.1,0.2,0.3 M=2,4,6 R=0.01,0.02          all combinations of the values
+#   python Batch.py --designs designs.csv --points 401 --table solenoids.csv --bundle solenoids.shim
+# where designs.csv has a header line with some of the parameter names and one design per line.
+#
+
+import os
+import sys
+import csv
+import argparse
+import itertools
+from dataclasses import dataclass
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Shimming_Core_Python'))
+from SpiralCoil import SolenoidField, pi
+from Bundle import save_bundle
+
+PARAMETERS = ('L', 'R', 'd0', 'delta', 'M', 'maxz0', 'I')
+DEFAULTS = dict(L=0.2, R=0.01, d0=0.001, delta=0.0, M=6, maxz0=None, I=1.0)  # the example values of main.py
+SUMMARY = ('d', 'N', 'H_center', 'H_center_Oe', 'H_min', 'H_max', 'uniformity', 'wire_length')
+CHUNK = 2**20  # values of the field calculated at once (designs x points x layers)
+
+
+# Results of SolenoidBatch for D designs and K points
+@dataclass
+class SolenoidBatchResult:
+    designs: dict  # parameter name -> array of the D values, maxz0 completed
+    z: np.ndarray  # D x K points along the axis (m)
+    H: np.ndarray  # D x K magnetic field strength (A/m)
+    d: np.ndarray  # total wire diameter including the isolation (m)
+    N: np.ndarray  # number of turns in each layer
+    H_center: np.ndarray  # field strength in the middle of the solenoid (A/m)
+    H_center_Oe: np.ndarray  # same in Oe
+    H_min: np.ndarray  # minimum and maximum over [-maxz0, maxz0] (A/m)
+    H_max: np.ndarray
+    uniformity: np.ndarray  # (H_max - H_min) / H_center
+    wire_length: np.ndarray  # length of the wire of all layers (m)
+
+
+def convert(name, value):
+    if value is None or value in ('', 'None'):
+        return None
+    return int(value) if name == 'M' else float(value)
+
+# Designs from a CSV file with a header line
+def load_designs(filename):
+    with open(filename, "r", newline="") as file:
+        return [{name: convert(name, value) for name, value in row.items() if name in PARAMETERS}
+                for row in csv.DictReader(file)]
+
+# All combinations of the grid values (name -> list of values)
+def grid_designs(grid):
+    names = list(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        yield {name: convert(name, value) for name, value in zip(names, values)}
+
+
+# Field profiles and summary values of the designs (list of dictionaries), K points over [-maxz0, maxz0] each
+def SolenoidBatch(designs, points=201, chunk=CHUNK):
+    designs = [dict(DEFAULTS, **{name: value for name, value in design.items() if value is not None})
+               for design in designs]
+    p = {name: np.array([design[name] if design[name] is not None else np.nan for design in designs],
+                        dtype=int if name == 'M' else float) for name in PARAMETERS}
+    p['maxz0'] = np.where(np.isnan(p['maxz0']), p['L'] / 2.0, p['maxz0'])
+    d = p['d0'] + 2.0 * p['delta']  # total wire diameter, including isolation
+    N = (p['L'] / d).astype(int) + 1  # number of turns in each layer
+    z = p['maxz0'][:, np.newaxis] * np.linspace(-1.0, 1.0, points)
+
+    H = np.empty_like(z)
+    step = max(1, chunk // (points * max(1, np.max(p['M'], initial=1))))
+    column = lambda value, s: value[s, np.newaxis]
+    for start in range(0, len(designs), step):
+        s = slice(start, start + step)
+        H[s] = SolenoidField(z[s], column(p['R'], s), column(d, s), column(p['M'], s), column(N, s),
+                             column(p['I'], s))
+    H_center = SolenoidField(0.0, p['R'], d, p['M'], N, p['I'])
+    H_min, H_max = H.min(axis=1, initial=np.inf), H.max(axis=1, initial=-np.inf)
+    # Every layer: N turns of the radius R + d (2m - 1) / 2, i.e. the mean radius R + d M / 2
+    wire_length = 2.0 * pi * N * p['M'] * (p['R'] + d * p['M'] / 2.0)
+    return SolenoidBatchResult(designs=p, z=z, H=H, d=d, N=N, H_center=H_center,
+                               H_center_Oe=H_center * 4.0 * pi / 1000.0, H_min=H_min, H_max=H_max,
+                               uniformity=(H_max - H_min) / H_center, wire_length=wire_length)
+
+
+# Table of the designs and their summary values, and optionally the bundle with the profiles
+def save_solenoid_batch(result, table="solenoid_batch.csv", bundle=None):
+    columns = dict(result.designs, **{name: getattr(result, name) for name in SUMMARY})
+    with open(table, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        writer.writerows(zip(*(values.tolist() for values in columns.values())))
+    if bundle:
+        save_bundle(bundle, 'solenoids', dict(columns, z=result.z, H=result.H),
+                    results=dict(designs=len(result.z), points=result.z.shape[1]))
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Field along the axis of many solenoid designs")
+    parser.add_argument("grid", nargs="*", help="parameter values, e.g. L=0.1,0.2 M=2,4,6 (all combinations)")
+    parser.add_argument("--designs", help="CSV file with one design per line")
+    parser.add_argument("--points", type=int, default=201, help="number of the points along the axis of a design")
+    parser.add_argument("--table", default="solenoid_batch.csv", help="CSV table of the designs")
+    parser.add_argument("--bundle", default="solenoid_batch.shim", help="bundle with the field profiles ('' for none)")
+    args = parser.parse_args(arguments)
+
+    designs = load_designs(args.designs) if args.designs else []
+    grid = {}
+    for item in args.grid:
+        name, values = item.split("=")
+        if name not in PARAMETERS:
+            parser.error(f"unknown parameter {name}; the parameters are {', '.join(PARAMETERS)}")
+        grid[name] = values.split(",")
+    if grid or not designs:
+        designs.extend(grid_designs(grid))
+
+    result = SolenoidBatch(designs, args.points)
+    save_solenoid_batch(result, args.table, args.bundle)
+    print(f"{len(designs)} designs written to {args.table}" + (f" and {args.bundle}" if args.bundle else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,24 @@
 #
 # Solenoid calculator
 # Calculation of the magnetic field strength H (A/m and Oe) directed and distributed along the axis of the solenoid.
+# With command line arguments the designs are calculated in a batch without questions, see Batch.py:
+#   python main.py L=0.1,0.2 M=2,4,6 --table solenoids.csv
 #
 # Yujie Zhao, University of St. Andrews, Scotland
 # 27.04.2023
 #
 
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
-pi = np.pi  # 3.1415...
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Shimming_Core_Python'))
+from SpiralCoil import SolenoidField, pi
+
+if len(sys.argv) > 1:  # batch mode
+    from Batch import main
+    main()
+    sys.exit()
 
 # Console application:
 print("")
@@ -34,27 +44,10 @@ I = float(input("Enter the current I in amperes: "))
 d = d0 + 2 * delta  # total wire diameter, including isolation
 N = int(L / d) + 1  # number of turns in each layer
 K = N  # number of points of the z-coordinate used for drawing the magnetic field strength
-gamma = d / (2.0 * pi)  # m/rad is the rotation-to-displacement coefficient
-psi = pi * N  # 2 * psi is the total rotation angle for all turns in rad
-
-# Magnetic field strength H measured in A/m along the solenoid axis as a function of z0
-def Hz(z0):
-    value = 0.0
-    for m in range(1, M + 1):
-        value = value + (z0 + gamma * psi) / ((R + d * (2 * m - 1) / 2)**2 + (z0 + gamma * psi)**2)**0.5
-        value = value - (z0 - gamma * psi) / ((R + d * (2 * m - 1) / 2)**2 + (z0 - gamma * psi)**2)**0.5
-    return value * I / (4.0 * pi * gamma)
 
 dz = 2 * maxz0 / K  # coordinate step
-z = []  # list of the coordinate points along the solenoid axis in m
-H1 = []  # list of the magnetic field points in A/m
-for i in range(K + 1):
-    z0 = -maxz0 + dz * i
-    z.append(z0)
-    H1.append(Hz(z0))
-
-z = np.array(z)  # converting into an array
-H1 = np.array(H1)  # converting into an array
+z = -maxz0 + dz * np.arange(K + 1)  # coordinate points along the solenoid axis in m
+H1 = SolenoidField(z, R, d, M, N, I)  # magnetic field strength H in A/m along the solenoid axis (SpiralCoil.py)
 H2 = (H1 * 4.0 * pi) / 1000  # array of the magnetic field points in Oe
 
 stacked_array = np.column_stack((z, H1, H2))
@@ -3,6 +3,8 @@
 # Use this Python program to control four PWM outputs on Arduino and measure its four analog inputs.
 # Plotting graphs Vout(PWM) vs. duty cycle.
 # Four PWM outputs on Arduino: duty cycle sweep from 0 to 100%.
+# The measured duty cycle ratios and voltages are saved to pwm_sweep.csv, the input of the calibration tables
+# (PWM_driver_Current_booster_Blinka_Shimming_Coils_Python/Calibration.py).
 #
 
 import serial
@@ -35,6 +37,7 @@ reference_voltage = 5.0  # Reference voltage (5V)
 
 # Main loop
 duty_cycle = []  # 8-bit resolution
+sweep_duty = []  # duty cycle ratio of the setting in force when the voltages were read
 volt1 = []
 volt2 = []
 volt3 = []
@@ -60,6 +63,7 @@ for i in range(1, 257):
             volt2.append(voltage2)
             volt3.append(voltage3)
             volt4.append(voltage4)
+            sweep_duty.append((i - 1) / 255.0)  # the voltages belong to the previous setting (analogWrite 0...255)
 
             # Print voltage values
             print(f"Voltage 1: {voltage1}V")
@@ -105,6 +109,10 @@ volt2 = np.array(volt2)
 volt3 = np.array(volt3)
 volt4 = np.array(volt4)
 
+# Save the sweep for the calibration
+np.savetxt("pwm_sweep.csv", np.column_stack((sweep_duty, volt1, volt2, volt3, volt4)), delimiter=",",
+           header="duty,V1,V2,V3,V4", comments="")
+
 # Plotting the graph
 plt.plot(duty_cycle, volt1)
 plt.plot(duty_cycle, volt2)
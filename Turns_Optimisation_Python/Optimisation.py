@@ -2,124 +2,192 @@
 # The Optimisation methods are used to calculate the turns profile when spiral coils are stacked together.
 #
 
+import os
+import sys
+from contextlib import nullcontext
+from dataclasses import dataclass, field
 import numpy as np
-from scipy.optimize import minimize
-import matplotlib.pyplot as plt
-from ResidualB import B0
+from scipy.optimize import minimize, least_squares, OptimizeResult
+from ResidualB import B0, sample
+from Trace import SolverTrace
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Shimming_Core_Python'))
+from ResultCache import ResultCache, cache_key
+from Bundle import save_result, load_result, unique_name
+from SpiralCoil import (spiral_geometry, field_factor, field_term, SpiralLength, WireResistance, StripResistance,
+                        pi, mu0)
 
-pi = 3.1415926535897932384626433832795
-mu0 = 4.0 * pi * 1.0e-7  # vacuum magnetic permeability
+# Kernels of Eqs. (32)-(34) generated from the SymPy model in the dBz_derivative folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'dBz_derivative'))
+from KernelBuilder import load_kernels, model_hash
+kernels = load_kernels()
 
-def TurnsOptimisation(tolerance, L0, L, d0, delta, h, R, a, w, rho, I, N, Method):
-    M = int(L/w)  # number of the spiral coils; must be odd
-    M = M + 1 if M % 2 == 0 else M + 2
-    zm = np.array(list(map(lambda m: -((M - 1)/2) * w + w * m, range(M))))  # coordinates of the spirals for [-L/2,L/2]
+COARSENING = 2  # ratio of the pitches of two consecutive multigrid levels
+MIN_SAMPLES = 9  # minimum number of the sampling points of a coarse level
 
-    Q = int(L0/w)  # number of the induction sampling points; must be odd
-    Q = Q + 1 if Q % 2 == 0 else Q + 2
-    zq = np.array(list(map(lambda q: -((Q - 1)/2) * w + w * q, range(Q))))  # induction sampling points for [-L0/2,L0/2]
-    b0 = np.array(list(map(lambda q: B0(zq[q]), range(Q))))  # sampling of the residual induction in Tesla
 
-    plt.plot(zq, b0)
-    plt.xlabel("z0, m")
-    plt.ylabel("B0, T")
-    plt.title("Residual induction")
-    plt.grid(True)
-    plt.tight_layout()
-    plt.show()
+# Vectorised engine for Eqs. (31)-(34): for a given x the whole M x Q kernel matrix of Eq. (32) and the matrix of
+# its derivatives are computed once and shared by fun, jac and hess. The rows correspond to the spirals (m) and
+# the columns to the sampling points (q), so the derivative matrix D is the transposed Jacobian of the residual.
+class FieldEngine:
+    def __init__(self, zm, zq, b0, d, gamma, theta1, a, I):
+        self.b0 = np.asarray(b0, dtype=float)
+        self.d = d
+        self.gamma = gamma
+        self.theta1 = theta1
+        self.a = a
+        self.I = I
+        self.gtd1 = 2.0 * gamma * theta1 + d
+        self.dz2 = (np.asarray(zq)[np.newaxis, :] - np.asarray(zm)[:, np.newaxis])**2  # (zq - zm)^2, M x Q
+        self.const1 = -field_term(self.gtd1, self.dz2)  # inner end of the spirals, does not depend on x
+        self.coeff = field_factor(gamma, I)
+        self.zm = np.asarray(zm, dtype=float)[:, np.newaxis]
+        self.zq = np.asarray(zq, dtype=float)[np.newaxis, :]
+        self.x = None
+
+    # Spiral term of Eq. (32) without the tanh(a*x) factor; x is a column (M x 1) of the outer angles
+    # or the angle of the single spiral m
+    def spiral(self, x, m=slice(None)):
+        gtd2 = 2.0 * self.gamma * (self.theta1 + x) + self.d
+        return field_term(gtd2, self.dz2[m]) + self.const1[m]
 
-    # Some initial constants used in the functions
-    d = d0 + 2.0 * delta  # total conductor diameter including the isolation
-    R = d * int(R / d) + d / 2.0  # adjusted internal radius
-    gamma = d / (2.0 * pi)
-    theta1 = (2.0 * pi * R) / d - pi
-    gtd1 = 2.0 * gamma * theta1 + d
-
-    # Function in Eq. (32) in the report
-    def Bz(x, q):
-        Bz_value = 0.0
-        for m in range(M):
-            theta2 = theta1 + x[m] * np.tanh(a * x[m])
-            gtd2 = 2.0 * gamma * theta2 + d
-            sqrt_term = lambda gtd: (gtd ** 2 + 4.0 * (zq[q] - zm[m]) ** 2) ** 0.5
-            value1 = gtd1 + sqrt_term(gtd1)
-            value2 = gtd2 + sqrt_term(gtd2)
-            value = np.log(value2 / value1) + gtd1 / sqrt_term(gtd1) - gtd2 / sqrt_term(gtd2)
-            Bz_value = Bz_value + np.tanh(a * x[m]) * value
-        return mu0 * I * Bz_value / (4.0 * pi * gamma)
+    # Kernel, derivative and residual matrices for the current x (recalculated only when x changes)
+    def update(self, x):
+        x = np.asarray(x, dtype=float)
+        if self.x is not None and np.array_equal(x, self.x):
+            return
+        self.x = x.copy()
+        # Bz contributions of every spiral to every point and their derivatives in Eqs. (33), (34).
+        # During the calculations it may overflow, but will continue. Choose a proper "a" parameter.
+        self.K, self.D = kernels.bz_dbz(x[:, np.newaxis], self.zm, self.zq, self.d, self.gamma, self.theta1,
+                                        self.gtd1, self.a, pi, mu0, self.I)
+        self.r = self.K.sum(axis=0) + self.b0  # residual Bz + B0
+
+    # Function in Eq. (32) in the report for all sampling points
+    def Bz(self, x):
+        self.update(x)
+        return self.r - self.b0
 
     # Induction function used for testing the optimisation (step signature function)
-    def Bz_test(x, q):
-        Bz_value = 0.0
-        for m in range(M):
-            if x[m] < 0.0:
-                theta2 = theta1 - x[m]
-            else:
-                theta2 = theta1 + x[m]
-            gtd2 = 2.0 * gamma * theta2 + d
-            sqrt_term = lambda gtd: (gtd ** 2 + 4.0 * (zq[q] - zm[m]) ** 2) ** 0.5
-            value1 = gtd1 + sqrt_term(gtd1)
-            value2 = gtd2 + sqrt_term(gtd2)
-            value = np.log(value2 / value1) + gtd1 / sqrt_term(gtd1) - gtd2 / sqrt_term(gtd2)
-            if x[m] < 0:
-                Bz_value = Bz_value - value
-            else:
-                Bz_value = Bz_value + value
-        return mu0 * I * Bz_value / (4.0 * pi * gamma)
+    def Bz_test(self, x):
+        X = np.asarray(x, dtype=float)[:, np.newaxis]
+        return (self.coeff * np.sign(X) * self.spiral(np.abs(X))).sum(axis=0)
+
+    # Induction of the single spiral m with n full turns at all sampling points (one column of Bz_test)
+    def turns_column(self, m, n):
+        return self.coeff * np.sign(n) * self.spiral(2.0 * pi * abs(n), m)
 
     # Least square function in Eq. (31) used for the optimisation
-    def fun(x):
-        return sum((Bz(x, q) + b0[q])**2 for q in range(Q))
-
-    # Derivative in Eqs. (33), (34) calculated using SymPy library (https://www.sympy.org/en/index.html)
-    # During the calculations it may overflow, but will continue. Choose a proper "a" parameter.
-    def dBz(x, m, q):
-        b = 0.25 * I * mu0 * (a * ((0.5 * d + gamma * (theta1 + x * np.tanh(a * x)))**2 + (zm[m] - zq[q])**2)**2.5 * (d
-        + 2.0 * gamma * (theta1 + x * np.tanh(a * x)) + 2.0 * ((0.5 * d + gamma * (theta1 +
-        x * np.tanh(a * x)))**2 + (zm[m] - zq[q])**2)**0.5) * (0.5 * gtd1 * ((0.5 * d + gamma * (theta1 +
-        x * np.tanh(a * x)))**2 + (zm[m] - zq[q])**2)**0.5 - (0.5 * d + gamma * (theta1 +
-        x * np.tanh(a * x))) * (0.25 * gtd1**2 + (zm[m] - zq[q])**2)**0.5 + (0.25 * gtd1**2 + (zm[m] -
-        zq[q])**2)**0.5 * ((0.5 * d + gamma * (theta1 + x * np.tanh(a * x)))**2 + (zm[m] -
-        zq[q])**2)**0.5 * np.log((d + 2.0 * gamma * (theta1 + x * np.tanh(a * x)) + 2.0 * ((0.5 * d +
-        gamma * (theta1 + x * np.tanh(a * x)))**2 + (zm[m] - zq[q])**2)**0.5) / (gtd1 + 2.0 * (0.25 * gtd1**2
-        + (zm[m] - zq[q])**2)**0.5))) / np.cosh(a * x)**2 + gamma * (0.25 * gtd1**2 + (zm[m] -
-        zq[q])**2)**0.5 * (a * x / np.cosh(a * x)**2 + np.tanh(a * x)) * ((0.5 * d + gamma*(theta1 +
-        x * np.tanh(a * x)))**2 + (zm[m] - zq[q])**2)**0.5 * (0.5 * (0.5 * d + gamma * (theta1 +
-        x * np.tanh(a * x))) * (d + 2.0 * gamma * (theta1 + x * np.tanh(a * x)))*((0.5 * d + gamma * (theta1 +
-        x * np.tanh(a * x)))**2 + (zm[m] - zq[q])**2) * (d + 2.0 * gamma * (theta1 + x * np.tanh(a * x)) +
-        2.0 * ((0.5 * d + gamma * (theta1 + x * np.tanh(a * x)))**2 + (zm[m] - zq[q])**2)**0.5) +
-        2.0 * ((0.5 * d + gamma * (theta1 + x * np.tanh(a * x)))**2 + (zm[m] - zq[q])**2)**2.0 * (0.5 * d +
-        gamma * (theta1 + x * np.tanh(a * x)) + ((0.5 * d + gamma * (theta1 + x * np.tanh(a * x)))**2 + (zm[m]
-        - zq[q])**2)**0.5) - ((0.5 * d + gamma * (theta1 + x * np.tanh(a * x)))**2 + (zm[m] -
-        zq[q])**2)**2.0 * (d + 2.0 * gamma * (theta1 + x * np.tanh(a * x)) + 2.0 * ((0.5 * d + gamma * (theta1
-        + x * np.tanh(a * x)))**2 + (zm[m] - zq[q])**2)**0.5)) * np.tanh(a * x)) / (gamma * pi * (0.25 * gtd1**2 +
-        (zm[m] - zq[q])**2)**0.5 * ((0.5 * d + gamma * (theta1 + x * np.tanh(a * x)))**2 + (zm[m] -
-        zq[q])**2)**3.0 * (d + 2.0 * gamma * (theta1 + x * np.tanh(a * x)) + 2.0 * ((0.5 * d + gamma * (theta1
-        + x * np.tanh(a * x)))**2 + (zm[m] - zq[q])**2)**0.5))
-        return b
-
-    # Calculation of the Jacobian in Eq. (33)
-    def jac(x):
-        J = np.zeros(M)
-        for m in range(M):
-            J[m] = 2.0 * sum((Bz(x, q) + b0[q]) * dBz(x[m], m, q) for q in range(Q))
-        return np.array(J)
-
-    # Calculation of the Hessian matrix in Eq. (34)
-    def hess(x):
-        HM = []
-        for m in range(M):
-            row = []
-            for n in range(M):
-                value = 2.0 * sum(dBz(x[m], m, q) * dBz(x[n], n, q) for q in range(Q))
-                row.append(value)
-            HM.append(row)
-        HM = np.array(HM)
-        return HM
+    def fun(self, x):
+        self.update(x)
+        return self.r @ self.r
+
+    # Calculation of the Jacobian in Eq. (33): 2 * J^T r
+    def jac(self, x):
+        self.update(x)
+        return 2.0 * (self.D @ self.r)
+
+    # Calculation of the Hessian matrix in Eq. (34): 2 * J^T J
+    def hess(self, x):
+        self.update(x)
+        return 2.0 * (self.D @ self.D.T)
+
+    # Product of the Hessian in Eq. (34) with the vector v without forming the matrix: 2 * J^T (J v), O(M Q)
+    def hessp(self, x, v):
+        self.update(x)
+        return 2.0 * (self.D @ (self.D.T @ v))
+
+    # Residual vector Bz + B0 in Eq. (31) used by the least-squares methods
+    def residual(self, x):
+        self.update(x)
+        return self.r
+
+    # Q x M Jacobian of the residual vector
+    def jacobian(self, x):
+        self.update(x)
+        return self.D.T
+
+
+# Results of the turns optimisation returned by TurnsProfile
+@dataclass
+class TurnsResult:
+    zm: np.ndarray  # coordinates of the spirals (m)
+    zq: np.ndarray  # induction sampling points (m)
+    b0: np.ndarray  # sampled residual induction (T)
+    angles: np.ndarray  # optimised values of the variable "hi" in Eq. (29) (rad)
+    residual: np.ndarray  # residuals Bz + B0 of the continuous solution (T)
+    turns: np.ndarray  # full turns of each spiral
+    error: np.ndarray  # residuals Bz + B0 for the full turns (T)
+    spiral_length: np.ndarray  # length of each spiral (m)
+    wire_resistance: np.ndarray  # resistance of each wire spiral (Ohms)
+    strip_resistance: np.ndarray  # resistance of each strip spiral (Ohms)
+    total_spiral_length: float
+    total_wire_resistance: float
+    total_strip_resistance: float
+    wire_current_power: float  # power dissipated in the whole wire stack (W)
+    strip_current_power: float  # power dissipated in the whole strip stack (W)
+    optimisation: str  # name of the optimisation method
+    nfev: int  # function evaluations
+    njev: int  # Jacobian evaluations
+    nit: int  # iterations (Jacobian evaluations for the least-squares method)
+    success: bool
+    message: str
+    moves: int = 0  # +/-1 turn moves accepted by the integer refinement
+    start: str = 'initial'  # starting point: initial (N turns), warm (closest cached solution) or cached (no solve)
+    parameters: dict = field(default_factory=dict)  # input and adjusted design parameters
+
+
+# Induction sampling points for [-L0/2,L0/2] and the sampled residual induction in Tesla.
+# source is the residual field (a callable of z0 or a measured profile file, see ResidualField.py); B0 by default.
+def InductionSampling(L0, w, source=None):
+    Q = int(L0/w)  # number of the induction sampling points; must be odd
+    Q = Q + 1 if Q % 2 == 0 else Q + 2
+    zq = -((Q - 1)/2) * w + w * np.arange(Q)  # induction sampling points for [-L0/2,L0/2]
+    b0 = sample(B0 if source is None else source, zq)  # sampling of the residual induction in Tesla (cached)
+    return zq, b0
+
+
+# Pure computation of the turns profile: no plots, dialogs or files.
+# sampling is the (zq, b0) pair from InductionSampling(L0, w, source); it is calculated if not given.
+# refine switches on the integer post-optimisation of the truncated full turns (RefineTurns).
+# trace is the name of a JSONL file to which the solver iterations are appended (see Trace.py).
+# cache is a ResultCache or the name of its folder: a stored solution of the same problem is returned without solving
+# and the closest stored solution with the same number of spirals is used as the starting point otherwise.
+# levels > 1 solves first on coarser grids, the pitch w being multiplied by COARSENING for each level, and starts
+# every finer level from the profile of the coarser one (multigrid, see CoarseStart); the coarsening stops before a
+# level would have less than MIN_SAMPLES sampling points. The fine levels of the methods 1-4 usually start within the
+# gradient tolerance and stop after a few iterations, so the multigrid is faster than the flat start but its least
+# square value is higher (about 3 to 7 times on the example parameters).
+def TurnsProfile(tolerance, L0, L, d0, delta, h, R, a, w, rho, I, N, Method, Nmax=None, sampling=None, refine=True,
+                 source=None, trace=None, cache=None, levels=1):
+    parameters = dict(tolerance=tolerance, L0=L0, L=L, d0=d0, delta=delta, h=h, R=R, a=a, w=w, rho=rho, I=I, N=N,
+                      Method=Method, Nmax=Nmax, refine=refine, levels=levels)
+
+    M = int(L/w)  # number of the spiral coils; must be odd
+    M = M + 1 if M % 2 == 0 else M + 2
+    zm = np.array(list(map(lambda m: -((M - 1)/2) * w + w * m, range(M))))  # coordinates of the spirals for [-L/2,L/2]
+
+    zq, b0 = InductionSampling(L0, w, source) if sampling is None else sampling
+    Q = len(zq)
+
+    # Some initial constants used in the functions: total conductor diameter including the isolation, adjusted
+    # internal radius and the spiral constants (see SpiralCoil.py)
+    geometry = spiral_geometry(d0, delta, R)
+    d, R, gamma, theta1, gtd1 = geometry.d, geometry.R, geometry.gamma, geometry.theta1, geometry.gtd1
+    parameters.update(d=d, R_adjusted=R, M=M, Q=Q)
+
+    engine = FieldEngine(zm, zq, b0, d, gamma, theta1, a, I)
+    fun, jac, hess, hessp = engine.fun, engine.jac, engine.hess, engine.hessp
 
     # Minimisation algorithm:
     # https://docs.scipy.org/doc/scipy/reference/generated/scipy.optimize.minimize.html#id1
     # We will use only these four methods: trust-exact (1), trust-krylov (2), trust-ncg (3), Newton-CG (4)
+    # or the least-squares methods working directly with the residual vector and its Jacobian:
+    # https://docs.scipy.org/doc/scipy/reference/generated/scipy.optimize.least_squares.html
+    # trust region reflective (5); the turns can be bounded with Nmax: |turns| <= Nmax. The method 5 bounds the
+    # angles during the optimisation; for the methods 1-4 the continuous solution is free and its full turns are
+    # clipped to +/-Nmax (clip_turns, at the start of the refinement)
+    # trust-exact factorises the M x M Hessian; the methods 2-4 only need its products with vectors (hessp), so the
+    # Hessian is never formed for them: O(M Q) memory and work per conjugate gradient step instead of O(M^2 Q)
     x0 = np.full(M, N * 2.0 * pi)  # array with the initial degrees (rads), where N is the initial number of turns
     if Method == 1:
         optimisation = 'trust-exact'
@@ -127,96 +195,251 @@ def TurnsOptimisation(tolerance, L0, L, d0, delta, h, R, a, w, rho, I, N, Method
         optimisation = 'trust-krylov'
     elif Method == 3:
         optimisation = 'trust-ncg'
+    elif Method == 5:
+        optimisation = 'trf'
     else:
         optimisation = 'Newton-CG'
 
-    result = minimize(fun, x0, method = optimisation, jac = jac, hess = hess, tol = tolerance)
-    xs = np.array(result.x)  # array of the optimised values of the variable "hi" in Eq. (29)
-    turns = (xs / (2.0 * pi)).astype(int)  # angles converted to the full turns
+    # Stored solution (rho and h do not change it) or the closest one as the starting point (see ResultCache.py).
+    # The key includes the hash of the field model, so solutions of an older model of the kernels are not reused.
+    start = 'initial'
+    stored = None
+    if cache is not None:
+        cache = ResultCache(cache) if isinstance(cache, str) else cache
+        settings = {name: parameters[name] for name in ('tolerance', 'L0', 'L', 'd0', 'delta', 'R', 'a', 'w', 'I', 'N',
+                                                        'Method', 'Nmax', 'refine', 'levels')}
+        settings['model'] = model_hash()
+        key = cache_key('turns', settings, b0)
+        features = {name: float(parameters[name]) for name in ('L0', 'L', 'd0', 'delta', 'R', 'a', 'w', 'I')}
+        stored = cache.get(key)
+        nearest = cache.nearest('turns', M, features) if stored is None else None
+        if nearest is not None:
+            x0, start = nearest[0]['angles'], 'warm'
+    if stored is None and start == 'initial' and levels > 1 and L0 / (COARSENING * w) >= MIN_SAMPLES:
+        x0, coarse = CoarseStart(tolerance, L0, L, d0, delta, h, R, a, w, rho, I, N, Method, Nmax, source, trace,
+                                 levels, zm)
+        start = 'coarse'
+        parameters.update(coarse_nfev=coarse.nfev, coarse_nit=coarse.nit)
+
+    if stored is not None:
+        arrays, info = stored
+        start = 'cached'
+        result = OptimizeResult(info)  # solver statistics of the stored solution
+        xs, turns, moves = arrays['angles'], arrays['turns'], info['moves']
+        residual = engine.residual(xs).copy()
+        error = engine.Bz_test(turns * 2.0 * pi) + b0
+    else:
+        # The gradient of the trace is 2 D r, the engine has just been updated by the Jacobian. The method 5 logs the
+        # cost |r / scale|^2 / 2 of the normalised residuals, so its gradient is logged on the same scale.
+        scale = np.linalg.norm(b0) or 1.0  # residuals in Tesla are normalised to make the tolerance relative
+        gradient = engine.jac if Method != 5 else lambda x: engine.jac(x) / (2.0 * scale**2)
+        tracer = None if trace is None else SolverTrace(trace, gradient=gradient, method=optimisation, start=start,
+                                                        **parameters)
+        wrap = (lambda name, function: function) if tracer is None else tracer.wrap
+        callback = None if tracer is None else tracer.callback
+        with nullcontext() if tracer is None else tracer:
+            if Method == 5:
+                bounds = (-np.inf, np.inf) if Nmax is None else (-Nmax * 2.0 * pi, Nmax * 2.0 * pi)
+                x0 = np.clip(x0, bounds[0], bounds[1])
+                result = least_squares(wrap('fun', lambda x: engine.residual(x) / scale), x0,
+                                       jac = wrap('jac', lambda x: engine.jacobian(x) / scale), bounds = bounds,
+                                       method = optimisation, ftol = tolerance, xtol = tolerance, gtol = tolerance,
+                                       callback = callback)
+            elif Method == 1:
+                result = minimize(wrap('fun', fun), x0, method = optimisation, jac = wrap('jac', jac),
+                                  hess = wrap('hess', hess), tol = tolerance, callback = callback)
+            else:
+                result = minimize(wrap('fun', fun), x0, method = optimisation, jac = wrap('jac', jac),
+                                  hessp = wrap('hessp', hessp), tol = tolerance, callback = callback)
+            if tracer is not None:
+                tracer.finish(result)
+        xs = np.array(result.x)  # array of the optimised values of the variable "hi" in Eq. (29)
+        residual = engine.residual(xs).copy()  # per-point residuals Bz + B0 of the continuous solution
+        turns = (xs / (2.0 * pi)).astype(int)  # angles converted to the full turns
+        moves = 0
+        if refine:
+            turns, error, moves = RefineTurns(engine, turns, Nmax)
+
+        # Quality of the optimisation
+        if not refine:
+            turns = clip_turns(turns, Nmax)
+            error = engine.Bz_test(turns * 2.0 * pi) + b0
+
+        if cache is not None:
+            cache.put(key, 'turns', M, features, dict(angles=xs, turns=turns),
+                      dict(nfev=int(result.nfev), njev=int(result.njev), nit=int(getattr(result, 'nit', result.njev)),
+                           success=bool(result.success), message=str(result.message), moves=int(moves)))
     xs_adj = turns * 2.0 * pi  # adjusted 'hi' for the full turns
 
-    # Quality of the optimisation
-    error = [lambda q: (Bz_test(xs_adj, q) + b0[q]) for q in range(Q)]
-    error = np.array([func(q) for q, func in enumerate(error)])
-
-    def plot_and_save_data(x, y, title, xlabel, ylabel, filename):
-        plt.plot(x, y)
-        plt.xlabel(xlabel)
-        plt.ylabel(ylabel)
-        plt.title(title)
-        plt.grid(True)
-        plt.tight_layout()
-        plt.show()
-
-        data = np.column_stack((x, y))
-        np.savetxt(filename, data, delimiter=",")
-
-    def plot_and_save_data_with_legend(x1, y1, x2, y2, title, xlabel, ylabel, filename):
-        plt.plot(x1, y1, color='blue', label='B0')
-        plt.plot(x2, y2, color='green', label='B0 + Bz')
-        plt.xlabel(xlabel)
-        plt.ylabel(ylabel)
-        plt.title(title)
-        plt.legend()
-        plt.tight_layout()
-        plt.grid(True)
-        plt.show()
-
-        data = np.column_stack((x1, y1, y2))
-        np.savetxt(filename, data, delimiter=",")
+    # Calculation of the individual resistances of the spiral coils and the total resistance of the stack
+    gtd2 = geometry.gtd(theta1 + np.abs(xs_adj))
+    # Spiral length and resistance
+    spiral_length = SpiralLength(gamma, gtd1, gtd2)
+    wire_resistance = WireResistance(spiral_length, rho, d0)
+    strip_resistance = StripResistance(spiral_length, rho, d0, h)
+
+    # Coil stack parameters
+    total_wire_resistance = np.sum(wire_resistance)  # resistance (Ohms)
+    total_strip_resistance = np.sum(strip_resistance)  # resistance (Ohms)
+
+    return TurnsResult(zm=zm, zq=zq, b0=b0, angles=xs, residual=residual, turns=turns, error=error,
+                       spiral_length=spiral_length, wire_resistance=wire_resistance,
+                       strip_resistance=strip_resistance,
+                       total_spiral_length=np.sum(spiral_length),
+                       total_wire_resistance=total_wire_resistance,
+                       total_strip_resistance=total_strip_resistance,
+                       wire_current_power=total_wire_resistance * I**2,
+                       strip_current_power=total_strip_resistance * I**2,
+                       optimisation=optimisation, nfev=result.nfev, njev=result.njev,
+                       nit=getattr(result, 'nit', result.njev), success=bool(result.success),
+                       message=str(result.message), moves=moves, start=start, parameters=parameters)
+
+
+# Starting point of the multigrid: the continuous solution for the pitch COARSENING * w (itself started from a coarser
+# grid while levels remain) transferred to the spirals zm. The coarse angles are interpolated linearly to the fine
+# spirals and divided by COARSENING, since COARSENING fine spirals share the length of one coarse spiral; this keeps
+# the induction of the coarse solution (the scale of the least square value along the interpolated profile).
+# Every fine spiral starts with turns: at x = 0 the field of a spiral and its derivative vanish, so a spiral started
+# without turns would have a zero gradient and never move.
+# Returns the angles and the TurnsResult of the coarse level.
+def CoarseStart(tolerance, L0, L, d0, delta, h, R, a, w, rho, I, N, Method, Nmax, source, trace, levels, zm):
+    coarse = TurnsProfile(tolerance, L0, L, d0, delta, h, R, a, COARSENING * w, rho, I, N, Method, Nmax,
+                          refine=False, source=source, trace=trace, levels=levels - 1)
+    return np.interp(zm, coarse.zm, coarse.angles) / COARSENING, coarse
+
+
+# Full turns limited to +/-Nmax (as integers; Nmax None for no bound)
+def clip_turns(turns, Nmax=None):
+    turns = np.asarray(turns, dtype=int)
+    return turns if Nmax is None else np.clip(turns, -int(Nmax), int(Nmax)).astype(int)
+
+# Integer post-optimisation of the full turns by coordinate descent: each spiral in turn tries +/-1 turn and keeps the
+# move that lowers the least square value the most, until a whole sweep over the stack brings no improvement.
+# The residual is updated by replacing the column of one spiral, so every trial move costs O(Q).
+# With Nmax the starting turns are clipped to +/-Nmax and no move leaves this range.
+# Returns the refined turns, their residual Bz_test + B0 and the number of accepted moves.
+def RefineTurns(engine, turns, Nmax=None, max_sweeps=100):
+    turns = clip_turns(turns, Nmax).copy()
+    residual = engine.Bz_test(turns * 2.0 * pi) + engine.b0
+    value = residual @ residual
+    moves = 0
+    for sweep in range(max_sweeps):
+        improved = False
+        for m in range(len(turns)):
+            column = engine.turns_column(m, turns[m])
+            best = None
+            for n in (turns[m] - 1, turns[m] + 1):
+                if Nmax is not None and abs(n) > Nmax:
+                    continue
+                trial = residual - column + engine.turns_column(m, n)
+                trial_value = trial @ trial
+                if trial_value < value and (best is None or trial_value < best[0]):
+                    best = (trial_value, n, trial)
+            if best is not None:
+                value, turns[m], residual = best
+                moves += 1
+                improved = True
+        if not improved:
+            break
+    return turns, residual, moves
+
+
+def plot_data(x, y, title, xlabel, ylabel):
+    import matplotlib.pyplot as plt
+    plt.plot(x, y)
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    plt.title(title)
+    plt.grid(True)
+    plt.tight_layout()
+    plt.show()
+
+def plot_data_with_legend(x1, y1, x2, y2, title, xlabel, ylabel):
+    import matplotlib.pyplot as plt
+    plt.plot(x1, y1, color='blue', label='B0')
+    plt.plot(x2, y2, color='green', label='B0 + Bz')
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    plt.title(title)
+    plt.legend()
+    plt.tight_layout()
+    plt.grid(True)
+    plt.show()
+
+# Optional sink: plots of the residual induction and of the optimised profiles
+def plot_turns_result(result):
+    plot_data(result.zq, result.b0, "Residual induction", "z0, m", "B0, T")
 
     # Plot 1: Turns profile
-    plot_and_save_data(zm, turns, "Turns profile", "z0, m", "Full turns", "turns_profile.csv")
+    plot_data(result.zm, result.turns, "Turns profile", "z0, m", "Full turns")
 
     # Plot 2: Error profile
-    plot_and_save_data(zq, error, "Error profile", "z0, m", "Error, T", "error_profile.csv")
+    plot_data(result.zq, result.error, "Error profile", "z0, m", "Error, T")
 
     # Plot 3: Induction profile before and after optimization
-    plot_and_save_data_with_legend(zq, b0, zq, error, "Induction profile before and after optimization", "z0, m",
-                                   "Induction, T", "induction_profile.csv")
+    plot_data_with_legend(result.zq, result.b0, result.zq, result.error,
+                          "Induction profile before and after optimization", "z0, m", "Induction, T")
 
-    # Calculation of the individual resistances of the spiral coils and the total resistance of the stack
-    wire_resistance = []
-    strip_resistance = []
-    spiral_length = []
-    for m in range(M):
-        if xs_adj[m] < 0.0:
-            theta2 = theta1 - xs_adj[m]
-        else:
-            theta2 = theta1 + xs_adj[m]
-        gtd2 = 2.0 * gamma * theta2 + d
-        # Spiral length and resistance
-        val1 = (4.0 * gamma**2 + gtd1**2)**0.5
-        val2 = (4.0 * gamma**2 + gtd2**2)**0.5
-        length = ((gtd2/(8.0 * gamma)) * val2 - (gtd1/(8.0 * gamma)) * val1 +
-                     (gamma / 2) * np.log((gtd2 + val2) / (gtd1 + val1)))
-        spiral_length.append(length)
-        wire_resistance.append(rho * length / ((pi / 4.0) * d0**2))
-        strip_resistance.append(rho * length / (d0 * h))
+# Optional sink: CSV profiles and the text file with the design parameters written to the folder
+def save_turns_result(result, folder="."):
+    p = result.parameters
+    path = lambda filename: os.path.join(folder, filename)
+    os.makedirs(folder, exist_ok=True)
+
+    np.savetxt(path("turns_profile.csv"), np.column_stack((result.zm, result.turns)), delimiter=",")
+    np.savetxt(path("error_profile.csv"), np.column_stack((result.zq, result.error)), delimiter=",")
+    np.savetxt(path("induction_profile.csv"), np.column_stack((result.zq, result.b0, result.error)), delimiter=",")
+
+    # Residuals of the continuous solution before the conversion to the full turns
+    np.savetxt(path("residual_profile.csv"), np.column_stack((result.zq, result.residual)), delimiter=",")
 
     # Writing the wire and microstrip resistances to the file
-    data = np.column_stack((zm, spiral_length, wire_resistance, strip_resistance))
-    csv_file = "length_resistance_profiles.csv"
-    np.savetxt(csv_file, data, delimiter=",", header="zm(m), Length(m), R_wires(Ohms), R_strips(Ohms)", comments='')
+    data = np.column_stack((result.zm, result.spiral_length, result.wire_resistance, result.strip_resistance))
+    np.savetxt(path("length_resistance_profiles.csv"), data, delimiter=",",
+               header="zm(m), Length(m), R_wires(Ohms), R_strips(Ohms)", comments='')
 
-    # Coil stack parameters
-    total_spiral_length = np.sum(spiral_length)  # length (m)
-    total_wire_resistance = np.sum(wire_resistance)  # resistance (Ohms)
-    total_strip_resistance = np.sum(strip_resistance)  # resistance (Ohms)
-    wire_current_power = total_wire_resistance * I**2  # power dissipated in the whole wire stack
-    strip_current_power = total_strip_resistance * I**2  # power dissipated in the whole strip stack
-
-    with open('design_parameters_for_turns.txt', 'w') as file:
-        file.write(f'total current through all spiral coils = {I} A\n')
-        file.write(f'strip thickness = {h} m\n')
-        file.write(f'conductor diameter/width without isolation/gap = {d0} m\n')
-        file.write(f'total conductor diameter/width = {d} m\n')
-        file.write(f'total substrate width, including the wire diameter = {w} m\n')
-        file.write(f'residual induction length = {L0} m\n')
-        file.write(f'total optimisation length = {L} m\n')
-        file.write(f'adjusted internal radius = {R} m\n')
-        file.write(f'total length of the spirals = {total_spiral_length} m\n')
-        file.write(f'total wire resistance = {total_wire_resistance} Ohms\n')
-        file.write(f'total strip resistance = {total_strip_resistance} Ohms\n')
-        file.write(f'power dissipated in the whole wire stack = {wire_current_power} W\n')
-        file.write(f'power dissipated in the whole strip stack = {strip_current_power} W\n')
\ No newline at end of file
+    with open(path('design_parameters_for_turns.txt'), 'w') as file:
+        file.write(f'total current through all spiral coils = {p["I"]} A\n')
+        file.write(f'strip thickness = {p["h"]} m\n')
+        file.write(f'conductor diameter/width without isolation/gap = {p["d0"]} m\n')
+        file.write(f'total conductor diameter/width = {p["d"]} m\n')
+        file.write(f'total substrate width, including the wire diameter = {p["w"]} m\n')
+        file.write(f'residual induction length = {p["L0"]} m\n')
+        file.write(f'total optimisation length = {p["L"]} m\n')
+        file.write(f'adjusted internal radius = {p["R_adjusted"]} m\n')
+        file.write(f'total length of the spirals = {result.total_spiral_length} m\n')
+        file.write(f'total wire resistance = {result.total_wire_resistance} Ohms\n')
+        file.write(f'total strip resistance = {result.total_strip_resistance} Ohms\n')
+        file.write(f'power dissipated in the whole wire stack = {result.wire_current_power} W\n')
+        file.write(f'power dissipated in the whole strip stack = {result.strip_current_power} W\n')
+        file.write(f'optimisation method = {result.optimisation}\n')
+        file.write(f'function evaluations = {result.nfev}\n')
+        file.write(f'Jacobian evaluations = {result.njev}\n')
+        file.write(f'least square value = {result.residual @ result.residual} T^2\n')
+        file.write(f'least square value for the full turns = {result.error @ result.error} T^2\n')
+        file.write(f'integer refinement moves = {result.moves}\n')
+        file.write(f'starting point = {result.start}\n')
+
+
+# Optional sink: the whole result in one binary bundle (see Bundle.py), by default a new turns_<date>-<time>.shim
+# file in the folder. The CSV files can be written later: save_turns_result(load_turns_bundle(filename))
+def save_turns_bundle(result, filename=None, folder="."):
+    return save_result(filename or unique_name("turns", folder), 'turns', result, kernel_model=model_hash())
+
+def load_turns_bundle(filename):
+    return load_result(filename, TurnsResult)
+
+
+# Optimisation called from the GUI: computation followed by the plots and the bundle in the working folder;
+# csv adds the CSV profiles and the text file of the design parameters
+def TurnsOptimisation(tolerance, L0, L, d0, delta, h, R, a, w, rho, I, N, Method, Nmax=None, refine=True, plot=True,
+                      save=True, trace=None, cache=None, csv=False, levels=1):
+    result = TurnsProfile(tolerance, L0, L, d0, delta, h, R, a, w, rho, I, N, Method, Nmax, refine=refine,
+                          trace=trace, cache=cache, levels=levels)
+    if plot:
+        plot_turns_result(result)
+    if save:
+        save_turns_bundle(result)
+        if csv:
+            save_turns_result(result)
+    return result
@@ -1,11 +1,13 @@
 #
 # Single-axis residual induction (T, Tesla) as a function of the z0 coordinate.
-# You can use a polynomial or any other fitting function of a single variable to describe the residual field.
+# You can use a polynomial or any other fitting function of a single variable to describe the residual field,
+# or a measured profile: B0 = load_field("field_map.csv") (see ResidualField.py in the Shimming_Core_Python folder).
 #
 
-# A residual field provided by the mmWave lab at the University of St. Andrews, Scotland.
-def B0(z0):
-    value = -5.859e-6 + 4.766114e-3 * z0 - 0.486506371 * z0**2 - 1.4609783504e1 * z0**3 + 4.2600403748e2 * z0**4 +\
-            3.04437e4 * z0**5 - 8.75637e5 * z0**6 - 7.65903e6 * z0**7 + 1.46997e8 * z0**8
-    return value
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Shimming_Core_Python'))
+from ResidualField import PolynomialField, load_field, sample, ST_ANDREWS
 
+# A residual field provided by the mmWave lab at the University of St. Andrews, Scotland.
+B0 = ST_ANDREWS
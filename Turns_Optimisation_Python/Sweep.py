@@ -0,0 +1,191 @@
+#
+# Parameter sweep over the design space of the turns optimisation.
+# The points are optimised in parallel by a process pool, every finished point is appended to one CSV table and
+# the points already in the table are skipped, so an interrupted sweep continues where it stopped.
+# The residual induction is sampled once for each (L0, w) pair and shared with all worker processes.
+#
+# Examples (the parameters which are not swept are taken from parameters.txt):
+#   python Sweep.py a=0.5,1,2 Method=1,3,5 w=0.001,0.002
+#   python Sweep.py --file sweep.json --table sweep_results.csv --workers 8
+#   python Sweep.py a=0.5,1,2 --source field_map.csv --table field_map_results.csv
+#   python Sweep.py a=0.5,1,2 --bundle sweep.shim     the whole table also in one binary bundle (see Bundle.py)
+# where sweep.json contains {"base": {...}, "grid": {"a": [0.5, 1.0], ...}} or {"base": {...}, "points": [{...}, ...]}
+#
+
+import os
+os.environ.setdefault("OMP_NUM_THREADS", "1")  # one BLAS thread per process, the pool uses all cores
+os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+
+import sys
+import csv
+import json
+import time
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from Optimisation import InductionSampling, TurnsProfile
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Shimming_Core_Python'))
+from Bundle import save_bundle
+
+PARAMETERS_FILE = "parameters.txt"
+PARAMETERS = ('tolerance', 'L0', 'L', 'd0', 'delta', 'h', 'R', 'a', 'w', 'rho', 'I', 'N', 'Nmax', 'Method', 'levels')
+INTEGER_PARAMETERS = ('N', 'Nmax', 'Method', 'levels')
+TEXT_COLUMNS = ('key', 'optimisation', 'message')
+RESULTS = ('M', 'Q', 'total_spiral_length', 'total_wire_resistance', 'total_strip_resistance', 'wire_current_power',
+           'strip_current_power', 'least_square', 'error_rms', 'error_max', 'optimisation', 'nfev', 'njev', 'nit',
+           'moves', 'success', 'message', 'time', 'turns')
+# Nmax stays after the parameters, the column order of the tables written before
+COLUMNS = ('key',) + tuple(name for name in PARAMETERS if name != 'Nmax') + ('Nmax',) + RESULTS
+
+# Parameters in the order of the GUI (same format as parameters.txt)
+def load_base(filename=PARAMETERS_FILE):
+    with open(filename, "r") as file:
+        values = [line.strip() for line in file if line.strip()]
+    if len(values) < len(PARAMETERS):  # file saved before the Nmax entry
+        values.insert(PARAMETERS.index('Nmax'), 'none')
+    return {name: convert(name, value) for name, value in zip(PARAMETERS, values)}
+
+def convert(name, value):
+    if value is None or str(value).strip().lower() in ('', 'none'):
+        return None
+    return int(value) if name in INTEGER_PARAMETERS else float(value)
+
+# All combinations of the grid values added to the base parameters
+def grid_points(base, grid):
+    names = list(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        point = dict(base)
+        point.update({name: convert(name, value) for name, value in zip(names, values)})
+        yield point
+
+# The residual field source is part of the key only when it is not the default B0
+def point_key(point, source=None):
+    key = {name: point.get(name) for name in PARAMETERS}
+    if source is not None:
+        key['source'] = source
+    return json.dumps(key, sort_keys=True)
+
+
+_samplings = {}  # (L0, w) -> (zq, b0) shared with the worker processes
+_source = None  # residual field source of the coarse multigrid levels
+
+def init_worker(samplings, source=None):
+    global _samplings, _source
+    _samplings, _source = samplings, source
+
+# Optimisation of one point in a worker process; the errors are recorded instead of stopping the sweep
+def run_point(key, point):
+    start = time.perf_counter()
+    row = {}
+    try:
+        result = TurnsProfile(**point, sampling=_samplings.get((point['L0'], point['w'])), source=_source)
+        p = result.parameters
+        row.update(M=p['M'], Q=p['Q'], total_spiral_length=result.total_spiral_length,
+                   total_wire_resistance=result.total_wire_resistance,
+                   total_strip_resistance=result.total_strip_resistance,
+                   wire_current_power=result.wire_current_power, strip_current_power=result.strip_current_power,
+                   least_square=result.residual @ result.residual, error_rms=np.sqrt(np.mean(result.error**2)),
+                   error_max=np.max(np.abs(result.error)), optimisation=result.optimisation, nfev=result.nfev,
+                   njev=result.njev, nit=result.nit, moves=result.moves, success=result.success,
+                   message=result.message,
+                   turns=' '.join(str(n) for n in result.turns))
+    except Exception as error:
+        row.update(success=False, message=f'{type(error).__name__}: {error}')
+    row['time'] = time.perf_counter() - start
+    return key, row
+
+# Keys of the points already in the table; a line left unfinished by a crash is removed
+def completed_keys(table):
+    if not os.path.exists(table):
+        return set()
+    with open(table, "rb+") as file:
+        data = file.read()
+        if data and not data.endswith(b"\n"):
+            file.truncate(data.rfind(b"\n") + 1)
+    with open(table, "r", newline="") as file:
+        return {row['key'] for row in csv.DictReader(file)}
+
+# Runs all points which are not yet in the table and appends the results as they finish.
+# source is the file of a measured residual field profile (see ResidualField.py); B0 by default.
+def RunSweep(points, table="sweep_results.csv", workers=None, progress=print, source=None):
+    points = {point_key(point, source): point for point in points}
+    done = completed_keys(table)
+    todo = {key: point for key, point in points.items() if key not in done}
+    progress(f"{len(points)} points, {len(points) - len(todo)} already in {table}, {len(todo)} to run")
+    if not todo:
+        return
+
+    samplings = {}
+    for point in todo.values():
+        if (point['L0'], point['w']) not in samplings:
+            samplings[(point['L0'], point['w'])] = InductionSampling(point['L0'], point['w'], source)
+
+    new_table = not os.path.exists(table) or os.path.getsize(table) == 0
+    with open(table, "a", newline="") as file, \
+            ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(samplings, source)) as pool:
+        writer = csv.DictWriter(file, fieldnames=COLUMNS)
+        if new_table:
+            writer.writeheader()
+        futures = [pool.submit(run_point, key, point) for key, point in todo.items()]
+        for count, future in enumerate(as_completed(futures), 1):
+            key, row = future.result()
+            row.update(todo[key], key=key)
+            writer.writerow(row)
+            file.flush()
+            progress(f"{count}/{len(todo)} {'ok' if row['success'] else 'failed'} {row['time']:.2f} s {key}")
+
+# The table in one bundle: a column array per column (NaN for the missing values of the failed points), success
+# as booleans and the turns of all points concatenated, those of the row i being turns[turns_offsets[i]:
+# turns_offsets[i + 1]]
+def table_to_bundle(table, filename):
+    with open(table, "r", newline="") as file:
+        rows = list(csv.DictReader(file))
+    arrays = {}
+    for name in COLUMNS:
+        values = [row.get(name) or '' for row in rows]
+        if name in TEXT_COLUMNS:
+            arrays[name] = np.array(values, dtype=str)
+        elif name == 'success':
+            arrays[name] = np.array([value == 'True' for value in values], dtype=bool)
+        elif name == 'turns':
+            turns = [np.array(value.split(), dtype=np.int64) for value in values]
+            arrays['turns'] = np.concatenate(turns) if turns else np.zeros(0, dtype=np.int64)
+            arrays['turns_offsets'] = np.cumsum([0] + [len(n) for n in turns], dtype=np.int64)
+        else:
+            arrays[name] = np.array([float(value) if value not in ('', 'None') else np.nan for value in values])
+    return save_bundle(filename, 'sweep', arrays, results=dict(points=len(rows)), table=os.path.abspath(table))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parameter sweep of the turns optimisation")
+    parser.add_argument("grid", nargs="*", help="swept parameters, e.g. a=0.5,1,2 Method=1,3")
+    parser.add_argument("--file", help="JSON file with the base parameters and the grid or the list of points")
+    parser.add_argument("--base", default=PARAMETERS_FILE, help="file with the base parameters")
+    parser.add_argument("--table", default="sweep_results.csv", help="CSV table with the results")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (all cores by default)")
+    parser.add_argument("--source", default=None, help="CSV or .npy file with a measured residual field profile")
+    parser.add_argument("--bundle", default=None, help="binary bundle of the whole table written after the sweep")
+    args = parser.parse_args()
+
+    base = load_base(args.base) if os.path.exists(args.base) else {}
+    base.setdefault('Nmax', None)
+    base.setdefault('levels', 1)  # parameters.txt without the multigrid levels
+    grid = {}
+    points = []
+    if args.file:
+        with open(args.file, "r") as file:
+            spec = json.load(file)
+        base.update({name: convert(name, value) for name, value in spec.get("base", {}).items()})
+        grid.update(spec.get("grid", {}))
+        points.extend(dict(base, **{name: convert(name, value) for name, value in point.items()})
+                      for point in spec.get("points", []))
+    for item in args.grid:
+        name, values = item.split("=")
+        grid[name] = values.split(",")
+    if grid or not points:
+        points.extend(grid_points(base, grid))
+
+    RunSweep(points, args.table, args.workers, source=args.source)
+    if args.bundle:
+        table_to_bundle(args.table, args.bundle)
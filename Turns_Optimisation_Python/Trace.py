@@ -0,0 +1,133 @@
+#
+# Per-iteration trace of the optimisation appended to a JSONL file (one JSON object per line).
+# SolverTrace wraps the function, the Jacobian and the Hessian (or its product) given to the solver: it counts their
+# calls and adds up the wall time spent in each of them. Its callback is called by the solver after every iteration
+# and records
+#   fun       the least square value (minimize) or the cost |r|^2 / 2 of the normalised residuals (least_squares)
+#   gradient  the norm of the gradient at the current point (the trust region methods evaluate it after the
+#             callback; it is added to the line before the line is written)
+#   step      the norm of the last proposed step and accepted, whether it was taken; the solvers do not expose the
+#             trust radius, but a trust region step is limited by it (equal when it reaches the boundary), so the
+#             radius changes show up as the ratio of the consecutive steps: 1/4 after a bad step, 2 after a good one
+#   calls, seconds  cumulated calls and wall time of every wrapped function
+#   warnings  floating point errors (overflow in dBz, see FieldEngine.update) raised since the previous iteration,
+#             by the wrapped function in which they occurred or by the solver itself
+# The lines are kept in memory and written every `flush` iterations and when the trace is closed.
+#
+# Example:
+#   with SolverTrace("trace.jsonl", method='trust-exact') as trace:
+#       minimize(trace.wrap('fun', fun), x0, jac=trace.wrap('jac', jac), hess=trace.wrap('hess', hess),
+#                method='trust-exact', callback=trace.callback)
+#
+
+import json
+import time
+from collections import Counter, defaultdict
+import numpy as np
+
+class SolverTrace:
+    # gradient(x) returns the gradient when the wrapped Jacobian is a matrix (least-squares methods); it is called
+    # right after the Jacobian, so it should reuse what was calculated for it. header is written in the first line.
+    def __init__(self, filename, gradient=None, flush=20, **header):
+        self.filename = filename
+        self.gradient = gradient
+        self.flush = flush
+        self.records = []  # lines not yet written
+        self.calls = Counter()
+        self.seconds = defaultdict(float)
+        self.warnings = Counter()
+        self.gradients = {}  # x.tobytes() -> gradient norm at the points of the current iteration
+        self.active = 'solver'
+        self.iteration = 0
+        self.x = None  # last accepted point
+        self.proposed = None  # last point at which the function was evaluated
+        self.previous_step = None
+        self.start = time.perf_counter()
+        self.errstate = np.errstate(over='call', invalid='call', divide='call', call=self.floating_error)
+        self.write(dict(event='start', time=time.time(), **header))
+
+    def __enter__(self):
+        self.errstate.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.errstate.__exit__(*exc_info)
+        if exc_info[0] is not None:
+            self.write(dict(event='error', error=f'{exc_info[0].__name__}: {exc_info[1]}', **self.totals()))
+        self.close()
+
+    def floating_error(self, kind, flag):
+        self.warnings[f'{kind} in {self.active}'] += 1
+
+    def write(self, record):
+        self.records.append(record)
+
+    # Appends the lines to the file, except the last `keep` ones
+    def write_records(self, keep=0):
+        count = len(self.records) - keep
+        if count > 0:
+            with open(self.filename, "a") as file:
+                file.write(''.join(json.dumps(record) + '\n' for record in self.records[:count]))
+            del self.records[:count]
+
+    def close(self):
+        self.write_records()
+
+    def totals(self):
+        return dict(time=time.perf_counter() - self.start, calls=dict(self.calls),
+                    seconds={name: round(value, 6) for name, value in self.seconds.items()})
+
+    # Function with the same arguments and value, counted and timed under the given name
+    def wrap(self, name, function):
+        def wrapped(x, *args):
+            self.active = name
+            start = time.perf_counter()
+            value = function(x, *args)
+            self.seconds[name] += time.perf_counter() - start
+            self.calls[name] += 1
+            self.active = 'solver'
+            if name == 'fun':
+                self.proposed = np.array(x, dtype=float)
+                if self.x is None and self.iteration == 0:
+                    self.x = self.proposed  # initial point
+            elif name == 'jac':
+                gradient = value if np.ndim(value) == 1 or self.gradient is None else self.gradient(x)
+                x = np.asarray(x, dtype=float)
+                self.gradients[x.tobytes()] = float(np.linalg.norm(gradient))
+                last = self.records[-1] if self.records else {}
+                if last.get('event') == 'iteration' and last['gradient'] is None and np.array_equal(x, self.x):
+                    last['gradient'] = self.gradients[x.tobytes()]
+            return value
+        return wrapped
+
+    # Solver callback: callback(intermediate_result) of minimize and least_squares
+    def callback(self, intermediate_result):
+        self.iteration += 1
+        x = np.asarray(intermediate_result.x, dtype=float)
+        record = dict(event='iteration', iteration=self.iteration,
+                      fun=float(intermediate_result.get('cost', intermediate_result.fun)),
+                      gradient=self.gradients.get(x.tobytes()))
+        if self.x is not None and self.proposed is not None:
+            step = float(np.linalg.norm(self.proposed - self.x))
+            record.update(step=step, accepted=bool(np.array_equal(self.proposed, x)))
+            if self.previous_step:
+                record['step_ratio'] = step / self.previous_step
+            self.previous_step = step
+        record.update(self.totals())
+        if self.warnings:
+            record['warnings'] = dict(self.warnings)
+            self.warnings.clear()
+        self.write(record)
+        self.x = x.copy()
+        self.gradients = {key: value for key, value in self.gradients.items() if key == x.tobytes()}
+        if self.iteration % self.flush == 0:
+            self.write_records(keep=1)  # the last line may still get its gradient
+
+    # Last line with the solver result
+    def finish(self, result):
+        record = dict(event='end', success=bool(result.success), message=str(result.message),
+                      nit=int(getattr(result, 'nit', self.iteration)), **self.totals())
+        if self.warnings:
+            record['warnings'] = dict(self.warnings)
+            self.warnings.clear()
+        self.write(record)
@@ -8,7 +8,9 @@ import tkinter as tk
 from Optimisation import *
 
 PARAMETERS_FILE = "parameters.txt"
-NUM_PARAMETERS = 13
+CACHE_FOLDER = "result_cache"  # stored solutions: an unchanged problem is not solved again
+NUM_PARAMETERS = 15
+NMAX = 12  # index of the optional Nmax in the parameter list
 
 def stop_main():
     quit()
@@ -18,8 +20,10 @@ def run_main():
     # You can access the parameter values here and call your own function using the parameters
 
     # Retrieve the parameter values from the input fields
-    params = [float(entries[i].get()) for i in range(1, NUM_PARAMETERS - 1)]  # first part of the list
-    params.extend([int(entries[i].get()) for i in range(NUM_PARAMETERS - 1, NUM_PARAMETERS + 1)])  # second part
+    params = [float(entries[i].get()) for i in range(1, NUM_PARAMETERS - 3)]  # first part of the list
+    params.append(int(entries[NUM_PARAMETERS - 3].get()))  # second part
+    params.append(optional_turns(entries[NUM_PARAMETERS - 2].get()))  # Nmax: "none" for no bound
+    params.extend([int(entries[i].get()) for i in range(NUM_PARAMETERS - 1, NUM_PARAMETERS + 1)])  # third part
 
     # Save the parameter values to a file
     save_parameters(params)
@@ -37,29 +41,41 @@ def run_main():
     # params[9] rho: conductor resistivity (Ohm*m)
     # params[10] I: fixed current (A) through all spiral coils
     # params[11] N: Initial number of turns (positive or negative)
-    # params[12] Method: trust-exact (1), trust-krylov (2), trust-ncg (3), Newton-CG (4)
+    # params[12] Nmax: maximum number of the full turns of a spiral, |turns| <= Nmax; None (none) for no bound
+    # params[13] Method: trust-exact (1), trust-krylov (2), trust-ncg (3), Newton-CG (4),
+    #            least-squares trust region reflective (5)
+    # params[14] levels: number of the multigrid levels, the coarser ones with twice the pitch; 1 for no multigrid
 
     TurnsOptimisation(params[0], params[1], params[2], params[3], params[4], params[5], params[6], params[7],
-                        params[8], params[9], params[10], params[11], params[12])
+                        params[8], params[9], params[10], params[11], params[13], params[12], levels=params[14],
+                        cache=CACHE_FOLDER)
+
+# Optional bound of the turns: "none" (or an empty field) means no bound
+def optional_turns(text):
+    return None if text.strip().lower() in ("", "none") else int(text)
 
 def save_parameters(params):
     # Save the parameter values to a file
     with open(PARAMETERS_FILE, "w") as file:
         for param in params:
-            file.write(f"{param}\n")
+            file.write(f"{'none' if param is None else param}\n")
 
 def load_parameters():
     # Load the parameter values from the file, if it exists
     if os.path.exists(PARAMETERS_FILE):
         with open(PARAMETERS_FILE, "r") as file:
-            lines = file.readlines()
+            lines = [line.strip() for line in file if line.strip()]
+            if len(lines) < NUM_PARAMETERS:  # file saved before the Nmax entry (and the multigrid levels)
+                lines.insert(NMAX, "none")
+                lines.extend(["1"] * (NUM_PARAMETERS - len(lines)))
             for i, line in enumerate(lines):
                 entry = entries[i+1]
                 entry.delete(0, tk.END)
-                entry.insert(0, line.strip())
+                entry.insert(0, line)
     else:
         # If the file doesn't exist, set default values for all parameters
         default_values = ["0"] * NUM_PARAMETERS
+        default_values[NMAX] = "none"
         for i, default_value in enumerate(default_values):
             entry = entries[i+1]
             entry.delete(0, tk.END)
@@ -89,7 +105,9 @@ param_labels = [
     'rho - conductor resistivity (Ohm*m): 1.68e-8 Cu, 2.65e-8 Al, 1.59e-8 Ag',
     'I - fixed current (A) through all spiral coils',
     'N - Initial number of turns (positive or negative)',
-    'Method - trust-exact (1), trust-krylov (2), trust-ncg (3), Newton-CG (4)'
+    'Nmax - maximum number of the full turns of a spiral (|turns| <= Nmax); none for no bound',
+    'Method - trust-exact (1), trust-krylov (2), trust-ncg (3), Newton-CG (4), least-squares TRF (5)',
+    'Levels - multigrid levels, each coarser one with twice the pitch w; 1 solves only at the pitch w'
 ]
 
 frame = tk.Frame(window, bg="pink")
@@ -0,0 +1,23 @@
+#
+# Tests of the multigrid start: every fine spiral starts with turns and the start keeps the coarse induction.
+# Run with: python -m pytest test_CoarseStart.py
+#
+
+import numpy as np
+from Optimisation import TurnsProfile, CoarseStart
+from test_RefineTurns import EXAMPLE, engine
+
+
+def test_no_spiral_without_turns():
+    result = TurnsProfile(*EXAMPLE, Method=3, levels=2, refine=False)
+    assert result.start == 'coarse'
+    assert np.all(result.angles != 0.0)
+
+def test_start_keeps_coarse_induction():
+    tolerance, L0, L, d0, delta, h, R, a, w, rho, I, N = EXAMPLE
+    fields = engine()
+    x0, coarse = CoarseStart(tolerance, L0, L, d0, delta, h, R, a, w, rho, I, N, 3, None, None, None, 2,
+                             fields.zm.ravel())
+    assert np.all(x0 != 0.0)
+    flat = np.full(len(x0), N * 2.0 * np.pi)
+    assert fields.fun(x0) < 1e-3 * fields.fun(flat)
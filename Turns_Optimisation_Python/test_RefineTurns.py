@@ -0,0 +1,61 @@
+#
+# Tests of the integer refinement of the full turns: it never raises the least square value, its incremental residual
+# stays equal to a fresh calculation, and with the bound Nmax the refinement and the turns profile of the methods
+# without bounds (1-4) never return more than Nmax turns.
+# Run with: python -m pytest test_RefineTurns.py
+#
+
+import numpy as np
+import pytest
+from Optimisation import TurnsProfile, FieldEngine, RefineTurns, InductionSampling
+from SpiralCoil import spiral_geometry, pi
+
+# Example of parameters.txt: tolerance, L0, L, d0, delta, h, R, a, w, rho, I, N
+EXAMPLE = (1e-08, 0.06, 0.1, 0.0005, 1e-05, 3.5e-05, 0.016, 1.0, 0.001, 1.68e-08, 0.2, 10)
+
+
+def engine():
+    tolerance, L0, L, d0, delta, h, R, a, w, rho, I, N = EXAMPLE
+    M = int(L / w)
+    M = M + 1 if M % 2 == 0 else M + 2
+    zm = -((M - 1) / 2) * w + w * np.arange(M)
+    zq, b0 = InductionSampling(L0, w)
+    g = spiral_geometry(d0, delta, R)
+    return FieldEngine(zm, zq, b0, g.d, g.gamma, g.theta1, a, I)
+
+
+def least_square(fields, turns):
+    residual = fields.Bz_test(turns * 2.0 * pi) + fields.b0
+    return residual @ residual
+
+@pytest.mark.parametrize("Nmax", [None, 8])
+def test_refine_never_raises_least_square(Nmax):
+    fields = engine()
+    rng = np.random.default_rng(1)
+    M = len(fields.zm)
+    for start in (np.zeros(M, dtype=int), np.full(M, 10), rng.integers(-15, 16, M)):
+        start = np.clip(start, -Nmax, Nmax) if Nmax is not None else start
+        turns, residual, moves = RefineTurns(fields, start, Nmax=Nmax)
+        assert least_square(fields, turns) <= least_square(fields, start)
+
+def test_incremental_residual():
+    fields = engine()
+    start = np.random.default_rng(2).integers(-20, 21, len(fields.zm))
+    turns, residual, moves = RefineTurns(fields, start)
+    assert moves > 100
+    np.testing.assert_allclose(residual, fields.Bz_test(turns * 2.0 * pi) + fields.b0, rtol=1e-9,
+                               atol=1e-12 * np.max(np.abs(fields.b0)))
+
+def test_refine_clips_start():
+    fields = engine()
+    start = np.full(len(fields.zm), 17)
+    start[::2] = -17
+    turns, residual, moves = RefineTurns(fields, start, Nmax=5)
+    assert np.abs(turns).max() <= 5
+    np.testing.assert_allclose(residual, fields.Bz_test(turns * 2.0 * pi) + fields.b0)
+
+@pytest.mark.parametrize("refine", [True, False])
+def test_turns_profile_nmax(refine):
+    result = TurnsProfile(*EXAMPLE, Method=1, Nmax=5, refine=refine)
+    assert np.abs(result.angles).max() > 5 * 2.0 * pi  # the unbounded continuous solution exceeds Nmax
+    assert np.abs(result.turns).max() <= 5
@@ -0,0 +1,24 @@
+#
+# SymPy model of the induction in Eq. (32) produced by a single spiral coil.
+# This is the only source of the derivatives in Eqs. (33), (34): KernelBuilder.py generates the numerical kernels
+# from it, so any change of the model below is picked up automatically the next time the kernels are loaded.
+#
+
+import sympy as sp
+
+# Define the variables in your expression
+x, d, gamma, theta1, theta2, gtd1, gtd2, a, zm, zq, pi, mu0, I = sp.symbols('x, d, gamma, theta1, theta2, gtd1, gtd2,'
+                                                                            ' a, zm, zq, pi, mu0, I')
+
+# Order of the arguments of the generated kernels
+ARGUMENTS = (x, zm, zq, d, gamma, theta1, gtd1, a, pi, mu0, I)
+
+def bz(x):
+    theta2 = theta1 + x * sp.tanh(a * x)
+    gtd2 = 2.0 * gamma * theta2 + d
+    value1 = gtd1 + (gtd1 ** 2 + 4.0 * (zq - zm) ** 2) ** 0.5
+    value2 = gtd2 + (gtd2 ** 2 + 4.0 * (zq - zm) ** 2) ** 0.5
+    value = (sp.log(value2 / value1) + gtd1 / ((gtd1 ** 2 + 4.0 * (zq - zm) ** 2) ** 0.5)
+             - gtd2 / ((gtd2 ** 2 + 4.0 * (zq - zm) ** 2) ** 0.5))
+    bz_value = sp.tanh(a * x) * value
+    return mu0 * I * bz_value / (4.0 * pi * gamma)
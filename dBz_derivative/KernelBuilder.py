@@ -0,0 +1,91 @@
+#
+# Build step for the numerical kernels of Eqs. (32)-(34).
+# The SymPy model bz(x) in BzModel.py is differentiated once and twice, the common subexpressions are eliminated,
+# and vectorised NumPy functions are written to kernel_cache/. The generated module is keyed by a hash of the model
+# source, so SymPy is only needed (and only runs) when BzModel.py changes. Run this file to rebuild the kernels.
+#
+# Generated functions (all arguments broadcast, e.g. x and zm as M x 1 columns and zq as a 1 x Q row):
+#   bz(x, zm, zq, d, gamma, theta1, gtd1, a, pi, mu0, I)      induction in Eq. (32) of a single spiral
+#   dbz(...), d2bz(...)                                         its first and second derivatives with respect to x
+#   bz_dbz(...)                                                 value and first derivative sharing the subexpressions
+#
+
+import os
+import hashlib
+import importlib.util
+
+VERSION = 1  # increase when the generated code changes for the same model
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+MODEL_FILE = os.path.join(FOLDER, "BzModel.py")
+CACHE_FOLDER = os.path.join(FOLDER, "kernel_cache")
+
+_modules = {}  # generated file -> its loaded module
+
+# Hash of the model source (line endings do not matter)
+def model_hash():
+    with open(MODEL_FILE, "r") as file:
+        source = file.read()
+    return hashlib.sha256(f"{VERSION}\n{source}".encode()).hexdigest()[:16]
+
+def cache_file():
+    return os.path.join(CACHE_FOLDER, f"bz_kernels_{model_hash()}.py")
+
+# Python source of one function returning the given expressions with the common subexpressions eliminated
+def emit_function(name, expressions, arguments):
+    import sympy as sp
+    from sympy.printing.numpy import NumPyPrinter
+
+    printer = NumPyPrinter()
+    replacements, reduced = sp.cse(expressions, symbols=sp.numbered_symbols('t'))
+    lines = [f"def {name}({', '.join(str(arg) for arg in arguments)}):"]
+    for symbol, value in replacements:
+        lines.append(f"    {symbol} = {printer.doprint(value)}")
+    lines.append(f"    return {', '.join(printer.doprint(value) for value in reduced)}")
+    return "\n".join(lines)
+
+def build():
+    import sympy as sp
+    import BzModel
+
+    value = BzModel.bz(BzModel.x)
+    first = sp.diff(value, BzModel.x)
+    second = sp.diff(first, BzModel.x)
+    functions = [
+        emit_function("bz", [value], BzModel.ARGUMENTS),
+        emit_function("dbz", [first], BzModel.ARGUMENTS),
+        emit_function("d2bz", [second], BzModel.ARGUMENTS),
+        emit_function("bz_dbz", [value, first], BzModel.ARGUMENTS),
+    ]
+    header = ("#\n"
+              "# Generated by KernelBuilder.py from BzModel.py, do not edit.\n"
+              f"# Model hash: {model_hash()}\n"
+              "#\n\n"
+              "import numpy\n")
+
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+    for name in os.listdir(CACHE_FOLDER):  # kernels of the previous models
+        if name.startswith("bz_kernels_") and name.endswith(".py"):
+            os.remove(os.path.join(CACHE_FOLDER, name))
+    with open(cache_file(), "w") as file:
+        file.write(header + "\n\n" + "\n\n\n".join(functions) + "\n")
+
+# Generated kernels for the current model, building them first if they are not in the cache; the module is loaded
+# once per process and the same module is returned by the later calls
+def load_kernels():
+    path = cache_file()
+    if path in _modules:
+        return _modules[path]
+    if not os.path.exists(path):
+        import sys
+        if FOLDER not in sys.path:
+            sys.path.append(FOLDER)
+        build()
+    spec = importlib.util.spec_from_file_location("bz_kernels", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    _modules[path] = module
+    return module
+
+if __name__ == "__main__":
+    build()
+    print(f"Kernels written to {cache_file()}")
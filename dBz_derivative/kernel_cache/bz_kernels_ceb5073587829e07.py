@@ -0,0 +1,88 @@
+#
+# Generated by KernelBuilder.py from BzModel.py, do not edit.
+# Model hash: ceb5073587829e07
+#
+
+import numpy
+
+
+def bz(x, zm, zq, d, gamma, theta1, gtd1, a, pi, mu0, I):
+    t0 = numpy.tanh(a*x)
+    t1 = 4.0*(-zm + zq)**2
+    t2 = (gtd1**2 + t1)**0.5
+    t3 = d + 2.0*gamma*(t0*x + theta1)
+    t4 = (t1 + t3**2)**0.5
+    return 0.25*I*mu0*t0*(gtd1/t2 - t3/t4 + numpy.log((t3 + t4)/(gtd1 + t2)))/(gamma*pi)
+
+
+def dbz(x, zm, zq, d, gamma, theta1, gtd1, a, pi, mu0, I):
+    t0 = a*x
+    t1 = numpy.tanh(t0)
+    t2 = 1 - t1**2
+    t3 = 4.0*(-zm + zq)**2
+    t4 = (gtd1**2 + t3)**0.5
+    t5 = 2.0*gamma
+    t6 = d + t5*(t1*x + theta1)
+    t7 = t6**2
+    t8 = t3 + t7
+    t9 = t8**0.5
+    t10 = t9**(-1.0)
+    t11 = t10*t6
+    t12 = t6 + t9
+    t13 = 0.25*I*mu0/(gamma*pi)
+    t14 = t5*(t0*t2 + t1)
+    return a*t13*t2*(gtd1/t4 - t11 + numpy.log(t12/(gtd1 + t4))) + t1*t13*(-t10*t14 + t14*t7*t8**(-1.5) + (t11*t14 + t14)/t12)
+
+
+def d2bz(x, zm, zq, d, gamma, theta1, gtd1, a, pi, mu0, I):
+    t0 = a**2
+    t1 = 4.0*(-zm + zq)**2
+    t2 = (gtd1**2 + t1)**0.5
+    t3 = a*x
+    t4 = numpy.tanh(t3)
+    t5 = t4*x
+    t6 = 2.0*gamma
+    t7 = d + t6*(t5 + theta1)
+    t8 = t7**2
+    t9 = t1 + t8
+    t10 = t9**0.5
+    t11 = t10**(-1.0)
+    t12 = t11*t7
+    t13 = t10 + t7
+    t14 = I*mu0/(gamma*pi)
+    t15 = t14*t4
+    t16 = 1 - t4**2
+    t17 = 0.5*t16
+    t18 = t16*t3 + t4
+    t19 = t18*t6
+    t20 = t9**(-1.5)
+    t21 = t20*t8
+    t22 = t13**(-1.0)
+    t23 = t12*t19 + t19
+    t24 = t6*(2*a*t16 - 2*t0*t16*t5)
+    t25 = gamma**2*t18**2
+    t26 = 12.0*t25
+    t27 = 4.0*t25
+    return a*t14*t17*(-t11*t19 + t19*t21 + t22*t23) - t0*t15*t17*(gtd1/t2 - t12 + numpy.log(t13/(gtd1 + t2))) + 0.25*t15*(-t11*t24 + t20*t26*t7 + t21*t24 + t22*(t11*t27 + t12*t24 - t21*t27 + t24) - t26*t7**3*t9**(-2.5) - t23**2/t13**2)
+
+
+def bz_dbz(x, zm, zq, d, gamma, theta1, gtd1, a, pi, mu0, I):
+    t0 = 4.0*(-zm + zq)**2
+    t1 = (gtd1**2 + t0)**0.5
+    t2 = a*x
+    t3 = numpy.tanh(t2)
+    t4 = 2.0*gamma
+    t5 = d + t4*(t3*x + theta1)
+    t6 = t5**2
+    t7 = t0 + t6
+    t8 = t7**0.5
+    t9 = t8**(-1.0)
+    t10 = t5*t9
+    t11 = t5 + t8
+    t12 = gtd1/t1 - t10 + numpy.log(t11/(gtd1 + t1))
+    t13 = gamma**(-1.0)
+    t14 = pi**(-1.0)
+    t15 = 0.25*I*mu0*t13*t14*t3
+    t16 = 1 - t3**2
+    t17 = t4*(t16*t2 + t3)
+    return t12*t15, 0.25*I*a*mu0*t12*t13*t14*t16 + t15*(t17*t6*t7**(-1.5) - t17*t9 + (t10*t17 + t17)/t11)
@@ -1,23 +1,11 @@
 #
 # This code is used to symbolically calculate the derivatives in Eqs. (33), (34)
+# The numerical kernels used by the optimisation are generated from the same model by KernelBuilder.py
 #
 
 import sympy as sp
 import textwrap
-
-# Define the variables in your expression
-x, d, gamma, theta1, theta2, gtd1, gtd2, a, zm, zq, pi, mu0, I = sp.symbols('x, d, gamma, theta1, theta2, gtd1, gtd2,'
-                                                                            ' a, zm, zq, pi, mu0, I')
-
-def bz(x):
-    theta2 = theta1 + x * sp.tanh(a * x)
-    gtd2 = 2.0 * gamma * theta2 + d
-    value1 = gtd1 + (gtd1 ** 2 + 4.0 * (zq - zm) ** 2) ** 0.5
-    value2 = gtd2 + (gtd2 ** 2 + 4.0 * (zq - zm) ** 2) ** 0.5
-    value = (sp.log(value2 / value1) + gtd1 / ((gtd1 ** 2 + 4.0 * (zq - zm) ** 2) ** 0.5)
-             - gtd2 / ((gtd2 ** 2 + 4.0 * (zq - zm) ** 2) ** 0.5))
-    bz_value = sp.tanh(a * x) * value
-    return mu0 * I * bz_value / (4.0 * pi * gamma)
+from BzModel import x, bz
 
 expression = bz(x)
 
@@ -0,0 +1,71 @@
+#
+# Tests of the generated kernels: the values of bz, dbz, d2bz and bz_dbz against the SymPy model (lambdified) and
+# the derivatives against finite differences; the kernel cache is built once and a cache hit returns the same module.
+# Run with: python -m pytest test_KernelBuilder.py
+#
+
+import os
+import numpy as np
+import pytest
+import KernelBuilder
+
+pi = 3.1415926535897932384626433832795
+mu0 = 4.0 * pi * 1.0e-7
+
+
+# Arguments in the order of BzModel.ARGUMENTS for the example of the turns optimisation: M x 1 angles and spirals,
+# 1 x Q sampling points
+def arguments():
+    d = 0.0005 + 2.0 * 1.0e-5
+    gamma = d / (2.0 * pi)
+    R = d * int(0.016 / d) + d / 2.0
+    theta1 = (2.0 * pi * R) / d - pi
+    x = np.linspace(-20.0, 20.0, 9)[:, np.newaxis] * 2.0 * pi + 0.3  # also near the tanh switch at x = 0
+    zm = np.linspace(-0.05, 0.05, 9)[:, np.newaxis]
+    zq = np.linspace(-0.03, 0.03, 7)[np.newaxis, :]
+    return x, zm, zq, d, gamma, theta1, 2.0 * R, 1.0, pi, mu0, 0.2
+
+@pytest.fixture(scope="module")
+def model():
+    sp = pytest.importorskip("sympy")
+    import BzModel
+    value = BzModel.bz(BzModel.x)
+    first = sp.diff(value, BzModel.x)
+    second = sp.diff(first, BzModel.x)
+    return [sp.lambdify(BzModel.ARGUMENTS, expression, "numpy") for expression in (value, first, second)]
+
+
+def test_kernels_match_model(model):
+    kernels = KernelBuilder.load_kernels()
+    args = arguments()
+    value, first, second = (function(*args) for function in model)
+    np.testing.assert_allclose(kernels.bz(*args), value, rtol=1e-10, atol=1e-20)
+    np.testing.assert_allclose(kernels.dbz(*args), first, rtol=1e-10, atol=1e-20)
+    np.testing.assert_allclose(kernels.d2bz(*args), second, rtol=1e-10, atol=1e-20)
+    both = kernels.bz_dbz(*args)
+    np.testing.assert_allclose(both[0], value, rtol=1e-10, atol=1e-20)
+    np.testing.assert_allclose(both[1], first, rtol=1e-10, atol=1e-20)
+
+def test_derivatives_match_finite_differences():
+    kernels = KernelBuilder.load_kernels()
+    x, *rest = arguments()
+    h = 1.0e-4
+    central = lambda f: (f(x + h, *rest) - f(x - h, *rest)) / (2.0 * h)
+    np.testing.assert_allclose(kernels.dbz(x, *rest), central(kernels.bz), rtol=1e-6, atol=1e-14)
+    np.testing.assert_allclose(kernels.d2bz(x, *rest), central(kernels.dbz), rtol=1e-6, atol=1e-14)
+
+def test_cache_hit_returns_same_module(monkeypatch):
+    module = KernelBuilder.load_kernels()
+    monkeypatch.setattr(KernelBuilder, "build", lambda: pytest.fail("the cached kernels were built again"))
+    assert KernelBuilder.load_kernels() is module
+    assert os.path.basename(module.__file__) == f"bz_kernels_{KernelBuilder.model_hash()}.py"
+
+def test_build_once(tmp_path, monkeypatch):
+    pytest.importorskip("sympy")
+    monkeypatch.setattr(KernelBuilder, "CACHE_FOLDER", str(tmp_path))
+    builds = []
+    build = KernelBuilder.build
+    monkeypatch.setattr(KernelBuilder, "build", lambda: builds.append(1) or build())
+    module = KernelBuilder.load_kernels()
+    assert os.path.exists(KernelBuilder.cache_file()) and len(builds) == 1
+    assert KernelBuilder.load_kernels() is module and len(builds) == 1